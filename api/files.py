@@ -1,11 +1,35 @@
+import io
 import os
 import uuid
+import shutil
+import base64
+import binascii
 import logging
-import mimetypes
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from pathlib import Path
-from flask import request, send_file, current_app, Response
-from flask_restx import Namespace, Resource, fields, reqparse
+from flask import Request, request, send_file, current_app, Response
+from flask_restx import Namespace, Resource, fields, reqparse, inputs
+from flask_limiter.util import get_remote_address
+from werkzeug.exceptions import HTTPException, TooManyRequests
+from werkzeug.http import http_date, quote_etag
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import LimitedStream
+from services.blobs import hash_file
+from services.checksums import (
+    StreamHasher, ChecksumMismatch, InvalidDigest, expected_digests, copy_hashed, digest_header
+)
+from services.catalog import SORT_COLUMNS, InvalidCursor, AdmissionRefused
+from services.compression import is_compressible, negotiate, compress_chunks
+from services.uploads import (
+    OffsetUpload, AppendUpload, ChunkSizeMismatch, UploadTooLarge, OffsetConflict, UploadLocked,
+    concatenate_chunks, chunk_file_flags, format_ranges, pack_bitmap, read_head, copy_stream,
+    staged_upload_intact
+)
+from services.transfer import (
+    RangeNotSatisfiable, MultipartByteranges, resolve_ranges, range_condition_holds,
+    make_etag, is_not_modified, content_range, file_body, iter_file_range, iter_bytes
+)
 
 # Initialize the namespace
 api = Namespace('files', description='File operations')
@@ -13,18 +37,8 @@ api = Namespace('files', description='File operations')
 # Initialize logger
 logger = logging.getLogger(__name__)
 
-# Initialize mimetypes
-mimetypes.init()
-# Add additional mappings
-mimetypes.add_type('application/json', '.ipynb')
-
-# Try importing python-magic, but fall back to mimetypes if not available
-try:
-    import magic
-    has_magic = True
-except ImportError:
-    logger.warning("python-magic not available, falling back to mimetypes")
-    has_magic = False
+# Version of the tus resumable upload protocol spoken by /uploads
+TUS_VERSION = '1.0.0'
 
 # Models for Swagger documentation
 file_info = api.model('FileInfo', {
@@ -32,12 +46,84 @@ file_info = api.model('FileInfo', {
     'filename': fields.String(description='Original filename'),
     'size': fields.Integer(description='File size in bytes'),
     'content_type': fields.String(description='File MIME type'),
-    'upload_date': fields.DateTime(description='Upload timestamp')
+    'upload_date': fields.DateTime(description='Upload timestamp'),
+    'checksum': fields.String(description='SHA-256 of the file contents')
+})
+
+upload_status = api.model('UploadStatus', {
+    'upload_id': fields.String(description='Chunked upload identifier (flowIdentifier)'),
+    'filename': fields.String(description='Original filename'),
+    'status': fields.String(description='pending, assembling, complete, failed, rejected or cancelled'),
+    'file_id': fields.String(description='Identifier of the stored file once complete'),
+    'error': fields.String(description='Reason the assembly failed')
+})
+
+received_chunks = api.model('ReceivedChunks', {
+    'upload_id': fields.String(description='Chunked upload identifier (flowIdentifier)'),
+    'status': fields.String(description='pending, assembling, complete, failed, rejected or cancelled'),
+    'total_chunks': fields.Integer(description='Number of chunks in the upload'),
+    'chunk_size': fields.Integer(description='Size of every chunk but the last'),
+    'last_chunk_size': fields.Integer(description='Size of the last chunk'),
+    'total_size': fields.Integer(description='Total file size'),
+    'received_count': fields.Integer(description='Number of chunks received'),
+    'received': fields.String(description="Received chunk numbers as ranges, e.g. '1-5,7'"),
+    'bitmap': fields.String(description='Base64 bitmap of received chunks; the high bit of byte 0 is chunk 1'),
+    'chunk_reuse': fields.Boolean(description='Whether offered chunk hashes are used to copy stored chunks')
+})
+
+chunk_hashes = api.model('ChunkHashes', {
+    'filename': fields.String(required=True, description='Original filename'),
+    'total_chunks': fields.Integer(required=True, min=1, description='Number of chunks in the upload'),
+    'chunk_size': fields.Integer(required=True, min=1, description='Size of every chunk but the last'),
+    'total_size': fields.Integer(required=True, min=0, description='Total file size'),
+    'hashes': fields.Raw(required=True, description='Map of chunk number to SHA-256 hex digest')
+})
+
+hash_upload = api.model('HashUpload', {
+    'filename': fields.String(required=True, description='Original filename'),
+    'checksum': fields.String(required=True, pattern='^[0-9a-fA-F]{64}$', description='SHA-256 of the whole file')
+})
+
+cache_stats = api.model('CacheStats', {
+    'pid': fields.Integer(description='Worker process the statistics belong to'),
+    'entries': fields.Integer(description='Number of cached files'),
+    'bytes': fields.Integer(description='Bytes charged against the budget'),
+    'max_bytes': fields.Integer(description='Cache budget in bytes'),
+    'hits': fields.Integer(description='Lookups served from the cache'),
+    'misses': fields.Integer(description='Lookups that went to disk'),
+    'evictions': fields.Integer(description='Entries dropped to stay within the budget'),
+    'hit_ratio': fields.Float(description='hits / (hits + misses)')
+})
+
+reservation = api.model('Reservation', {
+    'identifier': fields.String(description='Upload the space is reserved for'),
+    'size': fields.Integer(description='Reserved bytes'),
+    'allocated': fields.Integer(description='Reserved bytes already allocated on disk'),
+    'expires_at': fields.DateTime(description='When the reservation lapses unless the upload continues')
+})
+
+storage_usage = api.model('StorageUsage', {
+    'disk_total': fields.Integer(description='Size of the upload filesystem in bytes'),
+    'disk_free': fields.Integer(description='Free bytes on the upload filesystem'),
+    'disk_available': fields.Integer(description='Free bytes new uploads may reserve'),
+    'reservations': fields.Integer(description='Number of uploads holding a reservation'),
+    'reserved_bytes': fields.Integer(description='Bytes reserved by uploads in progress'),
+    'outstanding_bytes': fields.Integer(description='Reserved bytes not allocated on disk yet'),
+    'client': fields.String(description='Address the requesting client is accounted as'),
+    'client_quota': fields.Integer(description='Quota of the client in bytes, null for none'),
+    'client_stored_bytes': fields.Integer(description='Bytes stored by the client'),
+    'client_reserved_bytes': fields.Integer(description='Bytes reserved by uploads of the client'),
+    'client_reservations': fields.List(fields.Nested(reservation), description='Reservations of the client')
 })
 
 # Upload parsers
 upload_parser = reqparse.RequestParser()
 upload_parser.add_argument('file', location='files', type='file', required=True, help='File to upload')
+upload_parser.add_argument('checksum', location='form', help='Expected SHA-256 of the file (hex)')
+
+raw_upload_parser = reqparse.RequestParser()
+raw_upload_parser.add_argument('filename', location='args', required=True, help='Original file name')
+raw_upload_parser.add_argument('checksum', location='args', help='Expected SHA-256 of the file (hex)')
 
 chunk_parser = reqparse.RequestParser()
 chunk_parser.add_argument('flowChunkNumber', type=int, required=True, help='Current chunk number')
@@ -46,27 +132,90 @@ chunk_parser.add_argument('flowChunkSize', type=int, required=True, help='Genera
 chunk_parser.add_argument('flowTotalSize', type=int, required=True, help='Total file size')
 chunk_parser.add_argument('flowIdentifier', required=True, help='Unique identifier for the file')
 chunk_parser.add_argument('flowFilename', required=True, help='Original file name')
+chunk_parser.add_argument('flowChunkChecksum', location='form', help='Expected SHA-256 of the chunk (hex)')
 chunk_parser.add_argument('file', location='files', type='file', required=True, help='Chunk data')
 
+chunk_check_parser = chunk_parser.copy()
+chunk_check_parser.remove_argument('file')
+chunk_check_parser.remove_argument('flowChunkChecksum')
+
+list_parser = reqparse.RequestParser()
+list_parser.add_argument('limit', type=inputs.positive, location='args', help='Maximum number of files to return')
+list_parser.add_argument('cursor', location='args', help='Cursor returned in X-Next-Cursor by the previous page')
+list_parser.add_argument('sort', choices=SORT_COLUMNS, default='upload_date', location='args', help='Sort column')
+list_parser.add_argument('order', choices=('asc', 'desc'), default='desc', location='args', help='Sort order')
+list_parser.add_argument('content_type', location='args', help='Only return files of this MIME type')
+list_parser.add_argument('filename', location='args', help='Only return files whose name starts with this prefix')
+list_parser.add_argument('min_size', type=inputs.natural, location='args', help='Minimum file size in bytes')
+list_parser.add_argument('max_size', type=inputs.natural, location='args', help='Maximum file size in bytes')
+
 # Helper functions
 def allowed_file(filename):
     """Check if file extension is allowed."""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
 
+def get_detector():
+    """Get the content-type detector shared by this worker."""
+    return current_app.extensions['content_type']
+
 def get_mime_type(file_path):
-    """Get MIME type using magic if available, otherwise fall back to mimetypes."""
-    if has_magic:
-        mime = magic.Magic(mime=True)
-        return mime.from_file(str(file_path))
-    else:
-        # Fallback to mimetypes
-        mime_type, _ = mimetypes.guess_type(file_path)
-        return mime_type or 'application/octet-stream'
+    """Get MIME type of a stored file, cached by inode, mtime and size."""
+    return get_detector().from_file(file_path)
 
-def validate_file_type(file_path):
-    """Validate file type using either python-magic or mimetypes."""
-    file_type = get_mime_type(file_path)
+def sniff_upload(file, filename):
+    """Detect the MIME type of an uploaded file from its first bytes, then rewind it."""
+    head = file.stream.read(current_app.config['MIME_SNIFF_SIZE'])
+    file.stream.seek(0)
+    return get_detector().from_buffer(head, filename)
+
+class SniffedSpool:
+    """Spool for the file part of a multipart upload that is type-checked as it fills.
+    
+    The type is detected as soon as MIME_SNIFF_SIZE bytes of the part have
+    been parsed (or when the parser rewinds a shorter part), so a
+    disallowed file is refused with 415 before the rest of the body is read.
+    """
+    
+    def __init__(self, stream, filename, sniff_size):
+        self._stream = stream
+        self._filename = filename
+        self._sniff_size = sniff_size
+        self._head = bytearray()
+        self.content_type = None
+    
+    def write(self, data):
+        if self._head is not None:
+            self._head += data
+            if len(self._head) >= self._sniff_size:
+                self._judge()
+        return self._stream.write(data)
+    
+    def seek(self, *args):
+        if self._head is not None:
+            self._judge()
+        return self._stream.seek(*args)
+    
+    def _judge(self):
+        head, self._head = bytes(self._head[:self._sniff_size]), None
+        self.content_type = get_detector().from_buffer(head, self._filename)
+        if not is_allowed_type(self.content_type):
+            api.abort(415, "Unsupported file type")
+    
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+class UploadRequest(Request):
+    """Request class whose /upload file parts are type-checked while the form is parsed."""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        stream = super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        if filename and self.endpoint == FileUpload.endpoint:
+            return SniffedSpool(stream, secure_filename(filename), current_app.config['MIME_SNIFF_SIZE'])
+        return stream
+
+def is_allowed_type(file_type):
+    """Check a detected MIME type against the allowed types."""
     logger.info(f"File MIME type detected: {file_type}")
     
     # Define allowed MIME types based on your security requirements
@@ -83,23 +232,390 @@ def validate_file_type(file_path):
         logger.warning(f"Unsupported file type: {file_type}")
         return False
 
-def get_file_list():
-    """Get list of uploaded files."""
-    files = []
-    upload_folder = current_app.config['UPLOAD_FOLDER']
+def validate_file_type(file_path):
+    """Validate the type of a stored file using either python-magic or mimetypes."""
+    return is_allowed_type(get_mime_type(file_path))
+
+def get_expected_digests(checksum=None):
+    """Digests the client expects for the uploaded bytes (Content-MD5, Digest or a checksum parameter)."""
+    try:
+        return expected_digests(request.headers, checksum)
+    except InvalidDigest as e:
+        api.abort(400, str(e))
+
+def parse_upload_metadata(value):
+    """Decode a tus Upload-Metadata header: comma separated 'key base64value' pairs."""
+    metadata = {}
+    for pair in (value or '').split(','):
+        key, _, encoded = pair.strip().partition(' ')
+        if not key:
+            continue
+        try:
+            metadata[key] = base64.b64decode(encoded, validate=True).decode()
+        except (binascii.Error, UnicodeDecodeError):
+            api.abort(400, f"Invalid Upload-Metadata value for {key}")
+    return metadata
+
+def get_catalog():
+    """Get the metadata catalog of the current application."""
+    return current_app.extensions['catalog']
+
+def get_blobs():
+    """Get the content-addressed object store of the current application."""
+    return current_app.extensions['blobs']
+
+def get_file_cache():
+    """Get the in-memory cache of hot files of this worker."""
+    return current_app.extensions['file_cache']
+
+def get_variants():
+    """Get the store of precompressed copies of stored objects."""
+    return current_app.extensions['variants']
+
+def delete_blob(checksum):
+    """Delete an object whose last reference was dropped, with its cached copy and compressed variants."""
+    get_blobs().delete(checksum)
+    get_file_cache().invalidate(checksum)
+    get_variants().delete(checksum)
+
+def should_compress(content_type, size):
+    """Check whether downloads of a file are worth compressing."""
+    config = current_app.config
+    return (config['COMPRESSION_ENABLED'] and size >= config['COMPRESSION_MIN_SIZE'] and
+            is_compressible(content_type, config['COMPRESSIBLE_TYPES']))
+
+def build_variants(checksum):
+    """Compress a stored object into its variants in the background."""
+    get_variants().schedule(current_app.extensions['compressor'], get_blobs().path_for(checksum), checksum)
+
+def negotiate_encoding(checksum):
+    """Choose the content coding of a compressible download from Accept-Encoding.
+    
+    Returns (encoding, variant): encoding is None for identity, variant
+    the stored compressed copy to serve, or None to compress while
+    streaming. A variant that is not built yet is built in the background;
+    until then a Range request gets identity bytes, since ranges cannot be
+    served from a compressed stream.
+    """
+    encoding = negotiate(request.accept_encodings)
+    if encoding is None:
+        return None, None
+    variant = get_variants().lookup(checksum, encoding) if checksum else None
+    if variant:
+        return encoding, variant
+    if variant is None:
+        if checksum:
+            build_variants(checksum)
+        if request.range is None:
+            return encoding, None
+    # Does not compress, or a range of a variant not built yet
+    return None, None
+
+def staging_path(file_id):
+    """Where a new upload is written before it is moved into the object store."""
+    return current_app.config['UPLOAD_FOLDER'] / "incoming" / file_id
+
+def legacy_path(file_id):
+    """Where a file stored before the object store lives: flat in UPLOAD_FOLDER."""
+    return current_app.config['UPLOAD_FOLDER'] / file_id
+
+def resolve_file_path(file_id, record):
+    """Locate the bytes of a file: its blob, or a flat file from before the object store.
+    
+    Every endpoint finds files through here. A file being migrated is
+    linked into the store before its flat copy goes away, so one of the
+    two locations always holds it.
+    """
+    if record and record['checksum']:
+        blob_path = get_blobs().path_for(record['checksum'])
+        if os.path.isfile(blob_path):
+            return blob_path
+    file_path = legacy_path(file_id)
+    if os.path.isfile(file_path):
+        return file_path
+    if record and not record['checksum']:
+        # Migrated since the record was read
+        record = get_catalog().get(file_id)
+        if record and record['checksum']:
+            return resolve_file_path(file_id, record)
+    return None
+
+def refuse_closed_upload(identifier):
+    """Refuse data for an upload that was rejected on its first chunk or cancelled; returns its record."""
+    record = get_catalog().get_upload(identifier)
+    if record and record['state'] == 'rejected':
+        api.abort(415, record['error'] or "Unsupported file type detected")
+    if record and record['state'] == 'cancelled':
+        api.abort(410, "Upload was cancelled")
+    return record
+
+def check_layout(total_chunks, chunk_size, total_size, record=None):
+    """Refuse a chunked upload layout that is inconsistent, too large, or not the one the upload started with.
+    
+    Both the layout of the bundled clients (a short last chunk) and that
+    of flow.js (the remainder folded into the last chunk) are accepted.
+    Runs before anything is reserved, registered or preallocated.
+    """
+    if chunk_size <= 0 or total_size < 0:
+        api.abort(400, "Invalid chunk size or total size")
+    if total_size > current_app.config['MAX_CONTENT_LENGTH']:
+        api.abort(400, "File too large")
+    if total_chunks not in (max(total_size // chunk_size, 1), max(-(-total_size // chunk_size), 1)):
+        api.abort(400, f"{total_chunks} chunks of {chunk_size} bytes do not make up {total_size} bytes")
+    if record and (record['total_chunks'], record['chunk_size'], record['total_size']) != (
+            total_chunks, chunk_size, total_size):
+        api.abort(400, "Upload layout does not match the one the upload started with")
+
+def refuse_completed_upload(record):
+    """Refuse chunks for an identifier whose upload is already stored.
+    
+    The identifier names a single upload: answering 200 here would let a
+    client whose identifier collides with a finished upload take that
+    file for its own.
+    """
+    if record and record['state'] == 'complete':
+        api.abort(409, "Upload already complete; start a new upload with a new identifier")
+
+class InsufficientStorage(HTTPException):
+    """The server cannot store the upload (507)."""
+    code = 507
+    description = "Insufficient storage"
+
+def client_address():
+    """The client uploads are accounted to: its address, as for the rate limits."""
+    return get_remote_address()
+
+def admit_upload(identifier, size, queue=True):
+    """Reserve disk space and quota for an upload, or refuse it.
+    
+    An upload that would fit once uploads in progress finish gets 429
+    with Retry-After, so clients queue by retrying; one that can never fit
+    gets 507. Every request of an upload calls this to keep its
+    reservation alive. Without queue, e.g. for a body already being read,
+    every refusal is a 507. Returns True if a new reservation was made.
+    """
+    config = current_app.config
+    disk = shutil.disk_usage(config['UPLOAD_FOLDER'])
+    try:
+        return get_catalog().reserve(identifier, client_address(), size, config['RESERVATION_TTL'],
+                                     disk.free - config['DISK_FREE_RESERVE'], config['CLIENT_QUOTA'])
+    except AdmissionRefused as e:
+        logger.warning(f"Upload {identifier} of {size} bytes refused: {str(e)}")
+        if e.transient and queue:
+            raise TooManyRequests(str(e), retry_after=config['ADMISSION_RETRY_AFTER'])
+        raise InsufficientStorage(str(e))
+
+class MeteredInput(io.RawIOBase):
+    """A request body of unknown length whose reservation grows as it is read.
+    
+    grow(size) is called before more than size bytes have been read. The
+    reservation is grown geometrically, starting at min_step, so a large
+    body costs a few catalog updates; near a limit it is grown to exactly
+    what has been read instead.
+    """
+    
+    def __init__(self, stream, grow, min_step):
+        self._stream = stream
+        self._grow = grow
+        self._min_step = min_step
+        self.received = 0
+        self.reserved = 0
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, b):
+        data = self._stream.read(len(b))
+        needed = self.received + len(data)
+        if needed > self.reserved:
+            target = max(needed, self.reserved * 2, self._min_step)
+            try:
+                self._grow(target)
+            except InsufficientStorage:
+                if target == needed:
+                    raise
+                target = needed
+                self._grow(target)
+            self.reserved = target
+        b[:len(data)] = data
+        self.received = needed
+        return len(data)
+
+@contextmanager
+def admitted(identifier, size):
+    """Hold a reservation for an upload received in a single request.
+    
+    A body of unknown length (compressed, or sent without Content-Length)
+    is reserved as it is read, and refused with 507 once it would exceed
+    the free disk space or the client's quota.
+    """
+    if size is None:
+        request.environ['wsgi.input'] = MeteredInput(
+            request.environ['wsgi.input'], lambda size: admit_upload(identifier, size, queue=False),
+            current_app.config['CHUNK_SIZE'])
+        reserved = True
+    else:
+        reserved = admit_upload(identifier, size)
+    try:
+        yield
+    finally:
+        if reserved:
+            get_catalog().release(identifier)
+
+def cancel_upload(identifier):
+    """Cancel an upload still receiving data: release its reservation and drop what was received."""
+    temp_dir = get_chunk_dir(identifier)
+    catalog = get_catalog()
+    if not catalog.cancel_upload(identifier):
+        record = catalog.get_upload(identifier)
+        if record is None:
+            api.abort(404, "Upload not found")
+        api.abort(409, f"Upload is {record['state']}")
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    logger.info(f"Upload {identifier} cancelled")
+
+def get_chunk_dir(identifier):
+    """Get the temporary directory of a chunked upload, rejecting unsafe identifiers."""
+    if not identifier or secure_filename(identifier) != identifier:
+        api.abort(400, "Invalid upload identifier")
+    return current_app.config['UPLOAD_FOLDER'] / "temp" / identifier
+
+def complete_upload(file_id, filename, output_path, chunk_size=None, digests=None, client=None):
+    """Validate an assembled upload and add it to the catalog."""
+    content_type = get_mime_type(output_path)
+    if not is_allowed_type(content_type):
+        os.remove(output_path)
+        api.abort(415, "Unsupported file type detected")
+    
+    logger.info(f"File assembled: {filename} (ID: {file_id})")
+    return register_file(file_id, filename, output_path, content_type, chunk_size, digests, client)
+
+def assemble_upload(identifier, filename, assemble):
+    """Finalize a chunked upload and record the outcome in the catalog."""
+    catalog = get_catalog()
+    file_id = str(uuid.uuid4())
+    output_path = staging_path(file_id)
+    try:
+        digests = assemble(output_path)
+        upload = catalog.get_upload(identifier)
+        record = complete_upload(file_id, filename, output_path, upload['chunk_size'], digests, upload['client'])
+    except Exception as e:
+        if isinstance(e, HTTPException):
+            # api.abort() keeps its message in e.data
+            error = getattr(e, 'data', {}).get('message', e.description)
+        else:
+            error = str(e)
+        logger.error(f"Assembly of upload {identifier} failed: {error}")
+        # Drop the partly assembled or unregistered file; a retry stages a new one
+        try:
+            os.remove(output_path)
+        except FileNotFoundError:
+            pass
+        # Retrying is only safe while the received data is still staged
+        catalog.finish_upload(identifier, 'failed', error=error,
+                              keep_chunks=staged_upload_intact(get_chunk_dir(identifier)))
+        raise
+    catalog.finish_upload(identifier, 'complete', file_id=file_id)
+    return record
+
+def run_assembly(app, identifier, filename, assemble):
+    """Executor entry point: run assemble_upload() inside an application context."""
+    with app.app_context():
+        try:
+            assemble_upload(identifier, filename, assemble)
+        except Exception:
+            pass  # Already recorded as failed
+
+def finish_chunked_upload(identifier, filename, assemble):
+    """Start the assembly of a fully received upload, at most once per upload.
+    
+    With ASYNC_ASSEMBLY the work goes to the background executor and the
+    client gets 202 plus the upload id to poll; otherwise it runs inline.
+    """
+    accepted = {'message': 'All chunks received, assembling file', 'upload_id': identifier, 'status': 'assembling'}
+    if not get_catalog().claim_upload(identifier, filename):
+        return accepted, 202
+    
+    app = current_app._get_current_object()
+    if app.config['ASYNC_ASSEMBLY']:
+        app.extensions['assembler'].submit(run_assembly, app, identifier, filename, assemble)
+        return accepted, 202
+    return assemble_upload(identifier, filename, assemble), 201
+
+def chunk_received(identifier, chunk_number, total_chunks, filename, assemble):
+    """Count a stored chunk; returns the assembly response if it completed the upload, else None.
     
-    for file_path in upload_folder.glob('*'):
-        if file_path.is_file():
-            stat = file_path.stat()
-            files.append({
-                'id': file_path.name,
-                'filename': file_path.name,
-                'size': stat.st_size,
-                'content_type': get_mime_type(str(file_path)),
-                'upload_date': stat.st_mtime
-            })
+    A chunk that was already on disk is counted too, as it may have been
+    stored by a request that failed before counting it. Counting is a
+    single catalog row update rather than a scan of the received chunks.
+    """
+    received = get_catalog().record_chunk(identifier, chunk_number)
+    if received is not None and received >= total_chunks:
+        return finish_chunked_upload(identifier, filename, assemble)
+    return None
+
+def write_at_offset(upload, identifier, chunk_number, filename, stream, hasher=None):
+    """Write a chunk in place; the final chunk turns the data file into the stored file."""
+    if not 1 <= chunk_number <= upload.total_chunks:
+        api.abort(400, f"Chunk number {chunk_number} out of range")
+    if upload.has_chunk(chunk_number):
+        response = {'message': 'Chunk already exists'}, 200
+    else:
+        try:
+            upload.write_chunk(chunk_number, stream, current_app.config['CHUNK_SIZE'], hasher)
+        except (ChunkSizeMismatch, ChecksumMismatch) as e:
+            api.abort(400, str(e))
+        except (FileNotFoundError, FileExistsError):
+            # A duplicate of a chunk that completed the upload, whose assembly removed
+            # the directory while it was being prepared or written
+            record = get_catalog().get_upload(identifier)
+            refuse_completed_upload(record)
+            if record['state'] == 'assembling':
+                return {'message': 'Chunk already exists'}, 200
+            raise
+        logger.info(f"Chunk {chunk_number}/{upload.total_chunks} written for {filename}")
+        response = {'message': f'Chunk {chunk_number} uploaded successfully'}, 201
+    
+    return chunk_received(identifier, chunk_number, upload.total_chunks, filename, upload.finalize) or response
+
+def register_file(file_id, filename, file_path, content_type=None, chunk_size=None, digests=None, client=None):
+    """Move a staged file into the object store, add it to the catalog and return its metadata.
+    
+    Content that is already stored is not written twice: the new file id
+    just takes another reference on the existing blob. With chunk_size the
+    chunks are indexed so later uploads can reuse them. digests is the
+    (SHA-256, chunk index entries) pair when it was computed while the
+    file was written; otherwise the file is hashed here. The file
+    counts against the quota of client.
+    """
+    size = os.path.getsize(str(file_path))
+    content_type = content_type or get_mime_type(str(file_path))
+    if digests:
+        checksum, chunks = digests
+    else:
+        checksum, chunks = hash_file(file_path, current_app.config['CHUNK_SIZE'], chunk_size)
     
-    return files
+    blobs = get_blobs()
+    duplicate = get_catalog().add_file(
+        file_id, filename, size, content_type, checksum,
+        lambda: blobs.put(file_path, checksum),
+        chunks=chunks, client=client
+    )
+    if duplicate:
+        os.remove(file_path)
+        logger.info(f"File {file_id} deduplicated against existing content {checksum}")
+    
+    # Store compressed copies once, instead of compressing on every download
+    if should_compress(content_type, size):
+        build_variants(checksum)
+    
+    return {
+        'id': file_id,
+        'filename': filename,
+        'size': size,
+        'content_type': content_type,
+        'checksum': checksum
+    }
 
 
 @api.route('/upload')
@@ -108,57 +624,177 @@ class FileUpload(Resource):
     
     @api.expect(upload_parser)
     @api.response(201, 'File uploaded successfully')
-    @api.response(400, 'Invalid file')
+    @api.response(400, 'Invalid file or checksum mismatch')
     @api.response(415, 'Unsupported file type')
+    @api.response(429, 'Space is reserved by uploads in progress; retry after Retry-After seconds')
+    @api.response(507, 'Not enough disk space or quota')
     def post(self):
-        """Upload a file (for files up to 5GB)."""
+        """
+        Upload a file (for files up to 5GB).
+        The file is hashed while it is written; an expected digest can be
+        sent as Content-MD5, Digest or the checksum field.
+        """
+        file_id = str(uuid.uuid4())
         try:
-            # Get the file directly from request.files instead of using the parser
-            if 'file' not in request.files:
-                api.abort(400, "No file part in the request")
+            # Reserve space for the body by its declared size before the form is parsed
+            with admitted(file_id, request.content_length):
+                # Get the file directly from request.files instead of using the parser
+                if 'file' not in request.files:
+                    api.abort(400, "No file part in the request")
                 
-            file = request.files['file']
-            
-            if file.filename == '':
-                api.abort(400, "No file selected")
-            
-            if not allowed_file(file.filename):
-                api.abort(400, "File type not allowed")
-            
-            filename = secure_filename(file.filename)
-            file_id = str(uuid.uuid4())
-            file_path = current_app.config['UPLOAD_FOLDER'] / file_id
-            
-            # Save the file
-            file.save(str(file_path))
-            
-            # Validate file type
-            if not validate_file_type(file_path):
-                os.remove(str(file_path))
-                api.abort(415, "Unsupported file type")
-            
-            return {
-                'id': file_id,
-                'filename': filename,
-                'size': os.path.getsize(str(file_path)),
-                'content_type': get_mime_type(str(file_path))
-            }, 201
+                file = request.files['file']
+                
+                if file.filename == '':
+                    api.abort(400, "No file selected")
+                
+                if not allowed_file(file.filename):
+                    api.abort(400, "File type not allowed")
+                
+                filename = secure_filename(file.filename)
+                file_path = staging_path(file_id)
+                
+                # The type was checked from the head of the file while the form was parsed
+                content_type = getattr(file.stream, 'content_type', None)
+                if content_type is None:
+                    content_type = sniff_upload(file, filename)
+                    if not is_allowed_type(content_type):
+                        api.abort(415, "Unsupported file type")
+                
+                # Save the file, hashing it on the way to disk
+                hasher = StreamHasher(get_expected_digests(request.form.get('checksum')), always=('sha-256',))
+                with open(file_path, 'wb') as output:
+                    copy_hashed(file.stream, output, hasher, current_app.config['CHUNK_SIZE'])
+                
+                try:
+                    hasher.verify()
+                except ChecksumMismatch as e:
+                    os.remove(str(file_path))
+                    api.abort(400, str(e))
+                
+                get_detector().remember_file(file_path, content_type)
+                return register_file(file_id, filename, file_path, content_type,
+                                     digests=(hasher.hexdigest(), []), client=client_address()), 201
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error during file upload: {str(e)}")
             api.abort(500, f"Error processing file: {str(e)}")
 
 
+@api.route('/upload/raw')
+class RawUpload(Resource):
+    """Endpoint for uploads sent as a raw application/octet-stream body."""
+    
+    @api.expect(raw_upload_parser)
+    @api.response(201, 'File uploaded successfully')
+    @api.response(400, 'Invalid file or checksum mismatch')
+    @api.response(413, 'File too large')
+    @api.response(415, 'Unsupported file type')
+    @api.response(429, 'Space is reserved by uploads in progress; retry after Retry-After seconds')
+    @api.response(507, 'Not enough disk space or quota')
+    def put(self):
+        """
+        Upload a file as the request body (for files up to 5GB).
+        The body goes straight from the socket into the staged file: no
+        multipart parsing and no temporary spool file. Its type is sniffed
+        from the first bytes and it is hashed while it is written.
+        """
+        return self._receive()
+    
+    @api.expect(raw_upload_parser)
+    @api.response(201, 'File uploaded successfully')
+    @api.response(400, 'Invalid file or checksum mismatch')
+    @api.response(413, 'File too large')
+    @api.response(415, 'Unsupported file type')
+    @api.response(429, 'Space is reserved by uploads in progress; retry after Retry-After seconds')
+    @api.response(507, 'Not enough disk space or quota')
+    def post(self):
+        """Upload a file as the request body; same as PUT."""
+        return self._receive()
+    
+    @staticmethod
+    def _receive():
+        if request.mimetype not in ('', 'application/octet-stream'):
+            api.abort(415, "Send the file as application/octet-stream")
+        
+        filename = secure_filename(request.args.get('filename', ''))
+        if not filename:
+            api.abort(400, "No filename given")
+        if not allowed_file(filename):
+            api.abort(400, "File type not allowed")
+        
+        # Reserve space for the body by its declared size before it is read
+        file_id = str(uuid.uuid4())
+        with admitted(file_id, request.content_length):
+            hasher = StreamHasher(get_expected_digests(request.args.get('checksum')), always=('sha-256',))
+            stream = request.stream
+            
+            # Reject disallowed content before anything is written
+            head = read_head(stream, current_app.config['MIME_SNIFF_SIZE'])
+            content_type = get_detector().from_buffer(head, filename)
+            if not is_allowed_type(content_type):
+                api.abort(415, "Unsupported file type")
+            
+            file_path = staging_path(file_id)
+            try:
+                with open(file_path, 'wb') as output:
+                    hasher.update(head)
+                    output.write(head)
+                    copy_stream(stream, output, hasher, current_app.config['CHUNK_SIZE'],
+                                limit=current_app.config['MAX_CONTENT_LENGTH'], copied=len(head))
+                hasher.verify()
+            except UploadTooLarge as e:
+                os.remove(file_path)
+                api.abort(413, str(e))
+            except ChecksumMismatch as e:
+                os.remove(file_path)
+                api.abort(400, str(e))
+            except Exception:
+                # Includes werkzeug's own 413 and client disconnects
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                raise
+            
+            get_detector().remember_file(file_path, content_type)
+            logger.info(f"File streamed: {filename} (ID: {file_id})")
+            return register_file(file_id, filename, file_path, content_type,
+                                 digests=(hasher.hexdigest(), []), client=client_address()), 201
+
+
 @api.route('/upload/chunked')
 class ChunkedUpload(Resource):
     """Endpoint for chunked file uploads."""
     
     @api.expect(chunk_parser)
     @api.response(201, 'Chunk uploaded successfully')
+    @api.response(202, 'All chunks received, file is being assembled')
     @api.response(200, 'Chunk already exists')
-    @api.response(400, 'Invalid chunk data')
+    @api.response(400, 'Invalid chunk data or checksum mismatch')
+    @api.response(409, 'Upload with this identifier is already complete')
+    @api.response(410, 'Upload was cancelled')
+    @api.response(415, 'Unsupported file type, detected from the first chunk')
+    @api.response(429, 'Space is reserved by uploads in progress; retry after Retry-After seconds')
+    @api.response(507, 'Not enough disk space or quota')
     def post(self):
-        """Upload a file chunk."""
+        """
+        Upload a file chunk.
+        A chunk whose bytes do not match its Content-MD5, Digest or
+        flowChunkChecksum is rejected with 400 and can be sent again.
+        The type is sniffed from the head of chunk 1; if it is not allowed,
+        that chunk and every later one of the upload are refused with 415.
+        The first chunk reserves flowTotalSize bytes of disk and quota, and no
+        chunk may be longer than its share of flowTotalSize.
+        """
         try:
+            # Refuse chunks of a rejected or cancelled upload. Clients that also send
+            # flowIdentifier in the query string are refused before the body is read.
+            identifier = request.args.get('flowIdentifier') or request.form['flowIdentifier']
+            record = refuse_closed_upload(identifier)
+            refuse_completed_upload(record)
+            if record and record['state'] == 'assembling':
+                # A late duplicate: every chunk is in, and the file has a single finalizer
+                return {'message': 'Chunk already exists'}, 200
+            
             # Get parameters from request directly instead of using the parser
             if 'file' not in request.files:
                 api.abort(400, "No file part in the request")
@@ -168,62 +804,89 @@ class ChunkedUpload(Resource):
             total_chunks = int(request.form['flowTotalChunks'])
             chunk_size = int(request.form['flowChunkSize'])
             total_size = int(request.form['flowTotalSize'])
-            identifier = request.form['flowIdentifier']
             filename = secure_filename(request.form['flowFilename'])
             file = request.files['file']
             
             if not allowed_file(filename):
                 api.abort(400, "File type not allowed")
+            if not 1 <= chunk_number <= total_chunks:
+                api.abort(400, f"Chunk number {chunk_number} out of range")
+            check_layout(total_chunks, chunk_size, total_size, record)
+            
+            temp_dir = get_chunk_dir(identifier)
+            hasher = StreamHasher(get_expected_digests(request.form.get('flowChunkChecksum')))
+            
+            # Judge the content by the head of the first chunk, before anything is stored
+            if chunk_number == 1 and not is_allowed_type(sniff_upload(file, filename)):
+                get_catalog().reject_upload(identifier, filename, "Unsupported file type detected")
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                logger.warning(f"Upload {identifier} rejected on its first chunk")
+                api.abort(415, "Unsupported file type detected")
+            
+            # Reserve space for the whole upload, or keep its reservation alive
+            admit_upload(identifier, total_size)
             
-            # Create a directory for temporary chunk storage
-            temp_dir = current_app.config['UPLOAD_FOLDER'] / "temp" / identifier
-            os.makedirs(temp_dir, exist_ok=True)
+            # Register the upload and its layout when its first chunk arrives
+            new_upload = record is None
+            if new_upload:
+                get_catalog().open_upload(identifier, filename, total_chunks, chunk_size, total_size,
+                                          client_address())
+            
+            if current_app.config['CHUNKED_UPLOAD_MODE'] == 'offset':
+                upload = OffsetUpload(temp_dir, total_chunks, chunk_size, total_size)
+                result = write_at_offset(upload, identifier, chunk_number, filename, file.stream, hasher)
+                if new_upload:
+                    # The data file is preallocated: the reserved space is taken on disk
+                    get_catalog().mark_allocated(identifier)
+                return result
             
             # Define chunk path
             chunk_path = temp_dir / f"chunk.{chunk_number}"
             
-            # Check if chunk already exists
-            if os.path.exists(chunk_path) and os.path.getsize(chunk_path) == chunk_size:
-                return {'message': 'Chunk already exists'}, 200
-            
-            # Save the chunk
-            file.save(chunk_path)
-            logger.info(f"Chunk {chunk_number}/{total_chunks} uploaded for {filename}")
+            # Chunks are renamed into place once verified, so an existing one is whole
+            if os.path.exists(chunk_path):
+                response = {'message': 'Chunk already exists'}, 200
+            else:
+                # Save the chunk, verifying its length and the client's digest;
+                # nothing past the chunk's share of total_size is written
+                expected = OffsetUpload(temp_dir, total_chunks, chunk_size, total_size).expected_length(chunk_number)
+                partial_path = temp_dir / f".chunk.{chunk_number}.{uuid.uuid4().hex}"
+                try:
+                    # Create a directory for temporary chunk storage
+                    os.makedirs(temp_dir, exist_ok=True)
+                    with open(partial_path, 'wb') as output:
+                        written = copy_hashed(file.stream, output, hasher, current_app.config['CHUNK_SIZE'],
+                                              limit=expected)
+                    if written != expected:
+                        os.remove(partial_path)
+                        api.abort(400, f"Chunk {chunk_number} is larger than {expected} bytes" if written > expected
+                                  else f"Chunk {chunk_number} has {written} bytes, expected {expected}")
+                    try:
+                        hasher.verify()
+                    except ChecksumMismatch as e:
+                        os.remove(partial_path)
+                        api.abort(400, str(e))
+                    os.replace(partial_path, chunk_path)
+                except (FileNotFoundError, FileExistsError):
+                    # A duplicate of a chunk that completed the upload, whose assembly removed
+                    # the directory while it was being created or written
+                    record = get_catalog().get_upload(identifier)
+                    refuse_completed_upload(record)
+                    if record['state'] == 'assembling':
+                        return {'message': 'Chunk already exists'}, 200
+                    raise
+                logger.info(f"Chunk {chunk_number}/{total_chunks} uploaded for {filename}")
+                response = {'message': f'Chunk {chunk_number} uploaded successfully'}, 201
             
-            # Check if all chunks have been uploaded
-            uploaded_chunks = list(temp_dir.glob("chunk.*"))
-            if len(uploaded_chunks) == total_chunks:
-                # All chunks received, combine them
-                file_id = str(uuid.uuid4())
-                output_path = current_app.config['UPLOAD_FOLDER'] / file_id
-                
-                with open(output_path, 'wb') as output_file:
-                    for i in range(1, total_chunks + 1):
-                        chunk_file = temp_dir / f"chunk.{i}"
-                        with open(chunk_file, 'rb') as input_file:
-                            output_file.write(input_file.read())
-                
-                # Validate file type
-                if not validate_file_type(output_path):
-                    os.remove(output_path)
-                    api.abort(415, "Unsupported file type detected")
-                
-                # Clean up chunks
-                for chunk_file in uploaded_chunks:
-                    os.remove(chunk_file)
-                os.rmdir(temp_dir)
-                
-                logger.info(f"File assembled: {filename} (ID: {file_id})")
-                
-                return {
-                    'id': file_id,
-                    'filename': filename,
-                    'size': os.path.getsize(output_path),
-                    'content_type': get_mime_type(str(output_path))
-                }, 201
-                
-            return {'message': f'Chunk {chunk_number} uploaded successfully'}, 201
+            # The chunk that completes the count starts the assembly, exactly once
+            buffer_size = current_app.config['CHUNK_SIZE']
+            return chunk_received(
+                identifier, chunk_number, total_chunks, filename,
+                lambda output_path: concatenate_chunks(temp_dir, total_chunks, chunk_size, output_path, buffer_size)
+            ) or response
             
+        except HTTPException:
+            raise
         except KeyError as e:
             logger.error(f"Missing required parameter: {str(e)}")
             api.abort(400, f"Missing required parameter: {str(e)}")
@@ -231,7 +894,7 @@ class ChunkedUpload(Resource):
             logger.error(f"Chunk upload error: {str(e)}")
             api.abort(500, f"Chunk upload failed: {str(e)}")
     
-    @api.expect(chunk_parser)
+    @api.expect(chunk_check_parser)
     @api.response(200, 'Chunk exists')
     @api.response(204, 'Chunk does not exist')
     def get(self):
@@ -239,30 +902,425 @@ class ChunkedUpload(Resource):
         Check if a chunk already exists.
         Used for resumable uploads to avoid re-uploading existing chunks.
         """
-        args = chunk_parser.parse_args()
+        args = chunk_check_parser.parse_args()
         
         chunk_number = args['flowChunkNumber']
-        identifier = args['flowIdentifier']
+        temp_dir = get_chunk_dir(args['flowIdentifier'])
         
-        # Check if the chunk exists
-        temp_dir = current_app.config['UPLOAD_FOLDER'] / "temp" / identifier
-        chunk_path = temp_dir / f"chunk.{chunk_number}"
+        # Check if the chunk exists; a number outside the upload never does
+        if not 1 <= chunk_number <= args['flowTotalChunks']:
+            exists = False
+        elif current_app.config['CHUNKED_UPLOAD_MODE'] == 'offset':
+            upload = OffsetUpload(temp_dir, args['flowTotalChunks'], args['flowChunkSize'], args['flowTotalSize'])
+            exists = upload.has_chunk(chunk_number)
+        else:
+            exists = os.path.exists(temp_dir / f"chunk.{chunk_number}")
         
-        if os.path.exists(chunk_path):
+        if exists:
             return {'message': 'Chunk exists'}, 200
         else:
             return '', 204  # No content
 
 
+@api.route('/uploads')
+class ResumableUploads(Resource):
+    """Creation endpoint of the offset-based (tus-style) resumable upload protocol."""
+    
+    @api.response(201, 'Upload created; its URL is in the Location header')
+    @api.response(400, 'Invalid Upload-Length or Upload-Metadata')
+    @api.response(413, 'File too large')
+    @api.response(429, 'Space is reserved by uploads in progress; retry after Retry-After seconds')
+    @api.response(507, 'Not enough disk space or quota')
+    def post(self):
+        """
+        Create a resumable upload.
+        Send Upload-Length (total bytes) and Upload-Metadata with a base64
+        filename, then PATCH the bytes to the returned Location.
+        Upload-Length bytes of disk and quota are reserved for the upload.
+        """
+        try:
+            total_size = int(request.headers['Upload-Length'])
+        except (KeyError, ValueError):
+            api.abort(400, "Upload-Length header required")
+        if total_size < 0:
+            api.abort(400, "Invalid Upload-Length")
+        if total_size > current_app.config['MAX_CONTENT_LENGTH']:
+            api.abort(413, "File too large")
+        
+        metadata = parse_upload_metadata(request.headers.get('Upload-Metadata'))
+        filename = secure_filename(metadata.get('filename', ''))
+        if not filename or not allowed_file(filename):
+            api.abort(400, "File type not allowed")
+        
+        identifier = uuid.uuid4().hex
+        admit_upload(identifier, total_size)
+        AppendUpload(get_chunk_dir(identifier), total_size).create()
+        get_catalog().open_upload(identifier, filename, None, None, total_size, client_address())
+        logger.info(f"Resumable upload created: {filename} ({identifier}, {total_size} bytes)")
+        
+        return Response(status=201, headers={
+            'Location': f"{request.base_url.rstrip('/')}/{identifier}",
+            'Upload-Offset': '0',
+            'Tus-Resumable': TUS_VERSION
+        })
+    
+    def options(self):
+        """Advertise the supported protocol version, extensions and maximum size."""
+        return Response(status=204, headers={
+            'Tus-Resumable': TUS_VERSION,
+            'Tus-Version': TUS_VERSION,
+            'Tus-Extension': 'creation,termination',
+            'Tus-Max-Size': str(current_app.config['MAX_CONTENT_LENGTH'])
+        })
+
+
+@api.route('/uploads/<string:identifier>')
+@api.param('identifier', 'The resumable upload identifier')
+class ResumableUpload(Resource):
+    """A resumable upload that clients append to with PATCH."""
+    
+    @staticmethod
+    def _open(identifier, cancelled=False):
+        """Look up an upload created through /uploads; a cancelled one only with cancelled=True."""
+        record = get_catalog().get_upload(identifier)
+        if (not record or record['total_size'] is None or record['total_chunks'] is not None
+                or (record['state'] == 'cancelled' and not cancelled)):
+            api.abort(404, "Upload not found")
+        return record, AppendUpload(get_chunk_dir(identifier), record['total_size'])
+    
+    @api.response(200, 'The committed offset is in Upload-Offset')
+    @api.response(404, 'Upload not found')
+    def head(self, identifier):
+        """Get the number of bytes committed so far, to resume from."""
+        record, upload = self._open(identifier)
+        offset = record['total_size'] if record['state'] != 'pending' else upload.offset()
+        if offset is None:
+            api.abort(404, "Upload not found")
+        return Response(status=200, headers={
+            'Upload-Offset': str(offset),
+            'Upload-Length': str(record['total_size']),
+            'Cache-Control': 'no-store',
+            'Tus-Resumable': TUS_VERSION
+        })
+    
+    @api.response(204, 'Bytes appended; the new offset is in Upload-Offset')
+    @api.response(201, 'Upload complete, file stored')
+    @api.response(202, 'Upload complete, file is being assembled')
+    @api.response(400, 'Checksum mismatch or body longer than Upload-Length')
+    @api.response(404, 'Upload not found')
+    @api.response(409, 'Upload-Offset does not match, another request is appending, or the upload is complete')
+    @api.response(410, 'Upload failed, was rejected or was terminated')
+    @api.response(415, 'Content-Type must be application/offset+octet-stream')
+    @api.response(429, 'Space is reserved by uploads in progress; retry after Retry-After seconds')
+    @api.response(507, 'Not enough disk space or quota')
+    def patch(self, identifier):
+        """
+        Append the request body at Upload-Offset.
+        The offset must equal the committed offset (see HEAD). Bodies may
+        be any size, so clients can adapt how much they send per request.
+        """
+        if request.mimetype != 'application/offset+octet-stream':
+            api.abort(415, "Content-Type must be application/offset+octet-stream")
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            api.abort(400, "Upload-Offset header required")
+        
+        record, upload = self._open(identifier, cancelled=True)
+        if record['state'] in ('failed', 'rejected', 'cancelled'):
+            # Its bytes are gone: the client has to start a new upload
+            api.abort(410, f"Upload {record['state']}: {record['error']}" if record['error']
+                      else f"Upload {record['state']}")
+        if record['state'] != 'pending':
+            api.abort(409, f"Upload is already {record['state']}")
+        if upload.offset() is None:
+            api.abort(404, "Upload not found")
+        admit_upload(identifier, record['total_size'])
+        get_catalog().touch_upload(identifier)
+        
+        hasher = StreamHasher(get_expected_digests())
+        try:
+            new_offset = upload.append(offset, request.stream, current_app.config['CHUNK_SIZE'], hasher)
+        except OffsetConflict as e:
+            return Response(status=409, headers={'Upload-Offset': str(e.offset), 'Tus-Resumable': TUS_VERSION})
+        except UploadLocked as e:
+            api.abort(409, str(e))
+        except (ChecksumMismatch, UploadTooLarge) as e:
+            api.abort(400, str(e))
+        
+        headers = {'Upload-Offset': str(new_offset), 'Tus-Resumable': TUS_VERSION}
+        if not upload.is_complete():
+            return Response(status=204, headers=headers)
+        
+        logger.info(f"Resumable upload {identifier} received in full")
+        body, status = finish_chunked_upload(identifier, record['filename'], upload.finalize)
+        return body, status, headers
+    
+    @api.response(204, 'Upload terminated')
+    @api.response(404, 'Upload not found')
+    @api.response(409, 'Upload is already assembling or complete')
+    def delete(self, identifier):
+        """Terminate an upload: its bytes are deleted and its reserved space released."""
+        self._open(identifier)
+        cancel_upload(identifier)
+        return Response(status=204, headers={'Tus-Resumable': TUS_VERSION})
+
+
+@api.route('/upload/<string:identifier>/status')
+@api.param('identifier', 'The chunked upload identifier (flowIdentifier)')
+class UploadStatus(Resource):
+    """Endpoint reporting the progress of a chunked upload."""
+    
+    @api.marshal_with(upload_status)
+    @api.response(200, 'Success')
+    @api.response(404, 'Upload not found')
+    def get(self, identifier):
+        """
+        Get the state of a chunked upload: pending, assembling, complete, failed, rejected or cancelled.
+        Once complete, file_id identifies the stored file.
+        """
+        record = get_catalog().get_upload(identifier)
+        if record:
+            return {
+                'upload_id': identifier,
+                'filename': record['filename'],
+                'status': record['state'],
+                'file_id': record['file_id'],
+                'error': record['error']
+            }
+        
+        # Chunks are still arriving
+        if os.path.isdir(get_chunk_dir(identifier)):
+            return {'upload_id': identifier, 'status': 'pending'}
+        
+        api.abort(404, "Upload not found")
+
+
+@api.route('/upload/<string:identifier>/chunks')
+@api.param('identifier', 'The chunked upload identifier (flowIdentifier)')
+class UploadChunks(Resource):
+    """Endpoint reporting every received chunk of an upload in one response."""
+    
+    @api.marshal_with(received_chunks)
+    @api.response(200, 'Success')
+    @api.response(404, 'Upload not found')
+    def get(self, identifier):
+        """
+        Get the set of received chunks as a range list and a bitmap.
+        Lets a resuming client find all missing chunks with a single request.
+        """
+        record = get_catalog().get_upload(identifier)
+        if not record or record['total_chunks'] is None:
+            api.abort(404, "Upload not found")
+        return self._describe(identifier, record)
+    
+    @api.expect(chunk_hashes)
+    @api.marshal_with(received_chunks)
+    @api.response(200, 'Success')
+    @api.response(400, 'Invalid upload parameters')
+    @api.response(410, 'Upload was cancelled')
+    @api.response(415, 'Upload was rejected for its file type')
+    @api.response(429, 'Space is reserved by uploads in progress; retry after Retry-After seconds')
+    @api.response(507, 'Not enough disk space or quota')
+    def post(self, identifier):
+        """
+        Offer the SHA-256 of chunks before sending them.
+        Chunks whose bytes the server already stores are copied server-side
+        and marked received; the response lists what is still missing.
+        """
+        data = request.get_json()
+        try:
+            filename = secure_filename(data['filename'])
+            total_chunks, chunk_size, total_size = (
+                int(data['total_chunks']), int(data['chunk_size']), int(data['total_size']))
+        except (KeyError, TypeError, ValueError):
+            api.abort(400, "filename, total_chunks, chunk_size and total_size are required")
+        if not allowed_file(filename):
+            api.abort(400, "File type not allowed")
+        record = refuse_closed_upload(identifier)
+        check_layout(total_chunks, chunk_size, total_size, record)
+        
+        catalog = get_catalog()
+        temp_dir = get_chunk_dir(identifier)
+        admit_upload(identifier, total_size)
+        if record is None:
+            catalog.open_upload(identifier, filename, total_chunks, chunk_size, total_size, client_address())
+        else:
+            catalog.touch_upload(identifier)
+        
+        record = catalog.get_upload(identifier)
+        if record['state'] != 'pending':
+            return self._describe(identifier, record)
+        
+        # Only in-place uploads can take chunks copied from other objects
+        if current_app.config['CHUNKED_UPLOAD_MODE'] == 'offset':
+            upload = OffsetUpload(temp_dir, record['total_chunks'], record['chunk_size'], record['total_size'])
+            for number, chunk_hash in sorted(data['hashes'].items(), key=lambda item: int(item[0])):
+                number = int(number)
+                location = catalog.find_chunk(chunk_hash.lower())
+                if not location or not 1 <= number <= upload.total_chunks or upload.has_chunk(number):
+                    continue
+                checksum, offset, length = location
+                if length != upload.expected_length(number):
+                    continue
+                
+                try:
+                    with open(get_blobs().path_for(checksum), 'rb') as f:
+                        f.seek(offset)
+                        write_at_offset(upload, identifier, number, filename, LimitedStream(f, length))
+                except FileNotFoundError:
+                    continue  # Blob deleted since the lookup
+                logger.info(f"Chunk {number} of {identifier} reused from {checksum}")
+        
+        return self._describe(identifier, catalog.get_upload(identifier))
+    
+    @api.response(204, 'Upload cancelled')
+    @api.response(404, 'Upload not found')
+    @api.response(409, 'Upload is already assembling or complete')
+    def delete(self, identifier):
+        """
+        Cancel a chunked upload.
+        The chunks received so far are deleted and the space reserved for
+        the upload is released; later chunks are refused with 410.
+        """
+        cancel_upload(identifier)
+        return '', 204
+    
+    @staticmethod
+    def _describe(identifier, record):
+        """Build the received-chunks view of an upload."""
+        total_chunks = record['total_chunks']
+        chunk_size = record['chunk_size']
+        total_size = record['total_size']
+        temp_dir = get_chunk_dir(identifier)
+        
+        if record['state'] in ('assembling', 'complete'):
+            flags = [True] * total_chunks
+        elif record['state'] in ('rejected', 'cancelled'):
+            flags = [False] * total_chunks
+        elif current_app.config['CHUNKED_UPLOAD_MODE'] == 'offset':
+            flags = OffsetUpload(temp_dir, total_chunks, chunk_size, total_size).received_flags()
+        else:
+            flags = chunk_file_flags(temp_dir, total_chunks, chunk_size, total_size)
+        
+        return {
+            'upload_id': identifier,
+            'status': record['state'],
+            'total_chunks': total_chunks,
+            'chunk_size': chunk_size,
+            'last_chunk_size': total_size - (total_chunks - 1) * chunk_size,
+            'total_size': total_size,
+            'received_count': sum(flags),
+            'received': format_ranges(flags),
+            'bitmap': pack_bitmap(flags),
+            'chunk_reuse': current_app.config['CHUNKED_UPLOAD_MODE'] == 'offset'
+        }
+
+
+@api.route('/upload/by-hash')
+class HashUpload(Resource):
+    """Endpoint creating a file from content the server already stores."""
+    
+    @api.expect(hash_upload)
+    @api.response(201, 'File created from stored content')
+    @api.response(400, 'Invalid request')
+    @api.response(404, 'Content not stored')
+    def post(self):
+        """
+        Create a file from its SHA-256 without transferring the bytes.
+        A client can try this first and fall back to a regular upload on 404.
+        """
+        data = request.get_json()
+        filename = secure_filename(data['filename'])
+        if not allowed_file(filename):
+            api.abort(400, "File type not allowed")
+        
+        file_id = str(uuid.uuid4())
+        record = get_catalog().link_file(file_id, filename, data['checksum'].lower(), client_address())
+        if record is None:
+            api.abort(404, "Content not stored")
+        
+        logger.info(f"File created from stored content: {filename} (ID: {file_id})")
+        return {
+            'id': file_id,
+            'filename': filename,
+            'size': record['size'],
+            'content_type': record['content_type'],
+            'checksum': record['checksum']
+        }, 201
+
+
 @api.route('/files')
 class FileList(Resource):
     """Endpoint to list all uploaded files."""
     
+    @api.expect(list_parser)
     @api.marshal_list_with(file_info)
     @api.response(200, 'Success')
+    @api.response(400, 'Invalid query parameters')
+    def get(self):
+        """
+        Get a page of uploaded files from the catalog.
+        The cursor of the next page, if any, is returned in the X-Next-Cursor header.
+        """
+        args = list_parser.parse_args()
+        limit = min(args['limit'] or current_app.config['FILE_LIST_PAGE_SIZE'],
+                    current_app.config['FILE_LIST_MAX_PAGE_SIZE'])
+        
+        try:
+            files, next_cursor = get_catalog().list(
+                limit=limit,
+                cursor=args['cursor'],
+                sort=args['sort'],
+                order=args['order'],
+                content_type=args['content_type'],
+                filename=args['filename'],
+                min_size=args['min_size'],
+                max_size=args['max_size']
+            )
+        except InvalidCursor as e:
+            api.abort(400, str(e))
+        
+        headers = {}
+        if next_cursor:
+            headers['X-Next-Cursor'] = next_cursor
+        return files, 200, headers
+
+
+@api.route('/cache')
+class FileCacheStats(Resource):
+    """Endpoint reporting on the in-memory file cache."""
+    
+    @api.marshal_with(cache_stats)
+    @api.response(200, 'Success')
     def get(self):
-        """Get a list of all uploaded files."""
-        return get_file_list()
+        """Get hit/miss statistics of the file cache of the worker serving the request."""
+        return get_file_cache().stats()
+
+
+@api.route('/storage')
+class StorageUsage(Resource):
+    """Endpoint reporting disk space, upload reservations and the client's usage."""
+    
+    @api.marshal_with(storage_usage)
+    @api.response(200, 'Success')
+    def get(self):
+        """Get free and reserved space, and the requesting client's stored bytes, reservations and quota."""
+        config = current_app.config
+        disk = shutil.disk_usage(config['UPLOAD_FOLDER'])
+        client = client_address()
+        usage = get_catalog().usage(client)
+        for item in usage['client_reservations']:
+            item['expires_at'] = datetime.fromtimestamp(item['expires_at'], tz=timezone.utc)
+        usage.update({
+            'disk_total': disk.total,
+            'disk_free': disk.free,
+            'disk_available': max(0, disk.free - config['DISK_FREE_RESERVE'] - usage['outstanding_bytes']),
+            'client': client,
+            'client_quota': config['CLIENT_QUOTA'],
+            'client_reserved_bytes': sum(item['size'] for item in usage['client_reservations'])
+        })
+        return usage
 
 
 @api.route('/files/<string:file_id>')
@@ -270,53 +1328,198 @@ class FileList(Resource):
 class FileResource(Resource):
     """Endpoint for file operations on a specific file."""
     
+    @staticmethod
+    def _describe(file_id, load=False):
+        """Look up a stored file and build the headers shared by GET and HEAD.
+        
+        Hot objects come from the file cache, which skips the filesystem
+        lookups; cached is its entry, or None. With load, a stored object
+        that is not cached yet is read into the cache. For a compressed
+        download, file_path and stat describe the stored variant, or
+        stream_encoding is the coding to apply while streaming.
+        """
+        # Get original filename if available (stored in metadata)
+        record = get_catalog().get(file_id)
+        cache = get_file_cache()
+        checksum = record['checksum'] if record else None
+        cached = cache.get(checksum) if checksum and cache.enabled else None
+        
+        if cached:
+            file_path, stat = cached.path, cached.stat
+        else:
+            file_path = resolve_file_path(file_id, record)
+            if file_path is None:
+                api.abort(404, "File not found")
+            stat = os.stat(file_path)
+            # Only objects in the store are cached: their content never changes
+            if load and checksum and cache.enabled and file_path == get_blobs().path_for(checksum):
+                cached = cache.load(checksum, file_path, stat)
+        
+        original_filename = record['filename'] if record else file_id
+        
+        mime = record['content_type'] if record else get_mime_type(str(file_path))
+        compressible = should_compress(mime, stat.st_size)
+        encoding, variant = negotiate_encoding(checksum) if compressible else (None, None)
+        if variant:
+            file_path, stat, cached = variant, os.stat(variant), None
+        
+        # Each coding is a representation of its own, with its own entity tag
+        etag = make_etag(checksum, stat)
+        if encoding:
+            etag = f'{etag}-{encoding}'
+        headers = {
+            'Content-Disposition': f'attachment; filename="{original_filename}"',
+            'Accept-Ranges': 'bytes',
+            'ETag': quote_etag(etag),
+            'Last-Modified': http_date(stat.st_mtime)
+        }
+        if compressible:
+            headers['Vary'] = 'Accept-Encoding'
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        elif checksum:
+            headers['Digest'] = digest_header(checksum)
+        stream_encoding = encoding if encoding and not variant else None
+        return file_path, stat, mime, etag, headers, cached, stream_encoding
+    
+    @api.response(200, 'Success')
+    @api.response(304, 'Not modified')
+    @api.response(404, 'File not found')
+    def head(self, file_id):
+        """Get download headers (size, name, type, validators) without the file body."""
+        file_path, stat, mime, etag, headers, _, stream_encoding = self._describe(file_id)
+        
+        if is_not_modified(request, etag, stat.st_mtime):
+            return Response(status=304, headers=headers)
+        
+        response = Response(status=200, mimetype=mime, headers=headers)
+        if stream_encoding:
+            # The compressed length is only known once the body has been sent
+            response.automatically_set_content_length = False
+        else:
+            response.headers['Content-Length'] = str(stat.st_size)
+        return response
+    
     @api.response(200, 'Success')
+    @api.response(206, 'Partial content')
+    @api.response(304, 'Not modified')
     @api.response(404, 'File not found')
+    @api.response(416, 'Range not satisfiable')
     def get(self, file_id):
-        """Download a file by ID."""
-        file_path = current_app.config['UPLOAD_FOLDER'] / file_id
+        """
+        Download a file by ID.
+        Supports byte ranges (Range / If-Range) for resumable downloads and
+        conditional requests (If-None-Match / If-Modified-Since).
+        """
+        file_path, stat, mime, etag, headers, cached, stream_encoding = self._describe(file_id, load=True)
+        size = stat.st_size
+        chunk_size = current_app.config['CHUNK_SIZE']
         
-        if not os.path.exists(file_path):
-            api.abort(404, "File not found")
+        if is_not_modified(request, etag, stat.st_mtime):
+            return Response(status=304, headers=headers)
         
-        # Get original filename if available (stored in metadata)
-        original_filename = file_id  # Default to ID if original name not available
+        if stream_encoding:
+            logger.info(f"File download started: {file_id} ({stream_encoding}, compressed while streaming)")
+            if cached and cached.complete:
+                source = iter_bytes(cached.data, 0, size, chunk_size)
+            else:
+                source = iter_file_range(file_path, 0, size, chunk_size)
+            return Response(
+                self._shaped(file_id, compress_chunks(source, stream_encoding)),
+                mimetype=mime,
+                headers=headers
+            )
         
-        # Stream the file in chunks
-        def generate():
-            with open(file_path, 'rb') as f:
-                while True:
-                    chunk = f.read(current_app.config['CHUNK_SIZE'])
-                    if not chunk:
-                        break
-                    yield chunk
+        # Serve byte ranges if requested and the file is unchanged since the client saw it
+        ranges = None
+        if range_condition_holds(request.if_range, etag, stat.st_mtime):
+            try:
+                ranges = resolve_ranges(request.range, size, current_app.config['MAX_RANGES'])
+            except RangeNotSatisfiable:
+                headers['Content-Range'] = f'bytes */{size}'
+                return Response(status=416, headers=headers)
         
-        mime = get_mime_type(str(file_path))
+        if ranges and len(ranges) == 1:
+            start, end = ranges[0]
+            logger.info(f"File range download started: {file_id} bytes {start}-{end - 1}")
+            headers['Content-Range'] = content_range(start, end, size)
+            headers['Content-Length'] = str(end - start)
+            return Response(
+                self._body(file_id, file_path, start, end, size, chunk_size, cached),
+                status=206,
+                mimetype=mime,
+                headers=headers,
+                direct_passthrough=True
+            )
+        
+        if ranges:
+            body = MultipartByteranges(ranges, size, mime)
+            logger.info(f"File multi-range download started: {file_id} ({len(ranges)} ranges)")
+            headers['Content-Length'] = str(body.content_length)
+            return Response(
+                self._shaped(file_id, body.iter_body(
+                    file_path, chunk_size, cached.data if cached and cached.complete else None)),
+                status=206,
+                content_type=body.content_type,
+                headers=headers
+            )
         
         # Log the download
         logger.info(f"File download started: {file_id}")
         
         # Stream response
+        headers['Content-Type'] = mime
+        headers['Content-Length'] = str(size)
         return Response(
-            generate(),
+            self._body(file_id, file_path, 0, size, size, chunk_size, cached),
             mimetype=mime,
-            headers={
-                'Content-Disposition': f'attachment; filename="{original_filename}"',
-                'Content-Type': mime
-            }
+            headers=headers,
+            direct_passthrough=True
         )
     
+    @classmethod
+    def _body(cls, file_id, file_path, start, end, size, chunk_size, cached=None):
+        """Body for bytes [start, end): from memory, sendfile via wsgi.file_wrapper, or a plain read loop.
+        
+        Bytes held by the file cache are served from it. Bandwidth limits
+        need to see every block, so they always use the read loop.
+        """
+        if cached and end <= len(cached.data):
+            return cls._shaped(file_id, iter_bytes(cached.data, start, end, chunk_size))
+        if current_app.extensions['bandwidth'].enabled:
+            return cls._shaped(file_id, iter_file_range(file_path, start, end, chunk_size))
+        if current_app.config['DOWNLOAD_MODE'] == 'sendfile':
+            return file_body(request.environ, file_path, start, end, size, chunk_size)
+        return iter_file_range(file_path, start, end, chunk_size)
+    
+    @staticmethod
+    def _shaped(file_id, body):
+        """Apply the client, file and fair-share bandwidth limits to a download body."""
+        shaper = current_app.extensions['bandwidth']
+        if not shaper.enabled:
+            return body
+        return shaper.shape(body, shaper.open(request.remote_addr, file_id, 'download'))
+    
     @api.response(204, 'File deleted')
     @api.response(404, 'File not found')
     def delete(self, file_id):
-        """Delete a file by ID."""
-        file_path = current_app.config['UPLOAD_FOLDER'] / file_id
+        """
+        Delete a file by ID.
+        The stored content is removed once no other file references it.
+        """
+        catalog = get_catalog()
+        record = catalog.get(file_id)
+        file_path = resolve_file_path(file_id, record)
         
-        if not os.path.exists(file_path):
+        if record is None and file_path is None:
             api.abort(404, "File not found")
         
         try:
-            os.remove(file_path)
+            catalog.remove_file(file_id, delete_blob)
+            # Files stored before the object store live in UPLOAD_FOLDER directly
+            flat_path = legacy_path(file_id)
+            if os.path.isfile(flat_path):
+                os.remove(flat_path)
             logger.info(f"File deleted: {file_id}")
             return '', 204
         except Exception as e:
@@ -1,8 +1,18 @@
-from flask import Flask
+from flask import Flask, request
+from werkzeug.wsgi import LimitedStream
 from flask_restx import Api
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from config import Config
+from services.catalog import FileCatalog
+from services.blobs import BlobStore
+from services.content_type import ContentTypeDetector
+from services.cache import FileCache
+from services.compression import VariantStore, DecodedInput, DECODINGS
+from services.ratelimit import request_cost
+from services.bandwidth import BandwidthShaper, ShapedInput
+from services.janitor import UploadJanitor
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import os
 
@@ -18,14 +28,6 @@ def create_app(config_class=Config):
     app.config.from_object(config_class)
     config_class.init_app(app)
     
-    # Initialize rate limiter
-    limiter = Limiter(
-        get_remote_address,
-        app=app,
-        default_limits=[app.config['RATELIMIT_DEFAULT']],
-        storage_uri=app.config['RATELIMIT_STORAGE_URL']
-    )
-    
     # Setup API with Swagger documentation
     api = Api(
         app, 
@@ -38,15 +40,130 @@ def create_app(config_class=Config):
     )
     
     # Import and register blueprints/namespaces
-    from api.files import api as files_ns
+    from api.files import api as files_ns, ChunkedUpload, ResumableUpload, UploadRequest
     api.add_namespace(files_ns, path='/files')  # Explicitly set the path
     
+    # Uploads are type-checked while their form is parsed
+    app.request_class = UploadRequest
+    
+    # Initialize rate limiter. Chunk requests are many per file, so they are
+    # exempt from the default limit and charged by size against their own.
+    chunk_endpoints = {ChunkedUpload.endpoint, ResumableUpload.endpoint}
+    
+    def is_chunk_request():
+        return request.endpoint in chunk_endpoints
+    
+    Limiter(
+        get_remote_address,
+        app=app,
+        default_limits=[app.config['RATELIMIT_DEFAULT']],
+        default_limits_exempt_when=is_chunk_request,
+        application_limits=[app.config['RATELIMIT_CHUNKS']],
+        application_limits_exempt_when=lambda: not is_chunk_request(),
+        application_limits_cost=lambda: request_cost(
+            request.content_length, app.config['RATELIMIT_CHUNK_COST_BYTES']),
+        storage_uri=app.config['RATELIMIT_STORAGE_URL']
+    )
+    
+    # One content-type detector per worker, reused by every request
+    detector = ContentTypeDetector(cache_size=app.config['MIME_CACHE_SIZE'])
+    app.extensions['content_type'] = detector
+    
+    # Open the metadata catalog; index pre-existing files the first time it is created
+    catalog = FileCatalog(app.config['CATALOG_PATH'])
+    if catalog.created:
+        catalog.import_folder(app.config['UPLOAD_FOLDER'], detector.from_file)
+    app.extensions['catalog'] = catalog
+    app.extensions['blobs'] = BlobStore(app.config['UPLOAD_FOLDER'] / "objects")
+    
+    app.extensions['variants'] = VariantStore(app.config['UPLOAD_FOLDER'] / "variants")
+    
+    # Hot files served from memory
+    app.extensions['file_cache'] = FileCache(
+        app.config['FILE_CACHE_BYTES'], app.config['FILE_CACHE_MAX_FILE_SIZE'], app.config['FILE_CACHE_HEAD_SIZE'])
+    
+    # Bandwidth limits for uploads and downloads
+    shaper = BandwidthShaper(
+        per_client=app.config['BANDWIDTH_PER_CLIENT'],
+        per_file=app.config['BANDWIDTH_PER_FILE'],
+        total_rate=app.config['BANDWIDTH_TOTAL'],
+        weights={'download': app.config['BANDWIDTH_DOWNLOAD_WEIGHT'],
+                 'upload': app.config['BANDWIDTH_UPLOAD_WEIGHT']}
+    )
+    app.extensions['bandwidth'] = shaper
+    
+    if shaper.enabled:
+        @app.before_request
+        def shape_upload():
+            # Throttle request bodies as they are read, before any form parsing
+            if request.content_length or request.environ.get('wsgi.input_terminated'):
+                # Chunks name their upload in the query string; the form is not parsed yet
+                file_key = (request.view_args or {}).get('identifier') or request.args.get('flowIdentifier')
+                transfer = shaper.open(request.remote_addr, file_key, 'upload')
+                request.environ['wsgi.input'] = ShapedInput(request.environ['wsgi.input'], transfer)
+                request.environ['fileserver.transfer'] = transfer
+        
+        @app.teardown_request
+        def end_upload(exc):
+            transfer = request.environ.get('fileserver.transfer')
+            if transfer:
+                transfer.close()
+    
+    # Compressed request bodies are decoded before anything reads them, so
+    # every upload endpoint and MAX_CONTENT_LENGTH see the decoded bytes
+    @app.before_request
+    def decode_upload():
+        encoding = request.headers.get('Content-Encoding', '').strip().lower()
+        if encoding in ('', 'identity'):
+            return
+        if encoding not in DECODINGS:
+            return {'message': f'Unsupported Content-Encoding: {encoding}'}, 415
+        
+        environ = request.environ
+        stream = environ['wsgi.input']
+        if 'wsgi.input_terminated' not in environ:
+            # Content-Length counts compressed bytes: it bounds the raw stream only
+            stream = LimitedStream(stream, request.content_length or 0)
+        environ['wsgi.input'] = DecodedInput(stream, encoding, app.config['UPLOAD_MAX_COMPRESSION_RATIO'])
+        environ.pop('CONTENT_LENGTH', None)
+        environ['wsgi.input_terminated'] = True
+        # The decoded length is unknown; the rate limiter has already read the compressed one
+        request.content_length = None
+    
+    # Background pool that finalizes completed chunked uploads
+    app.extensions['assembler'] = ThreadPoolExecutor(
+        max_workers=app.config['ASSEMBLY_WORKERS'], thread_name_prefix='assembler')
+    
+    # Background pool that builds compressed variants of stored files
+    app.extensions['compressor'] = ThreadPoolExecutor(
+        max_workers=app.config['COMPRESSION_WORKERS'], thread_name_prefix='compressor')
+    
+    # Expire abandoned uploads and reclaim their space in temp/
+    janitor = UploadJanitor(
+        catalog,
+        app.config['UPLOAD_FOLDER'] / "temp",
+        app.config['UPLOAD_FOLDER'] / "meta" / "janitor.lock",
+        ttl=app.config['UPLOAD_SESSION_TTL'],
+        assembly_timeout=app.config['ASSEMBLY_TIMEOUT'],
+        batch_size=app.config['JANITOR_BATCH_SIZE'],
+        batch_pause=app.config['JANITOR_BATCH_PAUSE']
+    )
+    app.extensions['janitor'] = janitor
+    if app.config['JANITOR_INTERVAL']:
+        janitor.start(app.config['JANITOR_INTERVAL'])
+    
     # CORS Configuration
     @app.after_request
     def after_request(response):
         response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-        response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE')
+        response.headers.add('Access-Control-Allow-Headers',
+                             'Content-Type,Content-Encoding,Authorization,Content-MD5,Digest,'
+                             'Upload-Length,Upload-Offset,Upload-Metadata,Tus-Resumable')
+        response.headers.add('Access-Control-Allow-Methods', 'GET,HEAD,PUT,POST,PATCH,DELETE,OPTIONS')
+        response.headers.add('Access-Control-Expose-Headers',
+                             'Content-Disposition,Content-Length,Content-Range,Content-Encoding,ETag,Last-Modified,'
+                             'X-Next-Cursor,Digest,Location,Upload-Offset,Upload-Length,Tus-Resumable,Tus-Version,'
+                             'Tus-Extension,Tus-Max-Size,Retry-After')
         return response
     
     # Add error handlers
@@ -0,0 +1,215 @@
+"""Asyncio serving mode.
+
+Serves the application built by create_app() from an ASGI server event
+loop, so one process can hold thousands of concurrent downloads:
+
+    uvicorn asgi:create_asgi_app --factory --host 0.0.0.0 --port 8080
+
+Requests still run through the Flask app and the resources in
+api/files.py, on a bounded thread pool. Response bodies are streamed from
+the event loop. Files handed to wsgi.file_wrapper are read with pread() on
+the same pool, one block at a time. The next block is only read once the
+server has accepted the previous one, so a slow client holds one buffer
+and no thread while it waits.
+"""
+import io
+import os
+import sys
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from app import create_app
+from config import Config
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+SERVER_SOFTWARE = 'fileserver-asgi'
+
+
+class AsyncFileWrapper:
+    """wsgi.file_wrapper given to the app; the adapter streams the file from the event loop.
+
+    Exactly Content-Length bytes are sent from the file's current offset,
+    so byte ranges can use it too (see services.transfer.file_body).
+    """
+    bounded_by_content_length = True
+
+    def __init__(self, filelike, blksize=8192):
+        self.filelike = filelike
+        self.blksize = blksize
+
+    def close(self):
+        self.filelike.close()
+
+
+class RequestBody(io.RawIOBase):
+    """wsgi.input read by a worker thread, fed from the ASGI receive channel."""
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._view = memoryview(b'')
+        self._more = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._view and self._more:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message['type'] == 'http.disconnect':
+                raise OSError("Client disconnected")
+            self._view = memoryview(message.get('body', b''))
+            self._more = message.get('more_body', False)
+        n = min(len(b), len(self._view))
+        b[:n] = self._view[:n]
+        self._view = self._view[n:]
+        return n
+
+
+class AsgiFileServer:
+    """ASGI adapter running a WSGI app on a bounded thread pool."""
+
+    def __init__(self, wsgi_app, max_threads, chunk_size):
+        self.wsgi_app = wsgi_app
+        self.chunk_size = chunk_size
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        environ = self._environ(scope, RequestBody(receive, loop))
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = headers
+
+        body = await loop.run_in_executor(self.executor, self.wsgi_app, environ, start_response)
+        try:
+            if isinstance(body, AsyncFileWrapper):
+                chunks = self._file_chunks(loop, body, response['headers'])
+            else:
+                chunks = self._iter_chunks(loop, body)
+
+            # Generic WSGI apps may only call start_response on the first iteration
+            try:
+                first = await chunks.__anext__()
+            except StopAsyncIteration:
+                first = b''
+            await send({
+                'type': 'http.response.start',
+                'status': response['status'],
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                            for name, value in response['headers']]
+            })
+
+            # The request body has been consumed; from here receive() only reports a disconnect
+            disconnected = asyncio.Event()
+            watcher = asyncio.ensure_future(self._watch_disconnect(receive, disconnected))
+            try:
+                chunk = first
+                async for following in chunks:
+                    if disconnected.is_set():
+                        return
+                    if chunk:
+                        # Returns once the server has taken the data: backpressure
+                        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                    chunk = following
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': False})
+            finally:
+                watcher.cancel()
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+
+    @staticmethod
+    async def _watch_disconnect(receive, disconnected):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+                return
+
+    async def _iter_chunks(self, loop, body):
+        """Iterate a WSGI body, each step on the thread pool."""
+        iterator = iter(body)
+        while True:
+            chunk = await loop.run_in_executor(self.executor, next, iterator, None)
+            if chunk is None:
+                return
+            yield chunk
+
+    async def _file_chunks(self, loop, wrapper, headers):
+        """Read Content-Length bytes from the wrapped file's offset, one pread per block."""
+        fd = wrapper.filelike.fileno()
+        offset = wrapper.filelike.tell()
+        length = next((int(value) for name, value in headers if name.lower() == 'content-length'), None)
+        remaining = os.fstat(fd).st_size - offset if length is None else length
+        while remaining > 0:
+            block = await loop.run_in_executor(
+                self.executor, os.pread, fd, min(self.chunk_size, remaining), offset)
+            if not block:
+                return
+            offset += len(block)
+            remaining -= len(block)
+            yield block
+
+    @staticmethod
+    def _environ(scope, body):
+        """Build a WSGI environ from an ASGI HTTP scope."""
+        server_name, server_port = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server_name,
+            'SERVER_PORT': str(server_port),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'SERVER_SOFTWARE': SERVER_SOFTWARE,
+            'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.input_terminated': True,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+            'wsgi.file_wrapper': AsyncFileWrapper,
+        }
+        for name, value in scope.get('headers', []):
+            key = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = f'HTTP_{key}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+
+def create_asgi_app(config_class=Config):
+    """Create the Flask application and wrap it for an ASGI server."""
+    app = create_app(config_class)
+    return AsgiFileServer(app, app.config['ASYNC_WORKER_THREADS'], app.config['CHUNK_SIZE'])
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('asgi:create_asgi_app', factory=True, host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Measure CPU time per GB served by the download endpoint.
+
+Runs the WSGI app in-process and drains each response into /dev/null the
+way a sync server would: 'stream' iterates the Python read loop, while
+'sendfile' passes an environ with a gunicorn-style wsgi.file_wrapper that
+the "server" drains with os.sendfile().
+"""
+import os
+import time
+import uuid
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+from werkzeug.test import EnvironBuilder
+from app import create_app
+from config import Config
+
+
+class SendfileWrapper:
+    """Minimal stand-in for gunicorn's FileWrapper."""
+
+    def __init__(self, filelike, blksize=8192):
+        self.filelike = filelike
+        self.blksize = blksize
+
+    def close(self):
+        self.filelike.close()
+
+
+def serve(app, url, mode, sink):
+    """Run one request through the app and write its body to sink. Returns bytes sent."""
+    builder = EnvironBuilder(path=url, method='GET')
+    environ = builder.get_environ()
+    if mode == 'sendfile':
+        environ['wsgi.file_wrapper'] = SendfileWrapper
+        environ['SERVER_SOFTWARE'] = 'gunicorn/21.2.0'
+
+    headers = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        headers.update(response_headers)
+
+    body = app(environ, start_response)
+    sent = 0
+    try:
+        if isinstance(body, SendfileWrapper):
+            fileno = body.filelike.fileno()
+            offset = os.lseek(fileno, 0, os.SEEK_CUR)
+            remaining = int(headers['Content-Length'])
+            while remaining > 0:
+                n = os.sendfile(sink, fileno, offset, remaining)
+                if n == 0:
+                    break
+                offset += n
+                remaining -= n
+                sent += n
+        else:
+            for chunk in body:
+                os.write(sink, chunk)
+                sent += len(chunk)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return sent
+
+
+def run(mode, size_mb, repeat):
+    folder = Path(tempfile.mkdtemp())
+
+    class BenchConfig(Config):
+        UPLOAD_FOLDER = folder
+        DOWNLOAD_MODE = mode
+        RATELIMIT_ENABLED = False
+
+    try:
+        app = create_app(BenchConfig)
+        file_id = str(uuid.uuid4())
+        block = os.urandom(1024 * 1024)
+        with open(folder / file_id, 'wb') as f:
+            for _ in range(size_mb):
+                f.write(block)
+
+        sink = os.open(os.devnull, os.O_WRONLY)
+        url = f'/api/files/files/{file_id}'
+        serve(app, url, mode, sink)  # warm the page cache
+
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        total = sum(serve(app, url, mode, sink) for _ in range(repeat))
+        cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+        os.close(sink)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    gb = total / (1024 ** 3)
+    print(f"{mode:>8}: {gb:.2f} GB in {wall:.2f}s wall, "
+          f"{cpu / gb:.3f} CPU s/GB, {gb / wall:.2f} GB/s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark download CPU cost per GB')
+    parser.add_argument('--size-mb', type=int, default=256, help='Size of the test file in MB')
+    parser.add_argument('--repeat', type=int, default=8, help='Downloads per mode')
+    parser.add_argument('--mode', choices=('stream', 'sendfile'), action='append',
+                        help='Modes to run (default: both)')
+    args = parser.parse_args()
+
+    for mode in args.mode or ['stream', 'sendfile']:
+        run(mode, args.size_mb, args.repeat)
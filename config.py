@@ -11,21 +11,129 @@ class Config:
     # Maximum file size for regular upload (5GB)
     MAX_CONTENT_LENGTH = 5 * 1024 * 1024 * 1024
     
+    # Request bodies sent with Content-Encoding: gzip or deflate are decoded
+    # as they stream in; MAX_CONTENT_LENGTH applies to the decoded size, and
+    # bodies that expand more than this many times are rejected with 413
+    UPLOAD_MAX_COMPRESSION_RATIO = 200
+    
     # Chunk size for streaming (1MB)
     CHUNK_SIZE = 1024 * 1024
     
+    # Chunked uploads: 'offset' writes each chunk in place into a preallocated
+    # file, 'chunks' stores chunk files and concatenates them at the end
+    CHUNKED_UPLOAD_MODE = 'offset'
+    
+    # Assemble completed chunked uploads in a background thread pool and
+    # answer the last chunk with 202; poll /upload/<identifier>/status
+    ASYNC_ASSEMBLY = True
+    ASSEMBLY_WORKERS = 2
+    
+    # Download body: 'sendfile' hands files to the server's wsgi.file_wrapper
+    # (zero-copy where supported), 'stream' reads them through Python
+    DOWNLOAD_MODE = 'sendfile'
+    
+    # Threads running request handlers and file reads in the asyncio
+    # serving mode (asgi.py); streams wait on the event loop, not a thread
+    ASYNC_WORKER_THREADS = 64
+    
+    # Bandwidth shaping in bytes per second (None = unlimited), enforced per
+    # worker process. BANDWIDTH_TOTAL is split between active transfers in
+    # proportion to their weight.
+    BANDWIDTH_PER_CLIENT = None
+    BANDWIDTH_PER_FILE = None
+    BANDWIDTH_TOTAL = None
+    BANDWIDTH_DOWNLOAD_WEIGHT = 1
+    BANDWIDTH_UPLOAD_WEIGHT = 1
+    
+    # Maximum number of byte ranges honoured in a single Range request
+    MAX_RANGES = 16
+    
+    # Content-type detection: bytes sniffed from the head of an upload
+    # and number of (inode, mtime, size) results cached per worker
+    MIME_SNIFF_SIZE = 8 * 1024
+    MIME_CACHE_SIZE = 4096
+    
+    # In-memory cache of hot files, per worker (0 disables it): files up to
+    # FILE_CACHE_MAX_FILE_SIZE are held whole, larger ones up to FILE_CACHE_HEAD_SIZE
+    FILE_CACHE_BYTES = 64 * 1024 * 1024
+    FILE_CACHE_MAX_FILE_SIZE = 256 * 1024
+    FILE_CACHE_HEAD_SIZE = 64 * 1024
+    
+    # Compress downloads of text-like files for clients that accept it (gzip,
+    # and br if brotli is installed). Compressed variants of stored files are
+    # built once in the background and then served like the files themselves.
+    COMPRESSION_ENABLED = True
+    COMPRESSION_MIN_SIZE = 1024
+    COMPRESSIBLE_TYPES = {'application/json', 'application/x-ipynb+json', 'application/xml',
+                          'application/javascript', 'image/svg+xml'}
+    COMPRESSION_WORKERS = 1
+    
+    # Upload admission: the declared size of an upload is reserved when it
+    # starts (a body of unknown length, as it is read). Uploads that would not leave DISK_FREE_RESERVE bytes free, or
+    # would take a client (by address) past CLIENT_QUOTA stored plus reserved
+    # bytes (None = no quota), get 507, or 429 with ADMISSION_RETRY_AFTER if
+    # they would fit once uploads in progress finish. Reservations of uploads
+    # idle for RESERVATION_TTL seconds lapse.
+    DISK_FREE_RESERVE = 1024 * 1024 * 1024
+    CLIENT_QUOTA = None
+    RESERVATION_TTL = 60 * 60
+    ADMISSION_RETRY_AFTER = 30
+    
+    # Upload sessions idle for UPLOAD_SESSION_TTL seconds are expired and their
+    # data in temp/ deleted by a janitor, which every worker runs each
+    # JANITOR_INTERVAL seconds (0 = only with `run_server.py gc`). It deletes
+    # JANITOR_BATCH_SIZE files at a time, pausing JANITOR_BATCH_PAUSE seconds.
+    # Uploads still assembling after ASSEMBLY_TIMEOUT seconds (e.g. their
+    # worker died) are marked failed: the next chunk sent retries them.
+    UPLOAD_SESSION_TTL = 24 * 60 * 60
+    ASSEMBLY_TIMEOUT = 60 * 60
+    JANITOR_INTERVAL = 15 * 60
+    JANITOR_BATCH_SIZE = 500
+    JANITOR_BATCH_PAUSE = 0.05
+    
+    # Metadata catalog (defaults to UPLOAD_FOLDER/meta/catalog.db)
+    CATALOG_PATH = None
+    
+    # Pagination for file listings
+    FILE_LIST_PAGE_SIZE = 100
+    FILE_LIST_MAX_PAGE_SIZE = 1000
+    
     # Rate limiting configuration
     RATELIMIT_DEFAULT = "100 per minute"
-    RATELIMIT_STORAGE_URL = "memory://"
+    
+    # Chunk requests (POST /upload/chunked, PATCH /uploads/<id>) draw on a
+    # budget of their own, charged one unit per started RATELIMIT_CHUNK_COST_BYTES
+    RATELIMIT_CHUNKS = "2000 per minute"
+    RATELIMIT_CHUNK_COST_BYTES = 1024 * 1024
+    
+    # Counter storage shared by all workers on the host (defaults to
+    # sqlite:// at UPLOAD_FOLDER/meta/ratelimit.db); "memory://" is per worker
+    RATELIMIT_STORAGE_URL = None
     
     # Secret key for session management
     SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-key-change-in-production')
 
     @staticmethod
     def init_app(app):
+        upload_folder = app.config['UPLOAD_FOLDER']
+        
         # Create upload directory if it doesn't exist
-        os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
+        os.makedirs(upload_folder, exist_ok=True)
         
         # Create temp directory for chunked uploads
-        temp_dir = Config.UPLOAD_FOLDER / "temp"
+        temp_dir = upload_folder / "temp"
         os.makedirs(temp_dir, exist_ok=True)
+        
+        # Staging area for new uploads and the content-addressed object store
+        os.makedirs(upload_folder / "incoming", exist_ok=True)
+        os.makedirs(upload_folder / "objects", exist_ok=True)
+        os.makedirs(upload_folder / "variants", exist_ok=True)
+        os.makedirs(upload_folder / "meta", exist_ok=True)
+        
+        # Keep the catalog next to the files it describes
+        if not app.config['CATALOG_PATH']:
+            app.config['CATALOG_PATH'] = upload_folder / "meta" / "catalog.db"
+        
+        # Rate-limit counters shared by every worker on this host
+        if not app.config['RATELIMIT_STORAGE_URL']:
+            app.config['RATELIMIT_STORAGE_URL'] = f"sqlite:///{upload_folder / 'meta' / 'ratelimit.db'}"
@@ -9,13 +9,26 @@ fi
 FILE_PATH="$1"
 FILENAME=$(basename "$FILE_PATH")
 FILE_SIZE=$(stat -f%z "$FILE_PATH")
+FILE_MTIME=$(stat -f%m "$FILE_PATH")
 
 # Default chunk size is 256KB unless specified
 CHUNK_SIZE_KB=${2:-256}
 CHUNK_SIZE=$((CHUNK_SIZE_KB * 1024))
 
-# Generate a unique identifier
-IDENTIFIER=$(uuidgen)
+# Use a random identifier, so files sharing a name and size never collide on the server.
+# It is kept in <file>.upload until the upload completes, so rerunning on the unchanged file resumes it.
+STATE_FILE="$FILE_PATH.upload"
+IDENTIFIER=""
+if [ -f "$STATE_FILE" ]; then
+  read -r saved_identifier saved_size saved_mtime < "$STATE_FILE"
+  if [ "$saved_size" = "$FILE_SIZE" ] && [ "$saved_mtime" = "$FILE_MTIME" ]; then
+    IDENTIFIER="$saved_identifier"
+  fi
+fi
+if [ -z "$IDENTIFIER" ]; then
+  IDENTIFIER=$(od -An -tx1 -N16 /dev/urandom | tr -d ' \n')
+  echo "$IDENTIFIER $FILE_SIZE $FILE_MTIME" > "$STATE_FILE"
+fi
 
 # Calculate number of chunks
 TOTAL_CHUNKS=$(( (FILE_SIZE + CHUNK_SIZE - 1) / CHUNK_SIZE ))
@@ -49,11 +62,25 @@ function show_progress {
     printf "] %3d%% %s/%s" $percentage "$human_uploaded" "$human_total"
 }
 
+# Ask the server once for every chunk it already holds, as a range list like "1-5,7"
+declare -A RECEIVED
+RECEIVED_RANGES=$(curl -s "http://localhost:8080/api/files/upload/$IDENTIFIER/chunks" | sed -n 's/.*"received": *"\([0-9,-]*\)".*/\1/p')
+for range in ${RECEIVED_RANGES//,/ }; do
+  start=${range%-*}
+  end=${range#*-}
+  for ((n=start; n<=end; n++)); do
+    RECEIVED[$n]=1
+  done
+done
+
 # Function to check if a chunk exists
 check_chunk() {
   local chunk_number=$1
-  local response=$(curl -s -o /dev/null -w "%{http_code}" "$API_URL?flowChunkNumber=$chunk_number&flowTotalChunks=$TOTAL_CHUNKS&flowChunkSize=$CHUNK_SIZE&flowTotalSize=$FILE_SIZE&flowIdentifier=$IDENTIFIER&flowFilename=$FILENAME")
-  echo $response
+  if [ -n "${RECEIVED[$chunk_number]}" ]; then
+    echo 200
+  else
+    echo 204
+  fi
 }
 
 # Initialize progress variables
@@ -91,6 +118,9 @@ for ((chunk_number=1; chunk_number<=TOTAL_CHUNKS; chunk_number++)); do
   # Extract the chunk to a temporary file
   dd if="$FILE_PATH" of=temp_chunk bs=1 skip=$start_pos count=$actual_chunk_size status=none
   
+  # Checksum of the chunk, verified by the server
+  chunk_checksum=$(sha256sum temp_chunk | cut -d' ' -f1)
+  
   # Upload the chunk
   response=$(curl -s -o curl_response.json -w "%{http_code}" \
     -F "flowChunkNumber=$chunk_number" \
@@ -99,6 +129,7 @@ for ((chunk_number=1; chunk_number<=TOTAL_CHUNKS; chunk_number++)); do
     -F "flowTotalSize=$FILE_SIZE" \
     -F "flowIdentifier=$IDENTIFIER" \
     -F "flowFilename=$FILENAME" \
+    -F "flowChunkChecksum=$chunk_checksum" \
     -F "file=@temp_chunk" \
     "$API_URL")
   
@@ -109,13 +140,28 @@ for ((chunk_number=1; chunk_number<=TOTAL_CHUNKS; chunk_number++)); do
   BYTES_UPLOADED=$((BYTES_UPLOADED + actual_chunk_size))
   show_progress $chunk_number $TOTAL_CHUNKS $BYTES_UPLOADED $FILE_SIZE
   
-  if [ "$response" = "200" ] || [ "$response" = "201" ]; then
+  if [ "$response" = "200" ] || [ "$response" = "201" ] || [ "$response" = "202" ]; then
     echo -e "\nChunk $chunk_number uploaded successfully"
     
     # Check if this is the last chunk
     if [ $chunk_number -eq $TOTAL_CHUNKS ]; then
       echo -e "\nAll chunks uploaded successfully!"
       cat curl_response.json
+      
+      # The server assembles the file in the background; poll until it is done
+      STATUS_URL="http://localhost:8080/api/files/upload/$IDENTIFIER/status"
+      if [ "$response" = "202" ]; then
+        while curl -s "$STATUS_URL" | grep -q '"status": "assembling"'; do
+          sleep 1
+        done
+        echo -e "\nAssembly finished:"
+        curl -s "$STATUS_URL"
+      fi
+      
+      # A stored upload cannot be resumed; the next run starts a new one
+      if curl -s "$STATUS_URL" | grep -q '"status": "complete"'; then
+        rm -f "$STATE_FILE"
+      fi
     fi
   else
     echo -e "\nChunk $chunk_number upload failed with code $response"
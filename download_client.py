@@ -0,0 +1,222 @@
+"""Parallel segmented download client for the streaming file server.
+
+A file is split into byte ranges that worker threads fetch concurrently
+over one requests.Session and write with pwrite into a preallocated
+<output>.part file. Finished segments are recorded in a small
+<output>.download state file, so an interrupted download resumes where it
+stopped. The result is checked against the server's SHA-256 before it is
+moved into place.
+"""
+import os
+import json
+import time
+import base64
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+
+DEFAULT_URL = "http://localhost:8080/api/files"
+
+# Bounds for automatic segment sizing
+MIN_SEGMENT_SIZE = 4 * 1024 * 1024
+MAX_SEGMENT_SIZE = 64 * 1024 * 1024
+
+# Read buffer for response bodies
+BUFFER_SIZE = 1024 * 1024
+
+# Responses worth retrying: rate limiting and server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class DownloadError(Exception):
+    """Raised when a download cannot be completed or fails verification."""
+
+
+def choose_segment_size(file_size, workers):
+    """Pick a segment size giving each worker about four segments, within the bounds."""
+    target = max(file_size // (workers * 4), 1)
+    size = 1 << (target - 1).bit_length()
+    return min(max(size, MIN_SEGMENT_SIZE), MAX_SEGMENT_SIZE)
+
+
+def expected_checksum(headers):
+    """The SHA-256 the server advertises for a file, from Digest or a checksum ETag."""
+    for item in headers.get('Digest', '').split(','):
+        name, _, value = item.strip().partition('=')
+        if name.lower() == 'sha-256':
+            return base64.b64decode(value).hex()
+    etag = headers.get('ETag', '').strip('"')
+    if len(etag) == 64 and all(c in '0123456789abcdef' for c in etag):
+        return etag
+    return None
+
+
+class DownloadState:
+    """Segments already written, persisted next to the partial file."""
+
+    def __init__(self, path, file_id, etag, size, segment_size):
+        self.path = path
+        self.file_id = file_id
+        self.etag = etag
+        self.size = size
+        self.segment_size = segment_size
+        self.done = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path, file_id, etag, size):
+        """Load the state of an earlier attempt at the same file version, or None."""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if (data.get('file_id'), data.get('etag'), data.get('size')) != (file_id, etag, size):
+            return None
+        state = cls(path, file_id, etag, size, data['segment_size'])
+        state.done = set(data['done'])
+        return state
+
+    def mark_done(self, index):
+        """Record a finished segment; the file is replaced atomically."""
+        with self._lock:
+            self.done.add(index)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({
+                    'file_id': self.file_id,
+                    'etag': self.etag,
+                    'size': self.size,
+                    'segment_size': self.segment_size,
+                    'done': sorted(self.done)
+                }, f)
+            os.replace(tmp_path, self.path)
+
+    def remove(self):
+        for path in (self.path, f"{self.path}.tmp"):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class SegmentedDownloadClient:
+    """Downloads files as concurrent byte ranges with resume and verification."""
+
+    def __init__(self, base_url=DEFAULT_URL, workers=4, segment_size=None, buffer_size=BUFFER_SIZE,
+                 max_retries=5, backoff=0.5, session=None):
+        self.base_url = base_url.rstrip('/')
+        self.workers = workers
+        self.segment_size = segment_size
+        self.buffer_size = buffer_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = session or requests.Session()
+        # Segments are byte ranges of the stored file, not of a compressed variant
+        self.session.headers['Accept-Encoding'] = 'identity'
+        # One pooled keep-alive connection per worker
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def download(self, file_id, output_path=None):
+        """Download a file and return the path it was saved to."""
+        url = f"{self.base_url}/files/{file_id}"
+        head = self.session.head(url)
+        if head.status_code != 200:
+            raise DownloadError(f"File {file_id} not available: {head.status_code}")
+
+        size = int(head.headers['Content-Length'])
+        etag = head.headers.get('ETag')
+        if not output_path:
+            disposition = head.headers.get('Content-Disposition', '')
+            output_path = disposition.split('filename=')[1].strip('"\'') if 'filename=' in disposition \
+                else f"downloaded_{file_id}"
+        part_path = f"{output_path}.part"
+
+        # Resume only if the partial file belongs to the same version of the file
+        state = DownloadState.load(f"{output_path}.download", file_id, etag, size)
+        if state is None or not os.path.exists(part_path):
+            segment_size = self.segment_size or choose_segment_size(size, self.workers)
+            state = DownloadState(f"{output_path}.download", file_id, etag, size, segment_size)
+            with open(part_path, 'wb') as f:
+                f.truncate(size)
+        segments = [(i, start, min(start + state.segment_size, size))
+                    for i, start in enumerate(range(0, size, state.segment_size))]
+        pending = [segment for segment in segments if segment[0] not in state.done]
+        print(f"Downloading {os.path.basename(output_path)} ({size} bytes): {len(pending)} of "
+              f"{len(segments)} segments with {self.workers} workers")
+
+        fd = os.open(part_path, os.O_WRONLY)
+        try:
+            lock = threading.Lock()
+            with tqdm(total=size, unit='B', unit_scale=True, desc="Total Download") as pbar:
+                pbar.update(size - sum(end - start for _, start, end in pending))
+
+                def on_progress(length):
+                    with lock:
+                        pbar.update(length)
+
+                with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                    futures = [pool.submit(self._fetch_segment, url, etag, fd, segment, on_progress)
+                               for segment in pending]
+                    for future in as_completed(futures):
+                        state.mark_done(future.result())
+        finally:
+            os.close(fd)
+
+        checksum = expected_checksum(head.headers)
+        if checksum and self._hash_file(part_path) != checksum:
+            os.remove(part_path)
+            state.remove()
+            raise DownloadError(f"Checksum mismatch for {file_id}; partial data discarded")
+
+        os.replace(part_path, output_path)
+        state.remove()
+        return output_path
+
+    def _fetch_segment(self, url, etag, fd, segment, on_progress):
+        """Fetch one byte range into place, retrying with exponential backoff and jitter."""
+        index, start, end = segment
+        headers = {'Range': f'bytes={start}-{end - 1}'}
+        if etag:
+            # A changed file answers with 200 instead of a mismatched range
+            headers['If-Range'] = etag
+
+        for attempt in range(self.max_retries + 1):
+            delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+            written = 0
+            try:
+                with self.session.get(url, headers=headers, stream=True) as response:
+                    if response.status_code == 206:
+                        for block in response.iter_content(chunk_size=self.buffer_size):
+                            os.pwrite(fd, block, start + written)
+                            written += len(block)
+                            on_progress(len(block))
+                        if written == end - start:
+                            return index
+                        error = f"short segment ({written} of {end - start} bytes)"
+                    elif response.status_code == 200:
+                        raise DownloadError("File changed on the server during the download")
+                    else:
+                        error = f"{response.status_code} {response.text.strip()}"
+                        if response.status_code not in RETRY_STATUSES:
+                            break
+                        if response.headers.get('Retry-After', '').isdigit():
+                            delay = int(response.headers['Retry-After'])
+            except requests.RequestException as e:
+                error = str(e)
+            on_progress(-written)
+            if attempt < self.max_retries:
+                time.sleep(delay)
+
+        raise DownloadError(f"Segment {index} (bytes {start}-{end - 1}) failed: {error}")
+
+    def _hash_file(self, path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(self.buffer_size), b''):
+                digest.update(block)
+        return digest.hexdigest()
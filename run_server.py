@@ -1,10 +1,57 @@
 #!/usr/bin/env python3
 import os
+import sys
+import argparse
 from pathlib import Path
 from app import create_app
 from config import Config
+from services.migration import migrate_legacy_files
+
+def collect_garbage(ttl=None):
+    """Expire abandoned uploads once and report the space reclaimed."""
+    app = create_app()
+    janitor = app.extensions['janitor']
+    if ttl is not None:
+        janitor.ttl = ttl
+    report = janitor.sweep()
+    if report is None:
+        print("Another process is already sweeping")
+        return 1
+    print(f"Expired {report['expired_sessions']} upload sessions, failed {report['stalled_assemblies']} stalled "
+          f"assemblies, removed {report['removed_dirs']} "
+          f"directories ({report['removed_files']} files) and reclaimed {report['reclaimed_bytes']} bytes "
+          f"in {report['duration']}s")
+    return 0
+
+def migrate(batch_size, pause, limit=None):
+    """Move files stored flat in UPLOAD_FOLDER into the sharded object store."""
+    app = create_app()
+    report = migrate_legacy_files(
+        app.extensions['catalog'], app.extensions['blobs'], app.config['UPLOAD_FOLDER'],
+        app.config['CHUNK_SIZE'], batch_size=batch_size, pause=pause, limit=limit)
+    print(f"Migrated {report['migrated']} files ({report['bytes']} bytes, {report['deduplicated']} deduplicated); "
+          f"{report['missing']} catalogued files were not found")
+    return 0
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the streaming file server')
+    commands = parser.add_subparsers(dest='command')
+    gc_parser = commands.add_parser('gc', help='Expire abandoned uploads and delete their data, then exit')
+    gc_parser.add_argument('--ttl', type=int, help='Idle seconds after which an upload expires '
+                                                   '(default: UPLOAD_SESSION_TTL)')
+    migrate_parser = commands.add_parser(
+        'migrate', help='Move files from before the object store into objects/<aa>/<bb>/, then exit; '
+                        'safe to run while the server is serving')
+    migrate_parser.add_argument('--batch-size', type=int, default=100, help='Files moved per batch')
+    migrate_parser.add_argument('--pause', type=float, default=0.1, help='Seconds to wait between batches')
+    migrate_parser.add_argument('--limit', type=int, help='Stop after this many files (run again to continue)')
+    args = parser.parse_args()
+    
+    if args.command == 'gc':
+        sys.exit(collect_garbage(args.ttl))
+    if args.command == 'migrate':
+        sys.exit(migrate(args.batch_size, args.pause, args.limit))
+    
     # Make sure the upload directory exists
     os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
     
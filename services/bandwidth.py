@@ -0,0 +1,168 @@
+import io
+import time
+import logging
+import threading
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Idle buckets are swept once every this many opened transfers
+SWEEP_INTERVAL = 256
+
+
+class TokenBucket:
+    """Byte budget refilled at rate bytes/s, holding at most burst bytes.
+
+    consume() charges the bytes immediately, possibly into debt, and
+    returns how long the caller must pause to pay it back. That keeps the
+    hot loop to one lock and a little arithmetic per block.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def is_full(self):
+        """Whether the bucket has refilled completely, i.e. is as good as a new one."""
+        return self.tokens + (time.monotonic() - self.stamp) * self.rate >= self.burst
+
+    def consume(self, n, rate=None):
+        """Charge n bytes (at rate, if given, instead of the bucket's own). Returns seconds to wait."""
+        rate = rate or self.rate
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * rate)
+            self.stamp = now
+            self.tokens -= n
+            return -self.tokens / rate if self.tokens < 0 else 0.0
+
+
+class Transfer:
+    """One active upload or download stream and the buckets it draws on."""
+
+    def __init__(self, shaper, keys, buckets, weight):
+        self.shaper = shaper
+        self.keys = keys
+        self.buckets = buckets
+        self.weight = weight
+        # The stream's own share of the total rate
+        self.fair = TokenBucket(shaper.total_rate) if shaper.total_rate else None
+        self.closed = False
+
+    def throttle(self, n):
+        """Account for n bytes moved and sleep as long as the tightest limit requires."""
+        delay = 0.0
+        for bucket in self.buckets:
+            delay = max(delay, bucket.consume(n))
+        if self.fair:
+            delay = max(delay, self.fair.consume(n, self.shaper.fair_rate(self.weight)))
+        if delay:
+            time.sleep(delay)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.shaper.release(self)
+
+
+class ShapedInput(io.RawIOBase):
+    """A request body stream that is throttled as it is read."""
+
+    def __init__(self, stream, transfer):
+        self._stream = stream
+        self._transfer = transfer
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._stream.read(len(b))
+        n = len(data)
+        b[:n] = data
+        if n:
+            self._transfer.throttle(n)
+        return n
+
+
+class BandwidthShaper:
+    """Token-bucket bandwidth limits per client and per file, and weighted fair sharing.
+
+    Each transfer draws on the bucket of its client and of its file; all
+    transfers of a client (or of a file) share those buckets. With a total
+    rate, every active transfer is also held to its weighted share of it:
+    total_rate * weight / (sum of the weights of active transfers).
+    Limits are kept per worker process.
+    """
+
+    def __init__(self, per_client=None, per_file=None, total_rate=None, weights=None):
+        self.per_client = per_client
+        self.per_file = per_file
+        self.total_rate = total_rate
+        self.weights = weights or {}
+        self._buckets = {}
+        self._active_weight = 0
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.per_client or self.per_file or self.total_rate)
+
+    def fair_rate(self, weight):
+        """Current share of the total rate for a transfer of the given weight."""
+        return self.total_rate * weight / max(self._active_weight, weight)
+
+    def open(self, client, file_key=None, kind='download'):
+        """Register an active transfer."""
+        keys = []
+        if self.per_client and client:
+            keys.append(('client', client, self.per_client))
+        if self.per_file and file_key:
+            keys.append(('file', file_key, self.per_file))
+        weight = self.weights.get(kind, 1)
+
+        with self._lock:
+            buckets = []
+            for scope, key, rate in keys:
+                entry = self._buckets.get((scope, key))
+                if entry is None:
+                    entry = self._buckets[(scope, key)] = [TokenBucket(rate), 0]
+                entry[1] += 1
+                buckets.append(entry[0])
+            self._active_weight += weight
+            self._opened += 1
+            if self._opened % SWEEP_INTERVAL == 0:
+                self._sweep()
+        return Transfer(self, [(scope, key) for scope, key, _ in keys], buckets, weight)
+
+    def release(self, transfer):
+        """Unregister a finished transfer.
+
+        Its buckets are kept: a client sending one chunk request after
+        another must not get a fresh burst with each of them.
+        """
+        with self._lock:
+            self._active_weight -= transfer.weight
+            for key in transfer.keys:
+                self._buckets[key][1] -= 1
+
+    def _sweep(self):
+        """Drop buckets no transfer uses that have refilled completely."""
+        for key, (bucket, users) in list(self._buckets.items()):
+            if users == 0 and bucket.is_full():
+                del self._buckets[key]
+
+    @staticmethod
+    def shape(body, transfer):
+        """Throttle an iterable response body block by block."""
+        try:
+            for block in body:
+                transfer.throttle(len(block))
+                yield block
+        finally:
+            transfer.close()
+            if hasattr(body, 'close'):
+                body.close()
@@ -0,0 +1,112 @@
+import os
+import uuid
+import shutil
+import hashlib
+import logging
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+
+class BlobStore:
+    """Content-addressed object storage.
+
+    Each distinct content is stored once as objects/<aa>/<bb>/<sha256>.
+    Reference counts live in the catalog; this class only moves bytes.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path_for(self, checksum):
+        """Location of the object with the given SHA-256."""
+        return self.root / checksum[:2] / checksum[2:4] / checksum
+
+    def put(self, src_path, checksum):
+        """Move a fully written file into the store under its checksum."""
+        dest = self.path_for(checksum)
+        os.makedirs(dest.parent, exist_ok=True)
+        os.replace(src_path, dest)
+        return dest
+
+    def link(self, src_path, checksum):
+        """Add a file to the store under its checksum while keeping it at its current path.
+
+        A hard link where possible, else a copy; either way the object
+        appears under its final name only once complete.
+        """
+        dest = self.path_for(checksum)
+        os.makedirs(dest.parent, exist_ok=True)
+        tmp_path = dest.parent / f".{checksum}.{uuid.uuid4().hex}"
+        try:
+            os.link(src_path, tmp_path)
+        except OSError:
+            shutil.copy2(src_path, tmp_path)
+        os.replace(tmp_path, dest)
+        return dest
+
+    def delete(self, checksum):
+        """Remove an object whose last reference was dropped."""
+        try:
+            os.remove(self.path_for(checksum))
+            logger.info(f"Blob deleted: {checksum}")
+        except FileNotFoundError:
+            pass
+
+
+class ChunkIndexer:
+    """Hashes the chunks of a file as it streams past, for the chunk index.
+
+    The file is cut into chunk_size slices, the last one short. flow.js
+    cuts the same file into floor(size / chunk_size) chunks instead, its
+    last chunk taking the remainder, so that chunk is hashed as well:
+    uploads of either layout can then reuse each other's chunks. chunks
+    lists (SHA-256, offset, length) entries once finish() is called.
+    """
+
+    def __init__(self, chunk_size, size):
+        self.chunk_size = chunk_size
+        full_chunks = size // chunk_size
+        self.tail_offset = (full_chunks - 1) * chunk_size if full_chunks and size % chunk_size else None
+        self.size = size
+        self.chunks = []
+        self._position = 0
+        self._start = 0
+        self._slice = hashlib.sha256()
+        self._tail = hashlib.sha256() if self.tail_offset is not None else None
+
+    def update(self, block):
+        view = memoryview(block)
+        while view:
+            # Parts never cross a slice boundary, and the flow.js last chunk starts on one
+            part = view[:self._start + self.chunk_size - self._position]
+            self._slice.update(part)
+            if self._tail is not None and self._position >= self.tail_offset:
+                self._tail.update(part)
+            self._position += len(part)
+            view = view[len(part):]
+            if self._position == self._start + self.chunk_size:
+                self.chunks.append((self._slice.hexdigest(), self._start, self.chunk_size))
+                self._slice, self._start = hashlib.sha256(), self._position
+
+    def finish(self):
+        if self._position > self._start:
+            self.chunks.append((self._slice.hexdigest(), self._start, self._position - self._start))
+        if self._tail is not None:
+            self.chunks.append((self._tail.hexdigest(), self.tail_offset, self.size - self.tail_offset))
+        return self.chunks
+
+
+def hash_file(file_path, buffer_size, chunk_size=None):
+    """SHA-256 of a file, plus its chunk index entries (see ChunkIndexer) if chunk_size is given.
+
+    Both come from the same read pass.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        indexer = ChunkIndexer(chunk_size, os.fstat(f.fileno()).st_size) if chunk_size else None
+        for block in iter(lambda: f.read(buffer_size), b''):
+            digest.update(block)
+            if indexer:
+                indexer.update(block)
+    return digest.hexdigest(), indexer.finish() if indexer else []
@@ -0,0 +1,112 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Bytes charged per entry on top of its data, for the stat result and bookkeeping
+ENTRY_OVERHEAD = 512
+
+
+class CachedFile:
+    """What the cache keeps of a stored file: its location, stat result and leading bytes."""
+
+    __slots__ = ('path', 'stat', 'data')
+
+    def __init__(self, path, stat, data=b''):
+        self.path = path
+        self.stat = stat
+        self.data = data
+
+    @property
+    def complete(self):
+        """Whether the whole file is held in memory."""
+        return len(self.data) == self.stat.st_size
+
+    @property
+    def cost(self):
+        return len(self.data) + ENTRY_OVERHEAD
+
+
+class FileCache:
+    """Byte-budgeted LRU cache of hot stored files, shared by all requests of a worker.
+
+    Entries are keyed by content checksum. Small files are held whole,
+    larger ones only up to head_size bytes. An object never changes under
+    its checksum, so an entry only goes stale when its blob is deleted,
+    which invalidate() handles; a file id that is uploaded again simply
+    points at a different checksum.
+    """
+
+    def __init__(self, max_bytes, max_file_size, head_size):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.head_size = head_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def get(self, key):
+        """Return the entry for a checksum, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def load(self, key, path, stat):
+        """Read a file (or its head, if it is large) into the cache and return the entry."""
+        length = stat.st_size if stat.st_size <= self.max_file_size else min(self.head_size, stat.st_size)
+        with open(path, 'rb') as f:
+            data = f.read(length)
+        entry = CachedFile(path, stat, data)
+        if entry.cost <= self.max_bytes:
+            self._put(key, entry)
+        return entry
+
+    def _put(self, key, entry):
+        """Store an entry, evicting the least recently used ones until it fits."""
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old.cost
+            self._entries[key] = entry
+            self.size += entry.cost
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted.cost
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Forget a checksum whose blob was deleted."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry.cost
+
+    def stats(self):
+        """Hit/miss counters and occupancy of this worker's cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'pid': os.getpid(),
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,575 @@
+import os
+import json
+import time
+import base64
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timezone
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    content_type TEXT NOT NULL,
+    upload_date REAL NOT NULL,
+    checksum TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_files_upload_date ON files (upload_date, id);
+CREATE INDEX IF NOT EXISTS idx_files_filename ON files (filename, id);
+CREATE INDEX IF NOT EXISTS idx_files_size ON files (size, id);
+CREATE INDEX IF NOT EXISTS idx_files_content_type ON files (content_type, upload_date, id);
+CREATE INDEX IF NOT EXISTS idx_files_legacy ON files (id) WHERE checksum IS NULL;
+CREATE TABLE IF NOT EXISTS uploads (
+    identifier TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    state TEXT NOT NULL,
+    file_id TEXT,
+    error TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_uploads_updated_at ON uploads (updated_at);
+CREATE TABLE IF NOT EXISTS upload_chunks (
+    identifier TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    PRIMARY KEY (identifier, number)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS blobs (
+    checksum TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    content_type TEXT NOT NULL,
+    refcount INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    hash TEXT PRIMARY KEY,
+    checksum TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_checksum ON chunks (checksum);
+CREATE TABLE IF NOT EXISTS reservations (
+    identifier TEXT PRIMARY KEY,
+    client TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    allocated INTEGER NOT NULL DEFAULT 0,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_reservations_client ON reservations (client);
+"""
+
+# Columns added to existing tables after their first release: (table, column, definition)
+MIGRATIONS = [
+    ('uploads', 'total_chunks', 'INTEGER'),
+    ('uploads', 'chunk_size', 'INTEGER'),
+    ('uploads', 'total_size', 'INTEGER'),
+    ('uploads', 'client', 'TEXT'),
+    ('uploads', 'received_count', 'INTEGER NOT NULL DEFAULT 0'),
+    ('files', 'client', 'TEXT'),
+]
+
+# Indexes on migrated columns, created once the columns exist
+MIGRATED_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_files_client ON files (client);
+"""
+
+# Columns a listing may be sorted by
+SORT_COLUMNS = ('upload_date', 'filename', 'size')
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+def encode_cursor(value, file_id):
+    """Encode the sort key of the last row of a page as an opaque cursor."""
+    raw = json.dumps([value, file_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor()."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, file_id = json.loads(raw)
+        return value, file_id
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+
+class AdmissionRefused(Exception):
+    """Raised when an upload does not fit the free disk space or its client's quota.
+
+    transient is True when it would fit once uploads already admitted
+    finish, so the client should retry later rather than give up.
+    """
+
+    def __init__(self, message, transient=False):
+        super().__init__(message)
+        self.transient = transient
+
+
+class FileCatalog:
+    """SQLite-backed index of stored files.
+
+    Rows are written once when a file is stored or deleted, so listing and
+    lookups never have to scan UPLOAD_FOLDER or sniff file contents.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self.created = not os.path.exists(self.db_path)
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            self._migrate(conn)
+            conn.executescript(MIGRATED_INDEXES)
+
+    def _connect(self):
+        """Return the connection owned by the current thread and process."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _migrate(conn):
+        """Add columns missing from tables created by an older version."""
+        for table, column, definition in MIGRATIONS:
+            columns = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+            if column not in columns:
+                try:
+                    conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+                except sqlite3.OperationalError:
+                    pass  # Added concurrently by another worker
+
+    @staticmethod
+    def _to_dict(row):
+        record = dict(row)
+        record['upload_date'] = datetime.fromtimestamp(record['upload_date'], tz=timezone.utc)
+        return record
+
+    def add_file(self, file_id, filename, size, content_type, checksum, store_blob,
+                 chunks=(), client=None):
+        """Record a file and take a reference on the blob holding its content.
+
+        store_blob() is called only if no blob with this checksum exists
+        yet. It runs inside the write transaction, so a concurrent delete of
+        the same content cannot interleave. A new blob's chunks, given as
+        (SHA-256, offset, length) entries, are indexed. Returns True if the
+        content was already stored (the caller then discards its copy).
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            existing = self._take_blob(conn, checksum, size, content_type, store_blob, chunks)
+            conn.execute(
+                'INSERT INTO files (id, filename, size, content_type, upload_date, checksum, client) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (file_id, filename, size, content_type, time.time(), checksum, client))
+        return existing
+
+    @staticmethod
+    def _take_blob(conn, checksum, size, content_type, store_blob, chunks=()):
+        """Reference the blob of checksum, storing it first if it is new. Returns True if it existed."""
+        if conn.execute('UPDATE blobs SET refcount = refcount + 1 WHERE checksum = ?', (checksum,)).rowcount:
+            return True
+        store_blob()
+        conn.execute(
+            'INSERT INTO blobs (checksum, size, content_type, refcount) VALUES (?, ?, ?, 1)',
+            (checksum, size, content_type))
+        conn.executemany(
+            'INSERT OR IGNORE INTO chunks (hash, checksum, offset, length) VALUES (?, ?, ?, ?)',
+            [(chunk_hash, checksum, offset, length) for chunk_hash, offset, length in chunks])
+        return False
+
+    def legacy_files(self, limit, after=''):
+        """Files stored before the object store (no checksum), in id order after the given id."""
+        rows = self._connect().execute(
+            'SELECT * FROM files WHERE checksum IS NULL AND id > ? ORDER BY id LIMIT ?', (after, limit)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def adopt_file(self, file_id, size, checksum, store_blob):
+        """Point a file from before the object store at a blob holding its content.
+
+        Like add_file(), store_blob() only runs if the content is not
+        stored yet, inside the write transaction. Returns None if the file
+        was deleted or adopted meanwhile, else whether the content was
+        already stored.
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT content_type FROM files WHERE id = ? AND checksum IS NULL', (file_id,)).fetchone()
+            if row is None:
+                return None
+            existing = self._take_blob(conn, checksum, size, row['content_type'], store_blob)
+            conn.execute('UPDATE files SET checksum = ?, size = ? WHERE id = ?', (checksum, size, file_id))
+        return existing
+
+    def link_file(self, file_id, filename, checksum, client=None):
+        """Create a new file pointing at already stored content. Returns its record, or None."""
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            blob = conn.execute('SELECT * FROM blobs WHERE checksum = ?', (checksum,)).fetchone()
+            if blob is None:
+                return None
+            conn.execute('UPDATE blobs SET refcount = refcount + 1 WHERE checksum = ?', (checksum,))
+            conn.execute(
+                'INSERT INTO files (id, filename, size, content_type, upload_date, checksum, client) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (file_id, filename, blob['size'], blob['content_type'], time.time(), checksum, client))
+        return self.get(file_id)
+
+    def remove_file(self, file_id, delete_blob):
+        """Drop a file and its blob reference; delete_blob(checksum) runs when none are left.
+
+        Returns False if file_id is not catalogued.
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT checksum FROM files WHERE id = ?', (file_id,)).fetchone()
+            if row is None:
+                return False
+            conn.execute('DELETE FROM files WHERE id = ?', (file_id,))
+            checksum = row['checksum']
+            if checksum and conn.execute(
+                    'UPDATE blobs SET refcount = refcount - 1 WHERE checksum = ?', (checksum,)).rowcount:
+                blob = conn.execute('SELECT refcount FROM blobs WHERE checksum = ?', (checksum,)).fetchone()
+                if blob['refcount'] <= 0:
+                    conn.execute('DELETE FROM blobs WHERE checksum = ?', (checksum,))
+                    conn.execute('DELETE FROM chunks WHERE checksum = ?', (checksum,))
+                    delete_blob(checksum)
+        return True
+
+    def find_chunk(self, chunk_hash):
+        """Locate stored bytes with the given SHA-256: (checksum, offset, length) or None."""
+        row = self._connect().execute(
+            'SELECT checksum, offset, length FROM chunks WHERE hash = ?', (chunk_hash,)).fetchone()
+        return tuple(row) if row else None
+
+    def get(self, file_id):
+        """Return the record for file_id, or None if it is not catalogued."""
+        row = self._connect().execute('SELECT * FROM files WHERE id = ?', (file_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, limit=100, cursor=None, sort='upload_date', order='desc',
+             content_type=None, filename=None, min_size=None, max_size=None):
+        """Return one page of records and the cursor of the next page.
+
+        Pagination is keyset based on (sort column, id), so a page costs
+        O(limit) index reads no matter how many files are stored.
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Unsupported sort column: {sort}")
+        descending = order == 'desc'
+
+        clauses, params = [], []
+        if content_type:
+            clauses.append('content_type = ?')
+            params.append(content_type)
+        if filename:
+            escaped = filename.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            clauses.append("filename LIKE ? ESCAPE '\\'")
+            params.append(escaped + '%')
+        if min_size is not None:
+            clauses.append('size >= ?')
+            params.append(min_size)
+        if max_size is not None:
+            clauses.append('size <= ?')
+            params.append(max_size)
+        if cursor:
+            value, last_id = decode_cursor(cursor)
+            clauses.append(f"({sort}, id) {'<' if descending else '>'} (?, ?)")
+            params.extend([value, last_id])
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        direction = 'DESC' if descending else 'ASC'
+        rows = self._connect().execute(
+            f'SELECT * FROM files {where} ORDER BY {sort} {direction}, id {direction} LIMIT ?',
+            params + [limit + 1]
+        ).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][sort], rows[-1]['id'])
+        return [self._to_dict(row) for row in rows], next_cursor
+
+    def open_upload(self, identifier, filename, total_chunks, chunk_size, total_size, client=None):
+        """Register a chunked upload when its first chunk arrives."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO uploads "
+                "(identifier, filename, state, total_chunks, chunk_size, total_size, client, updated_at) "
+                "VALUES (?, ?, 'pending', ?, ?, ?, ?, ?)",
+                (identifier, filename, total_chunks, chunk_size, total_size, client, time.time())
+            )
+
+    def claim_upload(self, identifier, filename):
+        """Mark a chunked upload as assembling.
+
+        Returns True for exactly one caller per upload (a failed upload may
+        be claimed again), so only one request ever starts its assembly.
+        """
+        with self._connect() as conn:
+            return conn.execute(
+                "INSERT INTO uploads (identifier, filename, state, updated_at) "
+                "VALUES (?, ?, 'assembling', ?) "
+                "ON CONFLICT (identifier) DO UPDATE SET state = 'assembling', error = NULL, "
+                "updated_at = excluded.updated_at WHERE uploads.state IN ('pending', 'failed')",
+                (identifier, filename, time.time())
+            ).rowcount > 0
+
+    def reject_upload(self, identifier, filename, error):
+        """Mark an upload whose content is not accepted; its later chunks are refused."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO uploads (identifier, filename, state, error, updated_at) "
+                "VALUES (?, ?, 'rejected', ?, ?) "
+                "ON CONFLICT (identifier) DO UPDATE SET state = 'rejected', error = excluded.error, "
+                "updated_at = excluded.updated_at",
+                (identifier, filename, error, time.time())
+            )
+            conn.execute('DELETE FROM reservations WHERE identifier = ?', (identifier,))
+            conn.execute('DELETE FROM upload_chunks WHERE identifier = ?', (identifier,))
+
+    def cancel_upload(self, identifier):
+        """Mark an upload still receiving data as cancelled and release its reservation.
+
+        Returns False if the upload is unknown or no longer pending.
+        """
+        with self._connect() as conn:
+            cancelled = conn.execute(
+                "UPDATE uploads SET state = 'cancelled', updated_at = ? "
+                "WHERE identifier = ? AND state = 'pending'",
+                (time.time(), identifier)
+            ).rowcount > 0
+            if cancelled:
+                conn.execute('DELETE FROM reservations WHERE identifier = ?', (identifier,))
+                conn.execute('DELETE FROM upload_chunks WHERE identifier = ?', (identifier,))
+        return cancelled
+
+    def record_chunk(self, identifier, number):
+        """Count a stored chunk of an upload, once no matter how often it is sent.
+
+        Returns the number of distinct chunks received, or None if the
+        upload is not receiving chunks. The chunk's row is inserted and the
+        counter bumped in one write transaction, so concurrent requests in
+        any worker see each count exactly once and only one of them sees
+        the upload complete.
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            upload = conn.execute(
+                'SELECT state, received_count FROM uploads WHERE identifier = ?', (identifier,)).fetchone()
+            if upload is None or upload['state'] not in ('pending', 'failed'):
+                return None
+            if not conn.execute('INSERT OR IGNORE INTO upload_chunks (identifier, number) VALUES (?, ?)',
+                                (identifier, number)).rowcount:
+                return upload['received_count']
+            conn.execute(
+                'UPDATE uploads SET received_count = received_count + 1, updated_at = ? WHERE identifier = ?',
+                (time.time(), identifier))
+        return upload['received_count'] + 1
+
+    def finish_upload(self, identifier, state, file_id=None, error=None, keep_chunks=False):
+        """Record the outcome of an upload's assembly; a complete upload releases its reservation.
+
+        A failed upload forgets which chunks it received, so they must all
+        be sent again, unless keep_chunks says its staged data survived and
+        the next chunk may simply retry the assembly.
+        """
+        with self._connect() as conn:
+            conn.execute(
+                'UPDATE uploads SET state = ?, file_id = ?, error = ?, updated_at = ? WHERE identifier = ?',
+                (state, file_id, error, time.time(), identifier)
+            )
+            if state == 'complete':
+                conn.execute('DELETE FROM reservations WHERE identifier = ?', (identifier,))
+            if state == 'complete' or not keep_chunks:
+                self._forget_chunks(conn, identifier)
+
+    @staticmethod
+    def _forget_chunks(conn, identifier):
+        conn.execute('DELETE FROM upload_chunks WHERE identifier = ?', (identifier,))
+        conn.execute('UPDATE uploads SET received_count = 0 WHERE identifier = ?', (identifier,))
+
+    def touch_upload(self, identifier, interval=60):
+        """Record activity on a pending upload, at most once per interval seconds."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE uploads SET updated_at = ? WHERE identifier = ? AND state = 'pending' AND updated_at < ?",
+                (now, identifier, now - interval)
+            )
+
+    def expire_uploads(self, cutoff):
+        """Forget unfinished uploads idle since before cutoff; returns their identifiers.
+
+        Complete uploads are kept for status lookups, and assembling ones
+        are left to their assembly (see fail_stalled_assemblies). The identifier of an expired upload can
+        start afresh, which is how the bundled clients resume.
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            identifiers = [row['identifier'] for row in conn.execute(
+                "SELECT identifier FROM uploads WHERE state NOT IN ('assembling', 'complete') AND updated_at < ?",
+                (cutoff,))]
+            for identifier in identifiers:
+                conn.execute('DELETE FROM uploads WHERE identifier = ?', (identifier,))
+                conn.execute('DELETE FROM reservations WHERE identifier = ?', (identifier,))
+                conn.execute('DELETE FROM upload_chunks WHERE identifier = ?', (identifier,))
+        return identifiers
+
+    def fail_stalled_assemblies(self, cutoff, intact):
+        """Mark uploads assembling since before cutoff as failed; returns their identifiers.
+
+        Their assembler is presumed dead, e.g. with the worker that ran it.
+        If intact(identifier) says the staged data survived, the next chunk
+        the client sends restarts the assembly; otherwise the upload forgets
+        its chunks and must be sent again. It expires like any idle upload.
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            identifiers = [row['identifier'] for row in conn.execute(
+                "SELECT identifier FROM uploads WHERE state = 'assembling' AND updated_at < ?", (cutoff,))]
+            conn.executemany(
+                "UPDATE uploads SET state = 'failed', error = 'Assembly did not finish', updated_at = ? "
+                "WHERE identifier = ?", [(time.time(), identifier) for identifier in identifiers])
+            for identifier in identifiers:
+                if not intact(identifier):
+                    self._forget_chunks(conn, identifier)
+        return identifiers
+
+    def get_upload(self, identifier):
+        """Return the assembly record of a chunked upload, or None."""
+        row = self._connect().execute(
+            'SELECT * FROM uploads WHERE identifier = ?', (identifier,)).fetchone()
+        return dict(row) if row else None
+
+    def reserve(self, identifier, client, size, ttl, free_bytes, quota=None):
+        """Admit an upload by reserving its declared size, or raise AdmissionRefused.
+
+        free_bytes is the disk space the uploads may use. Reserved bytes not
+        yet allocated on disk count against it, and the client's stored
+        bytes plus its reservations count against its quota. Calling this
+        again for an admitted upload only extends its reservation by ttl
+        seconds, so every request of an upload can call it. Calling it with
+        a larger size grows the reservation, for a body whose length is
+        only known as it is read; the bytes reserved before are then taken
+        to be written. Reservations left to expire are released on the
+        next admission. Returns True if a new reservation was made.
+        """
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            if conn.execute('UPDATE reservations SET expires_at = ? WHERE identifier = ? AND size >= ?',
+                            (now + ttl, identifier, size)).rowcount:
+                return False
+
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM reservations WHERE expires_at < ?', (now,))
+            upload = conn.execute('SELECT state FROM uploads WHERE identifier = ?', (identifier,)).fetchone()
+            if upload and upload['state'] not in ('pending', 'failed'):
+                return False  # A late request of an upload that is already assembled
+            existing = conn.execute(
+                'SELECT size FROM reservations WHERE identifier = ?', (identifier,)).fetchone()
+            extra = size - existing['size'] if existing else size
+            if extra <= 0:
+                conn.execute('UPDATE reservations SET expires_at = ? WHERE identifier = ?',
+                             (now + ttl, identifier))
+                return False
+
+            if extra > free_bytes:
+                raise AdmissionRefused("Not enough disk space for this upload")
+            outstanding = conn.execute(
+                'SELECT COALESCE(SUM(size - allocated), 0) FROM reservations WHERE identifier != ?',
+                (identifier,)).fetchone()[0]
+            if extra > free_bytes - outstanding:
+                raise AdmissionRefused("Disk space is reserved by uploads in progress", transient=True)
+
+            if quota is not None:
+                stored = conn.execute(
+                    'SELECT COALESCE(SUM(size), 0) FROM files WHERE client = ?', (client,)).fetchone()[0]
+                if stored + size > quota:
+                    raise AdmissionRefused("Storage quota exceeded")
+                reserved = conn.execute(
+                    'SELECT COALESCE(SUM(size), 0) FROM reservations WHERE client = ?', (client,)).fetchone()[0]
+                if stored + reserved + extra > quota:
+                    raise AdmissionRefused("Storage quota is reserved by uploads in progress", transient=True)
+
+            if existing:
+                conn.execute(
+                    'UPDATE reservations SET size = ?, allocated = ?, expires_at = ? WHERE identifier = ?',
+                    (size, existing['size'], now + ttl, identifier))
+                return False
+            conn.execute(
+                'INSERT INTO reservations (identifier, client, size, expires_at) VALUES (?, ?, ?, ?)',
+                (identifier, client, size, now + ttl))
+        return True
+
+    def mark_allocated(self, identifier):
+        """Record that the whole reservation of an upload is allocated on disk, e.g. preallocated."""
+        with self._connect() as conn:
+            conn.execute('UPDATE reservations SET allocated = size WHERE identifier = ?', (identifier,))
+
+    def release(self, identifier):
+        """Drop the reservation of an upload that ended."""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM reservations WHERE identifier = ?', (identifier,))
+
+    def usage(self, client):
+        """Reservation totals, and the stored bytes and reservations of one client."""
+        conn = self._connect()
+        now = time.time()
+        totals = conn.execute(
+            'SELECT COUNT(*) AS count, COALESCE(SUM(size), 0) AS size, '
+            'COALESCE(SUM(size - allocated), 0) AS outstanding FROM reservations WHERE expires_at >= ?',
+            (now,)).fetchone()
+        stored = conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM files WHERE client = ?', (client,)).fetchone()[0]
+        reservations = conn.execute(
+            'SELECT identifier, size, allocated, expires_at FROM reservations '
+            'WHERE client = ? AND expires_at >= ? ORDER BY expires_at',
+            (client, now)).fetchall()
+        return {
+            'reservations': totals['count'],
+            'reserved_bytes': totals['size'],
+            'outstanding_bytes': totals['outstanding'],
+            'client_stored_bytes': stored,
+            'client_reservations': [dict(row) for row in reservations]
+        }
+
+    def import_folder(self, folder, get_content_type):
+        """Index files already present in folder, e.g. on first start after an upgrade."""
+        count = 0
+        for path in folder.iterdir():
+            if not path.is_file():
+                continue
+            stat = path.stat()
+            with self._connect() as conn:
+                conn.execute(
+                    'INSERT OR IGNORE INTO files (id, filename, size, content_type, upload_date) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (path.name, path.name, stat.st_size, get_content_type(str(path)), stat.st_mtime)
+                )
+            count += 1
+        logger.info(f"Catalog imported {count} existing files from {folder}")
+        return count
@@ -0,0 +1,98 @@
+import base64
+import hashlib
+import binascii
+import logging
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Digest algorithms clients may use, by their RFC 3230 names
+ALGORITHMS = {
+    'sha-256': hashlib.sha256,
+    'md5': hashlib.md5,
+}
+
+
+class InvalidDigest(ValueError):
+    """Raised when a client-supplied digest cannot be parsed."""
+
+
+class ChecksumMismatch(ValueError):
+    """Raised when received bytes do not match the digest the client sent."""
+
+
+def expected_digests(headers, checksum=None):
+    """Collect the digests a client expects for the body it is sending.
+
+    Accepts Content-MD5 (base64 MD5), Digest (RFC 3230, e.g.
+    'sha-256=<base64>', several comma separated) and a hex SHA-256
+    checksum parameter. Returns a map of algorithm name to raw digest;
+    algorithms this server does not know are ignored.
+    """
+    expected = {}
+    try:
+        if headers.get('Content-MD5'):
+            expected['md5'] = base64.b64decode(headers['Content-MD5'], validate=True)
+        for item in (headers.get('Digest') or '').split(','):
+            name, sep, value = item.strip().partition('=')
+            if sep and name.lower() in ALGORITHMS:
+                expected[name.lower()] = base64.b64decode(value, validate=True)
+        if checksum:
+            expected['sha-256'] = bytes.fromhex(checksum)
+    except (binascii.Error, ValueError) as e:
+        raise InvalidDigest(f"Invalid digest: {e}") from e
+
+    for name, digest in expected.items():
+        if len(digest) != ALGORITHMS[name]().digest_size:
+            raise InvalidDigest(f"Invalid {name} digest length")
+    return expected
+
+
+class StreamHasher:
+    """Hash bytes as they are written and check them against expected digests.
+
+    Only the algorithms that are expected (plus those in always) are
+    computed, so a chunk sent without a digest costs nothing extra.
+    """
+
+    def __init__(self, expected=None, always=()):
+        self.expected = expected or {}
+        self._hashes = {name: ALGORITHMS[name]() for name in set(self.expected) | set(always)}
+
+    def update(self, block):
+        for h in self._hashes.values():
+            h.update(block)
+
+    def hexdigest(self, name='sha-256'):
+        return self._hashes[name].hexdigest()
+
+    def verify(self):
+        """Raise ChecksumMismatch unless every expected digest matches."""
+        for name, digest in self.expected.items():
+            if self._hashes[name].digest() != digest:
+                raise ChecksumMismatch(f"{name} checksum mismatch")
+
+
+def copy_hashed(stream, output, hasher, buffer_size, limit=None):
+    """Copy stream into the open file output, feeding every block to hasher. Returns bytes copied.
+
+    With limit, copying stops at the first block that would take output
+    past limit bytes; that block is not written but is still counted, so
+    the result exceeds limit.
+    """
+    copied = 0
+    while True:
+        block = stream.read(buffer_size)
+        if not block:
+            break
+        if limit is not None and copied + len(block) > limit:
+            return copied + len(block)
+        hasher.update(block)
+        output.write(block)
+        copied += len(block)
+    return copied
+
+
+def digest_header(checksum):
+    """RFC 3230 Digest header value for a hex SHA-256 checksum."""
+    return f"sha-256={base64.b64encode(bytes.fromhex(checksum)).decode()}"
@@ -0,0 +1,206 @@
+import io
+import os
+import uuid
+import zlib
+import logging
+import threading
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Try importing brotli, but only offer gzip if it is not available
+try:
+    import brotli
+    has_brotli = True
+except ImportError:
+    logger.warning("brotli not available, compressing downloads with gzip only")
+    has_brotli = False
+
+# Content codings offered, most preferred first
+ENCODINGS = ('br', 'gzip') if has_brotli else ('gzip',)
+
+# File suffix of the stored variant of each coding
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+# Compression level while streaming, and for stored variants, which are only made once
+STREAM_LEVELS = {'br': 5, 'gzip': 6}
+VARIANT_LEVELS = {'br': 9, 'gzip': 9}
+
+# A variant must be at most this fraction of the original to be worth serving
+MAX_RATIO = 0.9
+
+# Content codings accepted on request bodies, as zlib window bits
+DECODINGS = {'gzip': 31, 'x-gzip': 31, 'deflate': 15}
+
+# Compressed bytes read from the request per step while decoding
+DECODE_BLOCK_SIZE = 64 * 1024
+
+# Decoded bytes allowed before the compression ratio guard applies
+RATIO_GRACE = 1024 * 1024
+
+
+def is_compressible(content_type, compressible_types):
+    """Whether a content type is worth compressing: any text type or one of compressible_types."""
+    return content_type.startswith('text/') or content_type in compressible_types
+
+
+def negotiate(accept_encodings):
+    """Pick the content coding to send for an Accept-Encoding header; None means identity.
+
+    Codings the client ranks below identity, or excludes with q=0, are not used.
+    """
+    best = accept_encodings.best_match(ENCODINGS + ('identity',))
+    return None if best == 'identity' else best
+
+
+def compress_chunks(chunks, encoding, level=None):
+    """Compress an iterable of byte blocks on the fly."""
+    level = level or STREAM_LEVELS[encoding]
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        compress, flush = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # gzip container
+        compress, flush = compressor.compress, compressor.flush
+    try:
+        for chunk in chunks:
+            block = compress(chunk)
+            if block:
+                yield block
+        yield flush()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+class DecodedInput(io.RawIOBase):
+    """A compressed request body, decoded as it is read.
+
+    No read returns more than the caller asked for, so a small body cannot
+    inflate into a large buffer. Once more than RATIO_GRACE bytes have
+    been decoded, a body that expands by more than max_ratio is treated as
+    a decompression bomb. Errors are HTTP exceptions because they surface
+    inside werkzeug's form parser, which would silently swallow a ValueError.
+    """
+
+    def __init__(self, stream, encoding, max_ratio):
+        self._stream = stream
+        self._wbits = DECODINGS[encoding]
+        self._decompressor = zlib.decompressobj(self._wbits)
+        self._pending = b''
+        self._done = False
+        self.max_ratio = max_ratio
+        self.compressed = 0
+        self.decoded = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not len(b):
+            return 0  # zlib treats a max_length of 0 as unlimited
+        while not self._done:
+            if not self._pending:
+                self._pending = self._stream.read(DECODE_BLOCK_SIZE)
+                if not self._pending:
+                    if not self._decompressor.eof:
+                        raise BadRequest("Compressed request body is truncated")
+                    self._done = True
+                    break
+                self.compressed += len(self._pending)
+
+            try:
+                data = self._decompressor.decompress(self._pending, len(b))
+            except zlib.error as e:
+                raise BadRequest(f"Invalid compressed request body: {str(e)}")
+            self._pending = self._decompressor.unconsumed_tail
+            if self._decompressor.eof:
+                # Concatenated gzip members decode as one stream
+                self._pending = self._decompressor.unused_data
+                if self._pending:
+                    self._decompressor = zlib.decompressobj(self._wbits)
+
+            if data:
+                self.decoded += len(data)
+                if self.decoded > RATIO_GRACE and self.decoded > self.compressed * self.max_ratio:
+                    raise RequestEntityTooLarge(
+                        f"Request body expands more than {self.max_ratio} times when decompressed")
+                b[:len(data)] = data
+                return len(data)
+        return 0
+
+
+class VariantStore:
+    """Precompressed copies of stored objects: variants/<aa>/<bb>/<sha256>.gz (or .br).
+
+    Like the objects they are made from, variants never change once
+    written. When compression does not pay off, an empty .skip marker is
+    stored instead, so the object is served as is and never compressed again.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._building = set()
+        self._lock = threading.Lock()
+
+    def path_for(self, checksum, encoding):
+        return self.root / checksum[:2] / checksum[2:4] / f"{checksum}{SUFFIXES[encoding]}"
+
+    def lookup(self, checksum, encoding):
+        """Path of a stored variant, False if the object does not compress, None if not built yet."""
+        path = self.path_for(checksum, encoding)
+        if os.path.isfile(path):
+            return path
+        if os.path.exists(f"{path}.skip"):
+            return False
+        return None
+
+    def schedule(self, executor, src_path, checksum, encodings=ENCODINGS):
+        """Build the missing variants of an object in the background, at most once at a time."""
+        for encoding in encodings:
+            key = (checksum, encoding)
+            with self._lock:
+                if key in self._building:
+                    continue
+                self._building.add(key)
+            executor.submit(self._build, src_path, checksum, encoding)
+
+    def _build(self, src_path, checksum, encoding):
+        try:
+            if self.lookup(checksum, encoding) is None:
+                self.build(src_path, checksum, encoding)
+        except Exception as e:
+            logger.error(f"Building {encoding} variant of {checksum} failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._building.discard((checksum, encoding))
+
+    def build(self, src_path, checksum, encoding):
+        """Compress an object into its variant; returns the variant path, or False if not worth it."""
+        dest = self.path_for(checksum, encoding)
+        os.makedirs(dest.parent, exist_ok=True)
+        tmp_path = dest.parent / f".{dest.name}.{uuid.uuid4().hex}"
+        with open(src_path, 'rb') as src, open(tmp_path, 'wb') as out:
+            for block in compress_chunks(iter(lambda: src.read(1024 * 1024), b''),
+                                         encoding, VARIANT_LEVELS[encoding]):
+                out.write(block)
+
+        if os.path.getsize(tmp_path) > os.path.getsize(src_path) * MAX_RATIO:
+            os.remove(tmp_path)
+            open(f"{dest}.skip", 'wb').close()
+            logger.info(f"{checksum} does not compress with {encoding}; serving it as is")
+            return False
+        os.replace(tmp_path, dest)
+        logger.info(f"Stored {encoding} variant of {checksum}")
+        return dest
+
+    def delete(self, checksum):
+        """Remove every variant of an object whose blob was deleted."""
+        for encoding in SUFFIXES:
+            path = self.path_for(checksum, encoding)
+            for candidate in (path, f"{path}.skip"):
+                try:
+                    os.remove(candidate)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,87 @@
+import os
+import logging
+import mimetypes
+import threading
+from collections import OrderedDict
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Initialize mimetypes
+mimetypes.init()
+# Add additional mappings
+mimetypes.add_type('application/json', '.ipynb')
+
+# Try importing python-magic, but fall back to mimetypes if not available
+try:
+    import magic
+    has_magic = True
+except ImportError:
+    logger.warning("python-magic not available, falling back to mimetypes")
+    has_magic = False
+
+DEFAULT_TYPE = 'application/octet-stream'
+
+
+class ContentTypeDetector:
+    """Content-type detection shared by all requests of a worker.
+
+    A single libmagic handle is loaded once and reused (python-magic
+    serializes calls on it with its own lock). Results for files on disk
+    are cached by (device, inode, mtime, size), so an unchanged object is
+    only ever sniffed once per worker.
+    """
+
+    def __init__(self, cache_size=4096):
+        self.cache_size = cache_size
+        self._magic = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_magic(self):
+        if self._magic is None:
+            with self._lock:
+                if self._magic is None:
+                    self._magic = magic.Magic(mime=True)
+        return self._magic
+
+    def from_buffer(self, data, filename=None):
+        """Detect the type of a file from its leading bytes."""
+        if has_magic:
+            return self._get_magic().from_buffer(bytes(data))
+        # Fallback to mimetypes
+        mime_type, _ = mimetypes.guess_type(filename or '')
+        return mime_type or DEFAULT_TYPE
+
+    def from_file(self, file_path, stat=None):
+        """Detect the type of a stored file, using the cache when it is unchanged."""
+        stat = stat or os.stat(file_path)
+        key = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            mime_type = self._cache.get(key)
+            if mime_type is not None:
+                self._cache.move_to_end(key)
+                return mime_type
+
+        if has_magic:
+            mime_type = self._get_magic().from_file(str(file_path))
+        else:
+            mime_type, _ = mimetypes.guess_type(str(file_path))
+            mime_type = mime_type or DEFAULT_TYPE
+
+        self.remember(key, mime_type)
+        return mime_type
+
+    def remember(self, key, mime_type):
+        """Store a detection result, evicting the least recently used entry."""
+        with self._lock:
+            self._cache[key] = mime_type
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def remember_file(self, file_path, mime_type):
+        """Seed the cache for a file whose type is already known, e.g. from its upload buffer."""
+        stat = os.stat(file_path)
+        self.remember((stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size), mime_type)
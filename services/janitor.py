@@ -0,0 +1,131 @@
+import os
+import time
+import fcntl
+import logging
+import threading
+from services.uploads import staged_upload_intact
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+
+class UploadJanitor:
+    """Expires upload sessions that saw no activity for ttl seconds and deletes their data.
+
+    Sessions are expired in the catalog first, so a session that is
+    resumed at the same moment is either kept or forgotten as a whole.
+    Directories in temp/ that no active session owns (left behind by
+    cancelled, rejected or crashed uploads) are removed once they are
+    older than ttl too. Uploads still assembling after assembly_timeout
+    seconds are marked failed, so they can be retried (or, if their data
+    is gone, sent again) and then expire. Files are deleted batch_size at
+    a time with a pause in between, so a large sweep does not starve live
+    uploads of disk I/O. Only one process sweeps at a time.
+    """
+
+    def __init__(self, catalog, temp_root, lock_path, ttl, assembly_timeout=None, batch_size=500, batch_pause=0.05):
+        self.catalog = catalog
+        self.temp_root = temp_root
+        self.lock_path = lock_path
+        self.ttl = ttl
+        self.assembly_timeout = assembly_timeout
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self._deleted_in_batch = 0
+        self._thread = None
+
+    def sweep(self):
+        """Run one expiry pass; returns a report, or None if another process is sweeping."""
+        with open(self.lock_path, 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            return self._sweep()
+
+    def _sweep(self):
+        started = time.time()
+        cutoff = started - self.ttl
+        stalled = []
+        if self.assembly_timeout is not None:
+            stalled = self.catalog.fail_stalled_assemblies(
+                started - self.assembly_timeout, lambda identifier: staged_upload_intact(self.temp_root / identifier))
+            for identifier in stalled:
+                logger.warning(f"Assembly of upload {identifier} did not finish; marked as failed")
+        expired = set(self.catalog.expire_uploads(cutoff))
+        report = {'expired_sessions': len(expired), 'stalled_assemblies': len(stalled),
+                  'removed_dirs': 0, 'removed_files': 0, 'reclaimed_bytes': 0}
+
+        with os.scandir(self.temp_root) as entries:
+            candidates = [entry for entry in entries if entry.is_dir(follow_symlinks=False)]
+        for entry in candidates:
+            if entry.name not in expired and not self._abandoned(entry, cutoff):
+                continue
+            files, size = self._remove_tree(entry.path)
+            report['removed_dirs'] += 1
+            report['removed_files'] += files
+            report['reclaimed_bytes'] += size
+
+        report['duration'] = round(time.time() - started, 3)
+        if report['expired_sessions'] or report['removed_dirs']:
+            logger.info(f"Janitor expired {report['expired_sessions']} upload sessions, removed "
+                        f"{report['removed_dirs']} directories and reclaimed {report['reclaimed_bytes']} bytes")
+        return report
+
+    def _abandoned(self, entry, cutoff):
+        """Whether a temp directory belongs to no live session and has not been touched for ttl."""
+        record = self.catalog.get_upload(entry.name)
+        if record and record['state'] in ('pending', 'assembling'):
+            return False
+        try:
+            return entry.stat(follow_symlinks=False).st_mtime < cutoff
+        except FileNotFoundError:
+            return False
+
+    def _remove_tree(self, path):
+        """Delete a directory tree in rate-limited batches; returns (files, bytes) removed."""
+        files = size = 0
+        for root, dirs, names in os.walk(path, topdown=False):
+            for name in names:
+                file_path = os.path.join(root, name)
+                try:
+                    file_size = os.lstat(file_path).st_size
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    continue
+                files += 1
+                size += file_size
+                self._pace()
+            for name in dirs:
+                self._rmdir(os.path.join(root, name))
+        self._rmdir(path)
+        return files, size
+
+    @staticmethod
+    def _rmdir(path):
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass  # Gone already, or a late chunk landed in it; the next sweep retries
+
+    def _pace(self):
+        """Pause after every batch_size deletions."""
+        self._deleted_in_batch += 1
+        if self._deleted_in_batch >= self.batch_size:
+            self._deleted_in_batch = 0
+            time.sleep(self.batch_pause)
+
+    def start(self, interval):
+        """Sweep every interval seconds in a daemon thread of this process."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(interval,), name='janitor', daemon=True)
+        self._thread.start()
+
+    def _run(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Janitor sweep failed: {str(e)}")
@@ -0,0 +1,51 @@
+import os
+import time
+import logging
+from services.blobs import hash_file
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+
+def migrate_legacy_files(catalog, blobs, folder, buffer_size, batch_size=100, pause=0.0, limit=None):
+    """Move files stored flat in folder, from before the object store, into objects/<aa>/<bb>/.
+
+    Each file is hashed and hard-linked into the store, its catalog row
+    is pointed at the blob, and only then is the flat copy removed, so
+    the file can be downloaded from one location or the other throughout.
+    Content that is already stored is deduplicated. Files are handled
+    batch_size at a time with a pause in between; the run can be stopped
+    and restarted at any point. Returns a report of what was moved.
+    """
+    report = {'migrated': 0, 'deduplicated': 0, 'missing': 0, 'bytes': 0}
+    after = ''
+    processed = 0
+    while limit is None or processed < limit:
+        batch = catalog.legacy_files(batch_size if limit is None else min(batch_size, limit - processed), after)
+        if not batch:
+            break
+        for record in batch:
+            after = record['id']
+            processed += 1
+            path = folder / record['id']
+            try:
+                size = os.path.getsize(path)
+                checksum, _ = hash_file(path, buffer_size)
+                existing = catalog.adopt_file(record['id'], size, checksum, lambda: blobs.link(path, checksum))
+            except FileNotFoundError:
+                report['missing'] += 1
+                continue
+            if existing is None:
+                continue  # Deleted while it was being hashed
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            report['migrated'] += 1
+            report['bytes'] += size
+            if existing:
+                report['deduplicated'] += 1
+        logger.info(f"Migrated {report['migrated']} files ({report['bytes']} bytes) into the object store")
+        if pause:
+            time.sleep(pause)
+    return report
@@ -0,0 +1,166 @@
+import uuid
+import logging
+from datetime import datetime, timezone
+from werkzeug.wsgi import wrap_file
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when none of the requested byte ranges overlap the file."""
+
+
+def resolve_ranges(requested, size, max_ranges=16):
+    """Turn a parsed Range header into absolute (start, end) byte ranges.
+
+    Returns None when the header should be ignored and the whole file
+    served, a list of half-open (start, end) tuples otherwise. Raises
+    RangeNotSatisfiable when no range overlaps the file.
+    """
+    if requested is None or requested.units != 'bytes':
+        return None
+    if len(requested.ranges) > max_ranges:
+        logger.warning(f"Ignoring Range header with {len(requested.ranges)} ranges")
+        return None
+
+    ranges = []
+    for start, stop in requested.ranges:
+        if start < 0:
+            # Suffix range: the last -start bytes
+            start, stop = max(size + start, 0), size
+        else:
+            stop = size if stop is None else min(stop, size)
+        if start < stop:
+            ranges.append((start, stop))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+    return ranges
+
+
+def range_condition_holds(if_range, etag, last_modified):
+    """Evaluate If-Range: ranges only apply if the representation is unchanged."""
+    if if_range is None or (if_range.etag is None and if_range.date is None):
+        return True
+    if if_range.etag is not None:
+        return etag is not None and if_range.etag == etag
+    # Dates have one-second resolution in HTTP
+    modified = datetime.fromtimestamp(int(last_modified), tz=timezone.utc)
+    return if_range.date == modified
+
+
+def make_etag(checksum, stat):
+    """Strong entity tag: the stored content hash, else inode, mtime and size."""
+    if checksum:
+        return checksum
+    return f'{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}'
+
+
+def is_not_modified(request, etag, last_modified):
+    """Evaluate If-None-Match / If-Modified-Since for a GET or HEAD request.
+
+    If-None-Match takes precedence; If-Modified-Since is only consulted
+    when the client sent no entity tags.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since is not None:
+        return int(last_modified) <= request.if_modified_since.timestamp()
+    return False
+
+
+def content_range(start, end, size):
+    """Format a Content-Range header value for the half-open range [start, end)."""
+    return f'bytes {start}-{end - 1}/{size}'
+
+
+def server_bounds_file_wrapper(environ):
+    """Whether the server's wsgi.file_wrapper stops at Content-Length.
+
+    Gunicorn's wrapper uses os.sendfile from the file's current offset for
+    exactly Content-Length bytes, so a seeked file can serve a byte range;
+    so does the asyncio adapter's wrapper, which says so with a
+    bounded_by_content_length attribute. Other servers (and werkzeug's
+    fallback) send the file through to EOF.
+    """
+    wrapper = environ.get('wsgi.file_wrapper')
+    if wrapper is None:
+        return False
+    return (getattr(wrapper, 'bounded_by_content_length', False) or
+            environ.get('SERVER_SOFTWARE', '').startswith('gunicorn'))
+
+
+def file_body(environ, file_path, start, end, size, chunk_size):
+    """Return a WSGI body for bytes [start, end) of a file.
+
+    Whole files, and ranges on servers that bound the wrapper by
+    Content-Length, are handed to wsgi.file_wrapper so the server can use
+    sendfile() and skip the userspace copy. Everything else is streamed.
+    """
+    if end - start == size or server_bounds_file_wrapper(environ):
+        f = open(file_path, 'rb')
+        f.seek(start)
+        return wrap_file(environ, f, chunk_size)
+    return iter_file_range(file_path, start, end, chunk_size)
+
+
+def iter_file_range(file_path, start, end, chunk_size):
+    """Stream bytes [start, end) of a file."""
+    with open(file_path, 'rb') as f:
+        yield from _read_range(f, start, end, chunk_size)
+
+
+def iter_bytes(data, start, end, chunk_size):
+    """Stream bytes [start, end) of a file held in memory."""
+    for offset in range(start, end, chunk_size):
+        yield data[offset:min(offset + chunk_size, end)]
+
+
+def _read_range(f, start, end, chunk_size):
+    f.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        chunk = f.read(min(chunk_size, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+
+class MultipartByteranges:
+    """A multipart/byteranges body for a request with several ranges."""
+
+    def __init__(self, ranges, size, content_type):
+        self.ranges = ranges
+        self.size = size
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/byteranges; boundary={self.boundary}'
+        self._part_headers = [
+            (f'\r\n--{self.boundary}\r\n'
+             f'Content-Type: {content_type}\r\n'
+             f'Content-Range: {content_range(start, end, size)}\r\n\r\n').encode()
+            for start, end in ranges
+        ]
+        self._trailer = f'\r\n--{self.boundary}--\r\n'.encode()
+
+    @property
+    def content_length(self):
+        """Exact length of the encoded body."""
+        return (sum(len(h) for h in self._part_headers) +
+                sum(end - start for start, end in self.ranges) +
+                len(self._trailer))
+
+    def iter_body(self, file_path, chunk_size, data=None):
+        """Stream every part, seeking within a single open file, or slicing data if the file is in memory."""
+        if data is not None:
+            for header, (start, end) in zip(self._part_headers, self.ranges):
+                yield header
+                yield from iter_bytes(data, start, end, chunk_size)
+            yield self._trailer
+            return
+        with open(file_path, 'rb') as f:
+            for header, (start, end) in zip(self._part_headers, self.ranges):
+                yield header
+                yield from _read_range(f, start, end, chunk_size)
+            yield self._trailer
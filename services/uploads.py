@@ -0,0 +1,329 @@
+import os
+import fcntl
+import base64
+import shutil
+import hashlib
+import logging
+from services.blobs import ChunkIndexer
+from services.checksums import ChecksumMismatch
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+RECEIVED = b'\x01'
+
+
+class ChunkSizeMismatch(ValueError):
+    """Raised when a chunk does not have the length its position requires."""
+
+
+class UploadTooLarge(ValueError):
+    """Raised when a streamed upload exceeds the size limit."""
+
+
+class OffsetConflict(ValueError):
+    """Raised when an append does not start at the committed offset."""
+
+    def __init__(self, offset):
+        super().__init__(f"Upload is at offset {offset}")
+        self.offset = offset
+
+
+class UploadLocked(Exception):
+    """Raised when another request is already appending to an upload."""
+
+
+class OffsetUpload:
+    """A chunked upload written in place into one preallocated file.
+
+    Each chunk is pwrite()n at (chunk_number - 1) * chunk_size of
+    temp/<identifier>/data, and a one-byte-per-chunk map in
+    temp/<identifier>/received records which chunks have landed. Every
+    chunk owns its own byte of the map, so concurrent writers in different
+    workers never need a read-modify-write. Completion is a rename of the
+    data file into place; there is no assembly pass.
+    """
+
+    def __init__(self, temp_dir, total_chunks, chunk_size, total_size):
+        self.temp_dir = temp_dir
+        self.total_chunks = total_chunks
+        self.chunk_size = chunk_size
+        self.total_size = total_size
+        self.data_path = temp_dir / 'data'
+        self.map_path = temp_dir / 'received'
+
+    def expected_length(self, chunk_number):
+        """Length of a chunk; the last chunk carries the remainder of the file."""
+        if chunk_number < self.total_chunks:
+            return self.chunk_size
+        return self.total_size - (self.total_chunks - 1) * self.chunk_size
+
+    def _prepare(self):
+        """Create and size the data file and chunk map. Safe to run from every writer."""
+        os.makedirs(self.temp_dir, exist_ok=True)
+
+        fd = os.open(self.data_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < self.total_size:
+                if hasattr(os, 'posix_fallocate'):
+                    try:
+                        os.posix_fallocate(fd, 0, self.total_size)
+                    except OSError:
+                        # Filesystem without fallocate support
+                        os.ftruncate(fd, self.total_size)
+                else:
+                    os.ftruncate(fd, self.total_size)
+        finally:
+            os.close(fd)
+
+        fd = os.open(self.map_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < self.total_chunks:
+                os.ftruncate(fd, self.total_chunks)
+        finally:
+            os.close(fd)
+
+    def write_chunk(self, chunk_number, stream, buffer_size, hasher=None):
+        """Copy a chunk from stream to its offset in the data file and mark it received.
+
+        With a hasher the chunk is hashed as it is written and only marked
+        received if it matches the client's digest (ChecksumMismatch otherwise).
+        """
+        if not 1 <= chunk_number <= self.total_chunks:
+            raise ChunkSizeMismatch(f"Chunk number {chunk_number} out of range")
+
+        self._prepare()
+        offset = (chunk_number - 1) * self.chunk_size
+        expected = self.expected_length(chunk_number)
+        written = 0
+
+        fd = os.open(self.data_path, os.O_WRONLY)
+        try:
+            while True:
+                block = stream.read(buffer_size)
+                if not block:
+                    break
+                if written + len(block) > expected:
+                    raise ChunkSizeMismatch(
+                        f"Chunk {chunk_number} is larger than {expected} bytes")
+                if hasher:
+                    hasher.update(block)
+                os.pwrite(fd, block, offset + written)
+                written += len(block)
+        finally:
+            os.close(fd)
+
+        if written != expected:
+            raise ChunkSizeMismatch(
+                f"Chunk {chunk_number} has {written} bytes, expected {expected}")
+        if hasher:
+            hasher.verify()
+
+        fd = os.open(self.map_path, os.O_WRONLY)
+        try:
+            os.pwrite(fd, RECEIVED, chunk_number - 1)
+        finally:
+            os.close(fd)
+
+    def received_map(self):
+        """The raw chunk map, one byte per chunk (empty if nothing was received)."""
+        try:
+            with open(self.map_path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return b''
+
+    def received_flags(self):
+        """One boolean per chunk, True where the chunk has been written."""
+        received = self.received_map()
+        return [received[i:i + 1] == RECEIVED for i in range(self.total_chunks)]
+
+    def has_chunk(self, chunk_number):
+        """Whether a chunk has been fully written; never for a number outside the upload."""
+        if not 1 <= chunk_number <= self.total_chunks:
+            return False
+        try:
+            fd = os.open(self.map_path, os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+        try:
+            return os.pread(fd, 1, chunk_number - 1) == RECEIVED
+        finally:
+            os.close(fd)
+
+    def finalize(self, output_path):
+        """Move the completed data file into place and drop the session directory."""
+        os.rename(self.data_path, output_path)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+
+class AppendUpload:
+    """A resumable upload that grows by appending raw bytes at its committed offset.
+
+    The bytes live in temp/<identifier>/data and the committed offset is
+    simply that file's size, so there is no chunk bookkeeping and each
+    request may send as much or as little as suits the link. Appends hold
+    an exclusive flock, so two requests can never write the same offset.
+    """
+
+    def __init__(self, temp_dir, total_size):
+        self.temp_dir = temp_dir
+        self.total_size = total_size
+        self.data_path = temp_dir / 'data'
+
+    def create(self):
+        """Create the empty data file of a new upload."""
+        os.makedirs(self.temp_dir)
+        open(self.data_path, 'xb').close()
+
+    def offset(self):
+        """Number of bytes committed so far, or None if the upload does not exist."""
+        try:
+            return os.path.getsize(self.data_path)
+        except FileNotFoundError:
+            return None
+
+    def append(self, offset, stream, buffer_size, hasher):
+        """Append stream at offset, which must be the committed offset. Returns the new offset.
+
+        Bytes that fail the client's digest or overrun total_size are
+        discarded; bytes written before a client disconnect are kept, so
+        the client resumes from wherever the transfer stopped.
+        """
+        fd = os.open(self.data_path, os.O_WRONLY)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadLocked("Upload is being written by another request")
+            committed = os.fstat(fd).st_size
+            if offset != committed:
+                raise OffsetConflict(committed)
+
+            os.lseek(fd, committed, os.SEEK_SET)
+            with os.fdopen(fd, 'wb', closefd=False) as output:
+                try:
+                    copy_stream(stream, output, hasher, buffer_size, limit=self.total_size, copied=committed)
+                    hasher.verify()
+                except (ChecksumMismatch, UploadTooLarge):
+                    # Roll back to the committed offset
+                    output.flush()
+                    os.ftruncate(fd, committed)
+                    raise
+            return os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+
+    def is_complete(self):
+        """Whether every byte of the upload has been committed."""
+        return self.offset() == self.total_size
+
+    def finalize(self, output_path):
+        """Move the completed data file into place and drop the session directory."""
+        os.rename(self.data_path, output_path)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+
+def chunk_file_flags(temp_dir, total_chunks, chunk_size, total_size):
+    """One boolean per chunk for chunk.N file storage; partially saved chunks count as missing."""
+    layout = OffsetUpload(temp_dir, total_chunks, chunk_size, total_size)
+    flags = [False] * total_chunks
+    for path in temp_dir.glob("chunk.*"):
+        try:
+            number = int(path.suffix[1:])
+        except ValueError:
+            continue
+        if 1 <= number <= total_chunks and path.stat().st_size == layout.expected_length(number):
+            flags[number - 1] = True
+    return flags
+
+
+def format_ranges(flags):
+    """Compress per-chunk flags into a 1-based range list such as '1-5,7,9-12'."""
+    ranges = []
+    start = None
+    for number, received in enumerate(flags + [False], 1):
+        if received and start is None:
+            start = number
+        elif not received and start is not None:
+            end = number - 1
+            ranges.append(str(start) if start == end else f'{start}-{end}')
+            start = None
+    return ','.join(ranges)
+
+
+def pack_bitmap(flags):
+    """Pack per-chunk flags into a base64 bitmap; bit 7 of byte 0 is chunk 1."""
+    packed = bytearray((len(flags) + 7) // 8)
+    for i, received in enumerate(flags):
+        if received:
+            packed[i // 8] |= 0x80 >> (i % 8)
+    return base64.b64encode(bytes(packed)).decode()
+
+
+def staged_upload_intact(temp_dir):
+    """Whether the staged data of an upload survived, so its assembly can be retried.
+
+    Offset-mode uploads keep a data file and its chunk map, tus uploads a
+    data file, and chunks-mode uploads chunk.N files. Assembly consumes
+    the data file by renaming it, and chunk files by removing the directory.
+    """
+    try:
+        names = set(os.listdir(temp_dir))
+    except FileNotFoundError:
+        return False
+    if 'received' in names:
+        return 'data' in names
+    return 'data' in names or any(name.startswith('chunk.') for name in names)
+
+
+def concatenate_chunks(temp_dir, total_chunks, chunk_size, output_path, buffer_size):
+    """Assemble chunk.1 .. chunk.N files into output_path and remove the chunks.
+
+    The file and its chunk index entries are hashed during the copy, so
+    the result never has to be read again: returns (SHA-256, entries).
+    """
+    digest = hashlib.sha256()
+    paths = [temp_dir / f"chunk.{i}" for i in range(1, total_chunks + 1)]
+    indexer = ChunkIndexer(chunk_size, sum(os.path.getsize(path) for path in paths))
+    with open(output_path, 'wb') as output_file:
+        for path in paths:
+            with open(path, 'rb') as input_file:
+                for block in iter(lambda: input_file.read(buffer_size), b''):
+                    digest.update(block)
+                    indexer.update(block)
+                    output_file.write(block)
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    return digest.hexdigest(), indexer.finish()
+
+
+def read_head(stream, size):
+    """Read up to size bytes from the start of a stream, across short reads."""
+    head = b''
+    while len(head) < size:
+        block = stream.read(size - len(head))
+        if not block:
+            break
+        head += block
+    return head
+
+
+def copy_stream(stream, output, hasher, buffer_size, limit=None, copied=0):
+    """Copy a raw request stream into the open file output through one reusable buffer.
+
+    Every block is fed to hasher as it passes. copied counts bytes the
+    caller already wrote; UploadTooLarge is raised as soon as the total
+    passes limit. Returns the total number of bytes written.
+    """
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    while True:
+        n = stream.readinto(buffer)
+        if not n:
+            break
+        copied += n
+        if limit is not None and copied > limit:
+            raise UploadTooLarge(f"Upload exceeds {limit} bytes")
+        hasher.update(view[:n])
+        output.write(view[:n])
+    return copied
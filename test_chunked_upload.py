@@ -1,90 +1,37 @@
-import requests
-import os
 import sys
-import uuid
-import math
-from tqdm import tqdm
+import argparse
+from upload_client import ChunkedUploadClient, UploadError, DEFAULT_URL
 
-def chunked_upload(file_path, chunk_size=1024*1024):
+def chunked_upload(file_path, chunk_size=None, workers=4, base_url=DEFAULT_URL, compress=False, client=None):
     """Upload a file in chunks to the streaming file server."""
-    if not os.path.exists(file_path):
+    client = client or ChunkedUploadClient(base_url, workers=workers, chunk_size=chunk_size, compress=compress)
+    try:
+        status = client.upload(file_path)
+    except FileNotFoundError:
         print(f"Error: File not found: {file_path}")
-        return
-    
-    file_size = os.path.getsize(file_path)
-    file_name = os.path.basename(file_path)
-    
-    # Generate a unique identifier for this upload
-    identifier = str(uuid.uuid4())
-    
-    # Calculate number of chunks
-    total_chunks = math.ceil(file_size / chunk_size)
-    
-    print(f"Uploading {file_name} ({file_size} bytes) in {total_chunks} chunks")
-    
-    base_url = "http://localhost:8080/api/files/upload/chunked"
-    
-    # Create progress bar for the overall file upload
-    with tqdm(total=file_size, unit='B', unit_scale=True, desc="Total Upload") as pbar:
-        with open(file_path, 'rb') as f:
-            for chunk_number in range(1, total_chunks + 1):
-                # Seek to the appropriate position in the file
-                f.seek((chunk_number - 1) * chunk_size)
-                
-                # Read the chunk
-                chunk_data = f.read(chunk_size)
-                actual_chunk_size = len(chunk_data)
-                
-                # First check if the chunk already exists
-                params = {
-                    'flowChunkNumber': chunk_number,
-                    'flowTotalChunks': total_chunks,
-                    'flowChunkSize': chunk_size,
-                    'flowTotalSize': file_size,
-                    'flowIdentifier': identifier,
-                    'flowFilename': file_name
-                }
-                
-                check_response = requests.get(base_url, params=params)
-                
-                # If the chunk exists (status code 200), skip it
-                if check_response.status_code == 200:
-                    print(f"Chunk {chunk_number} already exists, skipping")
-                    pbar.update(actual_chunk_size)
-                    continue
-                
-                # Otherwise, upload the chunk
-                files = {'file': ('blob', chunk_data)}
-                
-                print(f"Uploading chunk {chunk_number}/{total_chunks} ({actual_chunk_size} bytes)")
-                
-                response = requests.post(
-                    base_url,
-                    data=params,
-                    files=files
-                )
-                
-                # Update the progress bar with the size of this chunk
-                pbar.update(actual_chunk_size)
-                
-                if response.status_code in (200, 201):
-                    print(f"Chunk {chunk_number} uploaded successfully")
-                    
-                    # Check if this was the last chunk and if assembly was successful
-                    if chunk_number == total_chunks and 'id' in response.json():
-                        print("\nAll chunks uploaded and file assembled successfully!")
-                        print(response.json())
-                else:
-                    print(f"Chunk {chunk_number} upload failed: {response.status_code}")
-                    print(response.text)
-                    return
+        return None
+    except UploadError as e:
+        print(f"Upload failed: {e}")
+        return None
 
-if __name__ == "__main__":
-    # Use command line argument if provided, otherwise use default file
-    if len(sys.argv) > 1:
-        file_path = sys.argv[1]
+    if status.get('status') == 'complete':
+        print(f"File assembled successfully! File ID: {status['file_id']}")
     else:
-        file_path = "/Users/user/Downloads/tutorial.ipynb"
-    
-    # Use smaller chunks for demonstration (256KB)
-    chunked_upload(file_path, chunk_size=256*1024)
+        print(f"File assembly {status.get('status')}: {status.get('error')}")
+    return status
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Upload a file in parallel chunks')
+    parser.add_argument('file_paths', nargs='+', metavar='file_path',
+                        help='Files to upload, one after another; later ones are sized by the measured throughput')
+    parser.add_argument('--workers', type=int, default=4, help='Chunks uploaded concurrently')
+    parser.add_argument('--chunk-size-kb', type=int, help='Chunk size in KB (default: chosen from the file size)')
+    parser.add_argument('--url', default=DEFAULT_URL, help='Base URL of the files API')
+    parser.add_argument('--gzip', action='store_true', help='Compress chunks on the wire (for text and JSON data)')
+    args = parser.parse_args()
+
+    chunk_size = args.chunk_size_kb * 1024 if args.chunk_size_kb else None
+    client = ChunkedUploadClient(args.url, workers=args.workers, chunk_size=chunk_size, compress=args.gzip)
+    results = [chunked_upload(path, client=client) for path in args.file_paths]
+    if any(status is None for status in results):
+        sys.exit(1)
@@ -5,19 +5,31 @@ from app import create_app
 from config import Config
 from pathlib import Path
 import io
+import time
+import hashlib
+import json
+import base64
 import uuid
+import random
 
 
 class TestConfig(Config):
     """Test configuration."""
     TESTING = True
+    RATELIMIT_ENABLED = False
+    # Do not depend on the free space of the machine running the tests
+    DISK_FREE_RESERVE = 0
+    # Tests run the janitor themselves
+    JANITOR_INTERVAL = 0
     # Use a temporary directory for uploads
     UPLOAD_FOLDER = Path(tempfile.mkdtemp())
 
 
 @pytest.fixture
-def app():
+def app(monkeypatch):
     """Create application for tests."""
+    # Give every test its own empty upload folder
+    monkeypatch.setattr(TestConfig, 'UPLOAD_FOLDER', Path(tempfile.mkdtemp()))
     app = create_app(TestConfig)
     yield app
     # Clean up temporary files after tests
@@ -25,6 +37,16 @@ def app():
     shutil.rmtree(app.config['UPLOAD_FOLDER'], ignore_errors=True)
 
 
+def wait_for_upload(client, identifier, timeout=5):
+    """Poll the status endpoint until a chunked upload is no longer assembling."""
+    deadline = time.time() + timeout
+    while True:
+        status = client.get(f'/api/files/upload/{identifier}/status').get_json()
+        if status.get('status') != 'assembling' or time.time() > deadline:
+            return status
+        time.sleep(0.01)
+
+
 @pytest.fixture
 def client(app):
     """Create a test client."""
@@ -32,7 +54,7 @@ def client(app):
         yield client
 
 
-def test_file_upload(client):
+def test_file_upload(client, app):
     """Test regular file upload."""
     # Create a test file
     data = {
@@ -40,7 +62,7 @@ def test_file_upload(client):
     }
     
     # Send file upload request
-    response = client.post('/files/upload', data=data, content_type='multipart/form-data')
+    response = client.post('/api/files/upload', data=data, content_type='multipart/form-data')
     
     # Check response
     assert response.status_code == 201
@@ -48,10 +70,10 @@ def test_file_upload(client):
     assert 'id' in json_data
     assert 'filename' in json_data
     assert 'size' in json_data
-    assert json_data['size'] == 17  # Length of 'This is a test file'
+    assert json_data['size'] == 19  # Length of 'This is a test file'
     
-    # Verify file exists
-    file_path = TestConfig.UPLOAD_FOLDER / json_data['id']
+    # Verify file exists in the object store under its checksum
+    file_path = app.extensions['blobs'].path_for(json_data['checksum'])
     assert os.path.exists(file_path)
     with open(file_path, 'rb') as f:
         content = f.read()
@@ -66,7 +88,7 @@ def test_disallowed_file_type(client):
     }
     
     # Send file upload request
-    response = client.post('/files/upload', data=data, content_type='multipart/form-data')
+    response = client.post('/api/files/upload', data=data, content_type='multipart/form-data')
     
     # Should be rejected
     assert response.status_code == 400
@@ -96,28 +118,21 @@ def test_chunked_upload(client, app):
             'file': (io.BytesIO(chunk_content), 'blob')
         }
         
-        response = client.post('/files/upload/chunked', data=data, content_type='multipart/form-data')
+        response = client.post('/api/files/upload/chunked', data=data, content_type='multipart/form-data')
         
-        # Each chunk should be accepted
-        assert response.status_code in [200, 201]
+        # Each chunk should be accepted; the last one starts the assembly
+        assert response.status_code in [200, 201, 202]
     
-    # After all chunks uploaded, verify the file exists and has correct content
-    files = os.listdir(app.config['UPLOAD_FOLDER'])
-    assert len(files) > 0  # At least one file should exist (ignore temp dir)
-    
-    # Find the final assembled file
-    final_file = None
-    for f in files:
-        if f != 'temp':
-            final_file = f
-            break
+    status = wait_for_upload(client, identifier)
+    assert status['status'] == 'complete'
     
+    # After all chunks uploaded, verify the file exists and has correct content
+    final_file = status['file_id']
     assert final_file is not None
     
     # Check file content
-    with open(app.config['UPLOAD_FOLDER'] / final_file, 'rb') as f:
-        content = f.read()
-        assert content == b'Chunk 1 contentChunk 2 contentChunk 3 content'
+    response = client.get(f'/api/files/files/{final_file}')
+    assert response.data == b'Chunk 1 contentChunk 2 contentChunk 3 content'
 
 
 def test_file_download(client, app):
@@ -131,7 +146,7 @@ def test_file_download(client, app):
         f.write(test_content)
     
     # Now try to download it
-    response = client.get(f'/files/{file_id}')
+    response = client.get(f'/api/files/files/{file_id}')
     
     # Verify response
     assert response.status_code == 200
@@ -142,15 +157,15 @@ def test_file_download(client, app):
 
 def test_file_list(client, app):
     """Test listing uploaded files."""
-    # Create a few test files
+    # Upload a few test files so they are recorded in the catalog
     for i in range(3):
-        file_id = str(uuid.uuid4())
-        file_path = app.config['UPLOAD_FOLDER'] / file_id
-        with open(file_path, 'wb') as f:
-            f.write(f'Test file {i}'.encode())
+        data = {
+            'file': (io.BytesIO(f'Test file {i}'.encode()), f'test{i}.txt')
+        }
+        client.post('/api/files/upload', data=data, content_type='multipart/form-data')
     
     # Request file list
-    response = client.get('/files')
+    response = client.get('/api/files/files')
     
     # Verify response
     assert response.status_code == 200
@@ -175,10 +190,1024 @@ def test_file_delete(client, app):
         f.write(b'Test file for deletion')
     
     # Delete the file
-    response = client.delete(f'/files/{file_id}')
+    response = client.delete(f'/api/files/files/{file_id}')
     
     # Verify response
     assert response.status_code == 204
     
     # Verify file was deleted
     assert not os.path.exists(file_path)
+
+
+def test_file_list_pagination(client, app):
+    """Test cursor pagination, sorting and filtering of the file list."""
+    for name in ['a.txt', 'b.txt', 'c.txt', 'notes.txt', 'other.txt']:
+        data = {'file': (io.BytesIO(name.encode() * 10), name)}
+        client.post('/api/files/upload', data=data, content_type='multipart/form-data')
+    
+    # Walk all pages in filename order
+    seen = []
+    cursor = None
+    while True:
+        query = {'limit': 2, 'sort': 'filename', 'order': 'asc'}
+        if cursor:
+            query['cursor'] = cursor
+        response = client.get('/api/files/files', query_string=query)
+        assert response.status_code == 200
+        page = response.get_json()
+        assert len(page) <= 2
+        seen.extend(f['filename'] for f in page)
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+    assert seen == ['a.txt', 'b.txt', 'c.txt', 'notes.txt', 'other.txt']
+    
+    # Filter by filename prefix
+    response = client.get('/api/files/files', query_string={'filename': 'no'})
+    assert [f['filename'] for f in response.get_json()] == ['notes.txt']
+    
+    # Invalid cursors are rejected
+    response = client.get('/api/files/files', query_string={'cursor': 'not-a-cursor'})
+    assert response.status_code == 400
+
+
+def test_download_uses_original_filename(client):
+    """Test that downloads carry the filename recorded at upload time."""
+    data = {'file': (io.BytesIO(b'report contents'), 'report.txt')}
+    file_id = client.post('/api/files/upload', data=data, content_type='multipart/form-data').get_json()['id']
+    
+    response = client.get(f'/api/files/files/{file_id}')
+    assert response.status_code == 200
+    assert 'filename="report.txt"' in response.headers['Content-Disposition']
+    
+    # Deleting a file removes it from the listing as well
+    client.delete(f'/api/files/files/{file_id}')
+    assert client.get('/api/files/files').get_json() == []
+
+
+def test_content_type_cache(app):
+    """Test that unchanged files are only sniffed once."""
+    detector = app.extensions['content_type']
+    file_path = app.config['UPLOAD_FOLDER'] / str(uuid.uuid4())
+    with open(file_path, 'wb') as f:
+        f.write(b'plain text content')
+    
+    # Detection from an in-memory head agrees with detection from disk
+    first = detector.from_file(file_path)
+    assert detector.from_buffer(b'plain text content', 'x.txt') == first
+    
+    # A cache hit must not reach libmagic at all
+    calls = []
+    detector._get_magic = lambda: calls.append(1)
+    assert detector.from_file(file_path) == first
+    assert calls == []
+
+
+def test_range_download(client, app):
+    """Test single-range, multi-range and unsatisfiable range requests."""
+    test_content = b'0123456789abcdefghij'
+    file_id = str(uuid.uuid4())
+    with open(app.config['UPLOAD_FOLDER'] / file_id, 'wb') as f:
+        f.write(test_content)
+    url = f'/api/files/files/{file_id}'
+    
+    # Single range
+    response = client.get(url, headers={'Range': 'bytes=5-9'})
+    assert response.status_code == 206
+    assert response.data == b'56789'
+    assert response.headers['Content-Range'] == 'bytes 5-9/20'
+    assert response.headers['Content-Length'] == '5'
+    
+    # Suffix range
+    response = client.get(url, headers={'Range': 'bytes=-3'})
+    assert response.status_code == 206
+    assert response.data == b'hij'
+    
+    # Multiple ranges
+    response = client.get(url, headers={'Range': 'bytes=0-1,10-11'})
+    assert response.status_code == 206
+    assert response.mimetype == 'multipart/byteranges'
+    assert int(response.headers['Content-Length']) == len(response.data)
+    assert b'Content-Range: bytes 0-1/20\r\n\r\n01\r\n' in response.data
+    assert b'Content-Range: bytes 10-11/20\r\n\r\nab\r\n' in response.data
+    
+    # Unsatisfiable range
+    response = client.get(url, headers={'Range': 'bytes=100-200'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == 'bytes */20'
+    
+    # A stale If-Range falls back to the full file
+    response = client.get(url, headers={'Range': 'bytes=5-9', 'If-Range': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+    assert response.status_code == 200
+    assert response.data == test_content
+
+
+def test_download_content_length(client, app):
+    """Test that both download modes send the same body with an exact Content-Length."""
+    test_content = os.urandom(3 * 1024 + 7)
+    file_id = str(uuid.uuid4())
+    with open(app.config['UPLOAD_FOLDER'] / file_id, 'wb') as f:
+        f.write(test_content)
+    
+    for mode in ('sendfile', 'stream'):
+        app.config['DOWNLOAD_MODE'] = mode
+        response = client.get(f'/api/files/files/{file_id}')
+        assert response.status_code == 200
+        assert response.headers['Content-Length'] == str(len(test_content))
+        assert response.data == test_content
+
+
+def test_head_and_conditional_get(client):
+    """Test HEAD metadata and 304 responses to validators."""
+    data = {'file': (io.BytesIO(b'cacheable content'), 'cache.txt')}
+    upload = client.post('/api/files/upload', data=data, content_type='multipart/form-data').get_json()
+    url = f"/api/files/files/{upload['id']}"
+    
+    # HEAD returns metadata without a body
+    response = client.head(url)
+    assert response.status_code == 200
+    assert response.data == b''
+    assert response.headers['Content-Length'] == str(len(b'cacheable content'))
+    assert 'filename="cache.txt"' in response.headers['Content-Disposition']
+    etag = response.headers['ETag']
+    assert etag == f'"{upload["checksum"]}"'
+    last_modified = response.headers['Last-Modified']
+    
+    # Matching validators revalidate with 304
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+    assert client.head(url, headers={'If-None-Match': etag}).status_code == 304
+    assert client.get(url, headers={'If-Modified-Since': last_modified}).status_code == 304
+    
+    # A different tag gets the full body
+    response = client.get(url, headers={'If-None-Match': '"other"'})
+    assert response.status_code == 200
+    assert response.data == b'cacheable content'
+    
+    # If-Range with the current ETag serves the range
+    response = client.get(url, headers={'Range': 'bytes=0-8', 'If-Range': etag})
+    assert response.status_code == 206
+    assert response.data == b'cacheable'
+
+
+def post_chunk(client, identifier, chunks, number, chunk_size=None, filename='test.txt', headers=None):
+    """Send one chunk of a flow.js-style upload."""
+    chunk_size = chunk_size or len(chunks[0])
+    data = {
+        'flowChunkNumber': number,
+        'flowTotalChunks': len(chunks),
+        'flowChunkSize': chunk_size,
+        'flowTotalSize': sum(len(c) for c in chunks),
+        'flowIdentifier': identifier,
+        'flowFilename': filename,
+        'file': (io.BytesIO(chunks[number - 1]), 'blob')
+    }
+    return client.post('/api/files/upload/chunked', data=data, content_type='multipart/form-data', headers=headers)
+
+
+@pytest.mark.parametrize('mode', ['offset', 'chunks'])
+def test_chunked_upload_out_of_order(client, app, mode):
+    """Test that chunks arriving in any order assemble correctly in both modes."""
+    app.config['CHUNKED_UPLOAD_MODE'] = mode
+    identifier = str(uuid.uuid4())
+    chunks = [b'aaaa', b'bbbb', b'cccc', b'dd']
+    
+    for number in (3, 1, 4):
+        assert post_chunk(client, identifier, chunks, number).status_code == 201
+    
+    # Already received chunks are reported and not rewritten
+    query = {
+        'flowChunkNumber': 3, 'flowTotalChunks': 4, 'flowChunkSize': 4,
+        'flowTotalSize': 14, 'flowIdentifier': identifier, 'flowFilename': 'test.txt'
+    }
+    assert client.get('/api/files/upload/chunked', query_string=query).status_code == 200
+    query['flowChunkNumber'] = 2
+    assert client.get('/api/files/upload/chunked', query_string=query).status_code == 204
+    assert post_chunk(client, identifier, chunks, 3).status_code == 200
+    
+    # Chunk numbers outside the upload do not exist and are refused
+    for number in (0, 5):
+        query['flowChunkNumber'] = number
+        assert client.get('/api/files/upload/chunked', query_string=query).status_code == 204
+    assert post_chunk(client, identifier, chunks, 0).status_code == 400
+    
+    response = post_chunk(client, identifier, chunks, 2)
+    assert response.status_code == 202
+    assert response.get_json()['upload_id'] == identifier
+    status = wait_for_upload(client, identifier)
+    assert status['status'] == 'complete'
+    file_id = status['file_id']
+    assert client.get(f'/api/files/files/{file_id}').data == b'aaaabbbbccccdd'
+    assert not os.path.exists(app.config['UPLOAD_FOLDER'] / 'temp' / identifier)
+
+
+@pytest.mark.parametrize('mode', ['offset', 'chunks'])
+def test_chunked_upload_rejects_wrong_size(client, app, mode):
+    """Test that a chunk whose length does not match its position is rejected."""
+    app.config['CHUNKED_UPLOAD_MODE'] = mode
+    identifier = str(uuid.uuid4())
+    response = post_chunk(client, identifier, [b'aaaaa', b'bbbb'], 1, chunk_size=4)
+    assert response.status_code == 400
+    
+    # Writes are bounded by the declared total size, not by flowChunkSize
+    empty = str(uuid.uuid4())
+    response = client.post('/api/files/upload/chunked', content_type='multipart/form-data', data={
+        'flowChunkNumber': 1, 'flowTotalChunks': 1, 'flowChunkSize': 4, 'flowTotalSize': 0,
+        'flowIdentifier': empty, 'flowFilename': 'test.txt', 'file': (io.BytesIO(b'aaaa'), 'blob')})
+    assert response.status_code == 400
+    assert client.get(f'/api/files/upload/{empty}/chunks').get_json()['received'] == ''
+    assert not list((app.config['UPLOAD_FOLDER'] / 'temp' / empty).glob('*chunk.*'))
+    
+    # Inconsistent layouts are refused before anything is reserved or stored
+    for total_chunks, chunk_size, total_size in ((30000000, 1, 0), (2, -4, 8), (3, 4, 100), (1, 4, 6 * 1024 ** 3)):
+        bad = str(uuid.uuid4())
+        response = client.post('/api/files/upload/chunked', content_type='multipart/form-data', data={
+            'flowChunkNumber': 1, 'flowTotalChunks': total_chunks, 'flowChunkSize': chunk_size,
+            'flowTotalSize': total_size, 'flowIdentifier': bad, 'flowFilename': 'test.txt',
+            'file': (io.BytesIO(b'aaaa'), 'blob')})
+        assert response.status_code == 400
+        offer = {'filename': 'test.txt', 'total_chunks': total_chunks, 'chunk_size': chunk_size,
+                 'total_size': total_size, 'hashes': {}}
+        assert client.post(f'/api/files/upload/{bad}/chunks', json=offer).status_code == 400
+        assert not os.path.exists(app.config['UPLOAD_FOLDER'] / 'temp' / bad)
+        assert client.get(f'/api/files/upload/{bad}/status').status_code == 404
+    
+    # A later chunk cannot change the layout its upload started with
+    identifier = str(uuid.uuid4())
+    assert post_chunk(client, identifier, [b'aaaa', b'bbbb'], 1).status_code == 201
+    assert post_chunk(client, identifier, [b'bbbb', b'bbbb', b'cc'], 2).status_code == 400
+
+
+def test_upload_status(client, app):
+    """Test status reporting for pending, failed and synchronous uploads."""
+    identifier = str(uuid.uuid4())
+    chunks = [b'aaaa', b'bb']
+    assert client.get(f'/api/files/upload/{identifier}/status').status_code == 404
+    
+    post_chunk(client, identifier, chunks, 1)
+    assert wait_for_upload(client, identifier)['status'] == 'pending'
+    
+    # Disallowed content is refused on its first chunk and reported through the status endpoint
+    bad = str(uuid.uuid4())
+    script = [b'#!/bin/sh\necho disallowed\n']
+    assert post_chunk(client, bad, script, 1, filename='script.txt').status_code == 415
+    status = wait_for_upload(client, bad)
+    assert status['status'] == 'rejected'
+    assert 'Unsupported file type' in status['error']
+    
+    # Without ASYNC_ASSEMBLY the last chunk returns the stored file
+    app.config['ASYNC_ASSEMBLY'] = False
+    response = post_chunk(client, identifier, chunks, 2)
+    assert response.status_code == 201
+    assert client.get(f'/api/files/upload/{identifier}/status').get_json()['file_id'] == response.get_json()['id']
+
+
+@pytest.mark.parametrize('mode', ['offset', 'chunks'])
+def test_received_chunks(client, app, mode):
+    """Test the single-request view of received chunks."""
+    app.config['CHUNKED_UPLOAD_MODE'] = mode
+    identifier = str(uuid.uuid4())
+    chunks = [b'aaaa'] * 10 + [b'bb']
+    assert client.get(f'/api/files/upload/{identifier}/chunks').status_code == 404
+    
+    for number in (1, 2, 3, 5, 9, 10):
+        post_chunk(client, identifier, chunks, number)
+    
+    response = client.get(f'/api/files/upload/{identifier}/chunks')
+    assert response.status_code == 200
+    info = response.get_json()
+    assert info['status'] == 'pending'
+    assert info['total_chunks'] == 11
+    assert info['chunk_size'] == 4
+    assert info['last_chunk_size'] == 2
+    assert info['received_count'] == 6
+    assert info['received'] == '1-3,5,9-10'
+    assert info['bitmap'] == '6MA='  # 11101000 11000000
+    # Only in-place uploads take chunks from hash offers
+    assert info['chunk_reuse'] == (mode == 'offset')
+
+
+def test_deduplicated_storage(client, app):
+    """Test that identical uploads share one reference-counted blob."""
+    ids = []
+    for name in ('first.txt', 'second.txt'):
+        data = {'file': (io.BytesIO(b'shared dataset contents'), name)}
+        ids.append(client.post('/api/files/upload', data=data, content_type='multipart/form-data').get_json())
+    assert ids[0]['checksum'] == ids[1]['checksum']
+    blob_path = app.extensions['blobs'].path_for(ids[0]['checksum'])
+    
+    # A third file can be created from the hash alone
+    response = client.post('/api/files/upload/by-hash', json={'filename': 'third.txt', 'checksum': ids[0]['checksum']})
+    assert response.status_code == 201
+    ids.append(response.get_json())
+    assert client.get(f"/api/files/files/{ids[2]['id']}").data == b'shared dataset contents'
+    assert client.post('/api/files/upload/by-hash', json={'filename': 'x.txt', 'checksum': '0' * 64}).status_code == 404
+    
+    # The blob survives until its last reference is deleted
+    for i, info in enumerate(ids):
+        assert os.path.exists(blob_path)
+        assert client.delete(f"/api/files/files/{info['id']}").status_code == 204
+    assert not os.path.exists(blob_path)
+
+
+def test_chunk_level_deduplication(client, app):
+    """Test that chunks the server already stores are copied instead of transferred."""
+    chunks = [b'aaaa', b'bbbb', b'cccc', b'dd']
+    first = str(uuid.uuid4())
+    for number in range(1, 5):
+        post_chunk(client, first, chunks, number)
+    assert wait_for_upload(client, first)['status'] == 'complete'
+    
+    # A second upload shares chunks 1 and 2 with the first
+    changed = [b'aaaa', b'bbbb', b'xxxx', b'yy']
+    second = str(uuid.uuid4())
+    offer = {
+        'filename': 'copy.txt', 'total_chunks': 4, 'chunk_size': 4, 'total_size': 14,
+        'hashes': {str(i): hashlib.sha256(c).hexdigest() for i, c in enumerate(changed, 1)}
+    }
+    response = client.post(f'/api/files/upload/{second}/chunks', json=offer)
+    assert response.status_code == 200
+    assert response.get_json()['received'] == '1-2'
+    
+    for number in (3, 4):
+        post_chunk(client, second, changed, number)
+    status = wait_for_upload(client, second)
+    assert status['status'] == 'complete'
+    assert client.get(f"/api/files/files/{status['file_id']}").data == b'aaaabbbbxxxxyy'
+    
+    # flow.js folds the remainder into an oversized last chunk, which is indexed too
+    flow = str(uuid.uuid4())
+    offer = {
+        'filename': 'flow.txt', 'total_chunks': 3, 'chunk_size': 4, 'total_size': 14,
+        'hashes': {'1': hashlib.sha256(b'aaaa').hexdigest(), '3': hashlib.sha256(b'ccccdd').hexdigest()}
+    }
+    response = client.post(f'/api/files/upload/{flow}/chunks', json=offer)
+    assert response.get_json()['received'] == '1,3'
+
+
+@pytest.mark.parametrize('mode', ['offset', 'chunks'])
+def test_chunk_checksum_verification(client, app, mode):
+    """Test that a chunk not matching its digest is rejected and can be retried."""
+    app.config['CHUNKED_UPLOAD_MODE'] = mode
+    identifier = str(uuid.uuid4())
+    chunks = [b'aaaa', b'bb']
+    
+    wrong_md5 = base64.b64encode(hashlib.md5(b'corrupt').digest()).decode()
+    response = post_chunk(client, identifier, chunks, 1, headers={'Content-MD5': wrong_md5})
+    assert response.status_code == 400
+    assert 'checksum mismatch' in response.get_json()['message']
+    assert client.get(f'/api/files/upload/{identifier}/chunks').get_json()['received'] == ''
+    assert post_chunk(client, identifier, chunks, 1, headers={'Content-MD5': 'not base64!'}).status_code == 400
+    
+    for number, chunk in enumerate(chunks, 1):
+        digest = base64.b64encode(hashlib.sha256(chunk).digest()).decode()
+        response = post_chunk(client, identifier, chunks, number, headers={'Digest': f'sha-256={digest}'})
+        assert response.status_code in (201, 202)
+    assert wait_for_upload(client, identifier)['status'] == 'complete'
+
+
+def test_upload_checksum(client, app):
+    """Test that regular uploads are verified and the digest is served with the file."""
+    content = b'checksummed upload'
+    checksum = hashlib.sha256(content).hexdigest()
+    
+    data = {'file': (io.BytesIO(content), 'test.txt'), 'checksum': '0' * 64}
+    response = client.post('/api/files/upload', data=data, content_type='multipart/form-data')
+    assert response.status_code == 400
+    assert os.listdir(app.config['UPLOAD_FOLDER'] / 'incoming') == []
+    
+    data = {'file': (io.BytesIO(content), 'test.txt'), 'checksum': checksum}
+    response = client.post('/api/files/upload', data=data, content_type='multipart/form-data')
+    assert response.status_code == 201
+    assert response.get_json()['checksum'] == checksum
+    
+    response = client.head(f"/api/files/files/{response.get_json()['id']}")
+    assert response.headers['Digest'] == 'sha-256=' + base64.b64encode(hashlib.sha256(content).digest()).decode()
+
+
+def test_raw_upload(client, app):
+    """Test uploads streamed as a raw octet-stream body."""
+    content = b'raw body upload'
+    for method in (client.put, client.post):
+        response = method('/api/files/upload/raw?filename=raw.txt', data=content,
+                          content_type='application/octet-stream')
+        assert response.status_code == 201
+        info = response.get_json()
+        assert info['size'] == len(content)
+        assert info['checksum'] == hashlib.sha256(content).hexdigest()
+        assert client.get(f"/api/files/files/{info['id']}").data == content
+    
+    url = '/api/files/upload/raw?filename=raw.txt'
+    assert client.put(url, data=content, content_type='multipart/form-data').status_code == 415
+    assert client.put(url, data=b'#!/bin/sh\necho disallowed\n',
+                      content_type='application/octet-stream').status_code == 415
+    assert client.put(f'{url}&checksum={"0" * 64}', data=content,
+                      content_type='application/octet-stream').status_code == 400
+    
+    app.config['MAX_CONTENT_LENGTH'] = 10
+    assert client.put(url, data=content, content_type='application/octet-stream').status_code == 413
+    assert os.listdir(app.config['UPLOAD_FOLDER'] / 'incoming') == []
+
+
+def test_resumable_append_upload(client, app):
+    """Test creating an upload and appending bodies of any size at the committed offset."""
+    content = b'0123456789' * 5
+    name = base64.b64encode(b'append.txt').decode()
+    response = client.post('/api/files/uploads', headers={
+        'Upload-Length': str(len(content)), 'Upload-Metadata': f'filename {name}'})
+    assert response.status_code == 201
+    url = response.headers['Location']
+    identifier = url.rsplit('/', 1)[1]
+    
+    def patch(offset, body, **headers):
+        headers['Upload-Offset'] = str(offset)
+        return client.patch(url, data=body, headers=headers, content_type='application/offset+octet-stream')
+    
+    response = patch(0, content[:7])
+    assert response.status_code == 204
+    assert response.headers['Upload-Offset'] == '7'
+    
+    # A stale offset is refused and the committed one reported
+    response = patch(0, content[:7])
+    assert response.status_code == 409
+    assert response.headers['Upload-Offset'] == '7'
+    
+    # A body failing its digest is rolled back
+    wrong = base64.b64encode(hashlib.md5(b'other').digest()).decode()
+    assert patch(7, content[7:20], **{'Content-MD5': wrong}).status_code == 400
+    assert client.head(url).headers['Upload-Offset'] == '7'
+    
+    assert patch(7, content[7:30]).status_code == 204
+    assert patch(30, content[30:] + b'extra').status_code == 400
+    response = patch(30, content[30:])
+    assert response.status_code == 202
+    
+    status = wait_for_upload(client, identifier)
+    assert status['status'] == 'complete'
+    assert client.get(f"/api/files/files/{status['file_id']}").data == content
+    assert client.head(url).headers['Upload-Offset'] == str(len(content))
+    assert client.head('/api/files/uploads/unknown').status_code == 404
+    
+    # Appends to a finished upload report its state
+    response = patch(len(content), b'x')
+    assert response.status_code == 409
+    assert 'complete' in response.get_json()['message']
+    response = client.post('/api/files/uploads', headers={
+        'Upload-Length': '10', 'Upload-Metadata': f'filename {name}'})
+    url = response.headers['Location']
+    assert client.delete(url).status_code == 204
+    response = patch(0, b'0123456789')
+    assert response.status_code == 410
+    assert 'cancelled' in response.get_json()['message']
+
+
+def test_asgi_serving(app):
+    """Test that the asyncio entry point serves the same routes."""
+    import asyncio
+    from asgi import AsgiFileServer
+    server = AsgiFileServer(app, max_threads=4, chunk_size=4)
+    # Serve from disk through the file wrapper rather than the memory cache
+    app.extensions['file_cache'].max_bytes = 0
+    
+    def call(method, path, body=b'', headers=(), query=b''):
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        sent = []
+        
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await asyncio.sleep(3600)
+        
+        async def send(message):
+            sent.append(message)
+        
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query,
+                 'headers': [(k.lower().encode(), v.encode()) for k, v in headers],
+                 'server': ('testserver', 80), 'client': ('127.0.0.1', 1234)}
+        asyncio.run(server(scope, receive, send))
+        response_headers = {k.decode(): v.decode() for k, v in sent[0]['headers']}
+        return sent[0]['status'], response_headers, b''.join(m.get('body', b'') for m in sent[1:]), sent
+    
+    content = b'served from the event loop'
+    status, _, body, _ = call('PUT', '/api/files/upload/raw', content, query=b'filename=loop.txt',
+                              headers=[('Content-Type', 'application/octet-stream')])
+    assert status == 201
+    file_id = json.loads(body)['id']
+    
+    status, headers, body, sent = call('GET', f'/api/files/files/{file_id}')
+    assert status == 200
+    assert body == content
+    assert len(sent) > 3  # streamed in chunk_size blocks
+    
+    status, headers, body, _ = call('GET', f'/api/files/files/{file_id}', headers=[('Range', 'bytes=7-10')])
+    assert status == 206
+    assert body == content[7:11]
+    assert headers['content-range'] == f'bytes 7-10/{len(content)}'
+
+
+def test_shared_rate_limits(app):
+    """Test that workers share counters and chunk requests have their own cost-based budget."""
+    class LimitedConfig(TestConfig):
+        RATELIMIT_ENABLED = True
+        RATELIMIT_DEFAULT = "3 per minute"
+        RATELIMIT_CHUNKS = "4 per minute"
+        RATELIMIT_CHUNK_COST_BYTES = 1000
+        UPLOAD_FOLDER = app.config['UPLOAD_FOLDER']
+    
+    # Two app instances stand in for two workers on one host
+    first = create_app(LimitedConfig).test_client()
+    second = create_app(LimitedConfig).test_client()
+    assert app.config['RATELIMIT_STORAGE_URL'].startswith('sqlite:///')
+    
+    assert [c.get('/api/files/files').status_code for c in (first, second, first, second)] == [200, 200, 200, 429]
+    
+    # Chunks are not counted against the exhausted default limit but charged per started 1000 bytes
+    identifier = str(uuid.uuid4())
+    chunks = [b'aaaa'] * 5
+    assert [post_chunk(c, identifier, chunks, n).status_code for c, n in ((first, 1), (second, 2))] == [201, 201]
+    big = [b'b' * 1500] * 2
+    assert post_chunk(first, str(uuid.uuid4()), big, 1).status_code == 429
+
+
+def test_bandwidth_shaping(app):
+    """Test token-bucket upload and download limits and weighted fair shares."""
+    from services.bandwidth import BandwidthShaper
+    shaper = BandwidthShaper(total_rate=1000, weights={'download': 1, 'upload': 3})
+    download, upload = shaper.open('a', kind='download'), shaper.open('b', kind='upload')
+    assert shaper.fair_rate(download.weight) == 250
+    assert shaper.fair_rate(upload.weight) == 750
+    upload.close()
+    assert shaper.fair_rate(download.weight) == 1000
+    
+    class ShapedConfig(TestConfig):
+        BANDWIDTH_PER_CLIENT = 50 * 1024
+        CHUNK_SIZE = 8 * 1024
+        UPLOAD_FOLDER = app.config['UPLOAD_FOLDER']
+    shaped = create_app(ShapedConfig).test_client()
+    
+    # 50 KB of burst, then 10 KB at 50 KB/s, for the upload and for the download.
+    # Seeded, so the bytes never happen to sniff as a disallowed type.
+    content = random.Random(0).randbytes(60 * 1024)
+    start = time.monotonic()
+    response = shaped.put('/api/files/upload/raw?filename=shaped.zip', data=content,
+                          content_type='application/octet-stream')
+    assert response.status_code == 201
+    assert time.monotonic() - start >= 0.15
+    
+    start = time.monotonic()
+    response = shaped.get(f"/api/files/files/{response.get_json()['id']}",
+                          environ_base={'REMOTE_ADDR': '127.0.0.2'})
+    assert response.data == content
+    assert time.monotonic() - start >= 0.15
+    
+    # Chunks that name their upload in the query string share its per-file bucket
+    class PerFileConfig(TestConfig):
+        BANDWIDTH_PER_FILE = 50 * 1024
+        UPLOAD_FOLDER = app.config['UPLOAD_FOLDER']
+    per_file = create_app(PerFileConfig)
+    identifier = str(uuid.uuid4())
+    response = per_file.test_client().post('/api/files/upload/chunked', query_string={'flowIdentifier': identifier},
+                                           data={'flowChunkNumber': 1, 'flowTotalChunks': 2, 'flowChunkSize': 4,
+                                                 'flowTotalSize': 8, 'flowIdentifier': identifier,
+                                                 'flowFilename': 'test.txt', 'file': (io.BytesIO(b'aaaa'), 'blob')},
+                                           content_type='multipart/form-data')
+    assert response.status_code == 201
+    assert ('file', identifier) in per_file.extensions['bandwidth']._buckets
+
+
+def test_file_cache(client, app):
+    """Test that hot files are served from memory and invalidated on delete."""
+    cache = app.extensions['file_cache']
+    cache.max_file_size, cache.head_size = 64, 16
+    
+    small, large = b'small cached file', os.urandom(200)
+    small_id = client.put('/api/files/upload/raw?filename=small.txt', data=small,
+                          content_type='application/octet-stream').get_json()['id']
+    large_id = client.put('/api/files/upload/raw?filename=large.zip', data=large,
+                          content_type='application/octet-stream').get_json()['id']
+    
+    assert client.get(f'/api/files/files/{small_id}').data == small
+    # Served from memory even once the blob is gone from disk
+    checksum = hashlib.sha256(small).hexdigest()
+    os.rename(app.extensions['blobs'].path_for(checksum), app.config['UPLOAD_FOLDER'] / 'moved')
+    assert client.get(f'/api/files/files/{small_id}').data == small
+    response = client.get(f'/api/files/files/{small_id}', headers={'Range': 'bytes=0-1,6-11'})
+    assert response.status_code == 206 and b'cached' in response.data
+    os.rename(app.config['UPLOAD_FOLDER'] / 'moved', app.extensions['blobs'].path_for(checksum))
+    
+    # Large files keep only their head in memory
+    assert client.get(f'/api/files/files/{large_id}').data == large
+    assert client.get(f'/api/files/files/{large_id}', headers={'Range': 'bytes=4-9'}).data == large[4:10]
+    assert client.get(f'/api/files/files/{large_id}', headers={'Range': 'bytes=100-'}).data == large[100:]
+    assert len(cache.get(hashlib.sha256(large).hexdigest()).data) == 16
+    
+    stats = client.get('/api/files/cache').get_json()
+    assert stats['entries'] == 2
+    assert stats['hits'] >= 5 and stats['misses'] == 2
+    
+    # Deleting the last reference drops the entry
+    assert client.delete(f'/api/files/files/{small_id}').status_code == 204
+    assert cache.get(checksum) is None
+    assert client.get(f'/api/files/files/{small_id}').status_code == 404
+    
+    # The budget is enforced by evicting the least recently used entries
+    cache.max_bytes = cache.size + 100
+    other_id = client.put('/api/files/upload/raw?filename=other.txt', data=b'x' * 40,
+                          content_type='application/octet-stream').get_json()['id']
+    assert client.get(f'/api/files/files/{other_id}').data == b'x' * 40
+    assert cache.evictions == 1 and cache.size <= cache.max_bytes
+    assert cache.get(hashlib.sha256(large).hexdigest()) is None
+
+
+def test_compressed_downloads(client, app):
+    """Test Accept-Encoding negotiation, stored variants and compression while streaming."""
+    import gzip
+    variants = app.extensions['variants']
+    content = json.dumps({'cells': [{'cell_type': 'code', 'source': ['print(1)\n']}] * 100}, indent=1).encode()
+    response = client.put('/api/files/upload/raw?filename=notebook.ipynb', data=content,
+                          content_type='application/octet-stream')
+    file_id, checksum = response.get_json()['id'], response.get_json()['checksum']
+    url = f'/api/files/files/{file_id}'
+    
+    # The variant is built in the background after the upload
+    deadline = time.time() + 5
+    while not variants.lookup(checksum, 'gzip') and time.time() < deadline:
+        time.sleep(0.01)
+    variant = variants.lookup(checksum, 'gzip')
+    assert variant
+    
+    response = client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert response.headers['ETag'] == f'"{checksum}-gzip"'
+    assert int(response.headers['Content-Length']) == os.path.getsize(variant) < len(content) // 5
+    assert gzip.decompress(response.data) == content
+    assert client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']}).status_code == 304
+    
+    # Identity for clients that do not ask for it, or refuse it
+    for accept in (None, 'gzip;q=0', 'identity'):
+        response = client.get(url, headers={'Accept-Encoding': accept} if accept else {})
+        assert response.data == content
+        assert 'Content-Encoding' not in response.headers and 'Digest' in response.headers
+    
+    # Without a stored variant the body is compressed while it streams
+    os.remove(variant)
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    assert gzip.decompress(response.data) == content
+    head = client.head(url, headers={'Accept-Encoding': 'gzip'})
+    assert head.headers['Content-Encoding'] == 'gzip'
+    
+    # Incompressible data is recorded as such and served as is
+    random_path = app.config['UPLOAD_FOLDER'] / 'random'
+    random_path.write_bytes(os.urandom(4096))
+    assert variants.build(random_path, 'f' * 64, 'gzip') is False
+    assert variants.lookup('f' * 64, 'gzip') is False
+    
+    # Deleting the file removes its variants
+    deadline = time.time() + 5
+    while not variants.lookup(checksum, 'gzip') and time.time() < deadline:
+        time.sleep(0.01)
+    client.delete(url)
+    assert variants.lookup(checksum, 'gzip') is None
+
+
+def test_compressed_uploads(client, app):
+    """Test gzip request bodies on every upload path, with size and ratio guards."""
+    import gzip
+    from werkzeug.test import encode_multipart
+    from werkzeug.datastructures import FileStorage
+    app.config['ASYNC_ASSEMBLY'] = False
+    content = b'The quick brown fox jumps over the lazy dog.\n' * 1500
+    
+    def post_gzip(url, body, content_type, method='post'):
+        return getattr(client, method)(url, data=gzip.compress(body), content_type=content_type,
+                                       headers={'Content-Encoding': 'gzip'})
+    
+    # Multipart upload: the whole form is compressed
+    boundary, form = encode_multipart({'file': FileStorage(io.BytesIO(content), 'data.txt')})
+    response = post_gzip('/api/files/upload', form, f'multipart/form-data; boundary={boundary}')
+    assert response.status_code == 201
+    assert response.get_json()['size'] == len(content)
+    assert response.get_json()['checksum'] == hashlib.sha256(content).hexdigest()
+    
+    # Raw upload
+    response = post_gzip('/api/files/upload/raw?filename=raw.txt', content, 'application/octet-stream', 'put')
+    assert response.status_code == 201
+    assert client.get(f"/api/files/files/{response.get_json()['id']}").data == content
+    
+    # Chunks are checked against their decoded length
+    identifier = str(uuid.uuid4())
+    chunks = [content[:30000], content[30000:]]
+    for number, chunk in enumerate(chunks, 1):
+        boundary, form = encode_multipart({
+            'flowChunkNumber': str(number), 'flowTotalChunks': '2', 'flowChunkSize': '30000',
+            'flowTotalSize': str(len(content)), 'flowIdentifier': identifier, 'flowFilename': 'chunked.txt',
+            'file': FileStorage(io.BytesIO(chunk), 'blob')})
+        response = post_gzip('/api/files/upload/chunked', form, f'multipart/form-data; boundary={boundary}')
+        assert response.status_code == 201
+    assert client.get(f"/api/files/files/{response.get_json()['id']}").data == content
+    
+    # MAX_CONTENT_LENGTH counts decoded bytes
+    app.config['MAX_CONTENT_LENGTH'] = 10000
+    response = post_gzip('/api/files/upload/raw?filename=big.txt', content, 'application/octet-stream', 'put')
+    assert response.status_code == 413
+    app.config['MAX_CONTENT_LENGTH'] = Config.MAX_CONTENT_LENGTH
+    
+    # Decompression bombs, corrupt bodies and unknown codings are rejected
+    response = post_gzip('/api/files/upload/raw?filename=bomb.txt', b'0' * (8 * 1024 * 1024),
+                         'application/octet-stream', 'put')
+    assert response.status_code == 413
+    response = client.put('/api/files/upload/raw?filename=bad.txt', data=gzip.compress(content)[:-10],
+                          content_type='application/octet-stream', headers={'Content-Encoding': 'gzip'})
+    assert response.status_code == 400
+    response = client.put('/api/files/upload/raw?filename=br.txt', data=content,
+                          content_type='application/octet-stream', headers={'Content-Encoding': 'br'})
+    assert response.status_code == 415
+    assert os.listdir(app.config['UPLOAD_FOLDER'] / 'incoming') == []
+
+
+def test_early_type_rejection(client, app):
+    """Test that disallowed content is refused from the head of the upload, before the rest is read."""
+    from werkzeug.test import EnvironBuilder, run_wsgi_app
+    script = b'#!/bin/sh\n' + b'echo padding\n' * 200000
+    
+    # Multipart upload: parsing stops once the head of the file part is judged
+    environ = EnvironBuilder(path='/api/files/upload', method='POST',
+                             data={'file': (io.BytesIO(script), 'run.txt')}).get_environ()
+    body = io.BytesIO(environ['wsgi.input'].read())
+    environ['wsgi.input'] = body
+    _, status, _ = run_wsgi_app(app, environ, buffered=True)
+    assert status.startswith('415')
+    assert body.tell() < len(script) // 4
+    
+    # Chunked upload: the verdict on chunk 1 is kept for the whole upload
+    identifier = str(uuid.uuid4())
+    chunks = [script[:1024 * 1024], script[1024 * 1024:2 * 1024 * 1024], script[2 * 1024 * 1024:]]
+    assert post_chunk(client, identifier, chunks, 2).status_code == 201
+    assert post_chunk(client, identifier, chunks, 1).status_code == 415
+    assert not os.path.exists(app.config['UPLOAD_FOLDER'] / 'temp' / identifier)
+    response = post_chunk(client, identifier, chunks, 3)
+    assert response.status_code == 415
+    assert not os.path.exists(app.config['UPLOAD_FOLDER'] / 'temp' / identifier)
+    assert client.get(f'/api/files/upload/{identifier}/status').get_json()['status'] == 'rejected'
+    
+    # With flowIdentifier in the query string the body is not even read
+    environ = EnvironBuilder(path='/api/files/upload/chunked', method='POST',
+                             query_string={'flowIdentifier': identifier},
+                             data={'file': (io.BytesIO(chunks[2]), 'blob')}).get_environ()
+    body = io.BytesIO(environ['wsgi.input'].read())
+    environ['wsgi.input'] = body
+    _, status, _ = run_wsgi_app(app, environ, buffered=True)
+    assert status.startswith('415')
+    assert body.tell() == 0
+
+
+def test_upload_admission(client, app):
+    """Test that uploads reserve their size against free disk space and the client's quota."""
+    import shutil
+    app.config['CLIENT_QUOTA'] = 1000
+    
+    def create(size):
+        name = base64.b64encode(b'quota.txt').decode()
+        return client.post('/api/files/uploads', headers={
+            'Upload-Length': str(size), 'Upload-Metadata': f'filename {name}'})
+    
+    response = create(600)
+    assert response.status_code == 201
+    first = response.headers['Location']
+    
+    # Fits the quota once the first upload ends: retry later
+    response = create(600)
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '30'
+    # Can never fit the quota
+    assert create(1200).status_code == 507
+    
+    usage = client.get('/api/files/storage').get_json()
+    assert usage['reservations'] == 1
+    assert usage['client_quota'] == 1000
+    assert usage['client_reserved_bytes'] == 600
+    assert usage['client_reservations'][0]['identifier'] == first.rsplit('/', 1)[1]
+    
+    # Terminating an upload releases its reservation
+    assert client.delete(first).status_code == 204
+    assert client.head(first).status_code == 404
+    response = create(600)
+    assert response.status_code == 201
+    
+    # A completed upload's reservation turns into stored bytes
+    identifier = str(uuid.uuid4())
+    assert post_chunk(client, identifier, [b'a' * 300], 1).status_code in (201, 202)
+    assert wait_for_upload(client, identifier)['status'] == 'complete'
+    usage = client.get('/api/files/storage').get_json()
+    assert usage['client_stored_bytes'] == 300
+    assert usage['client_reserved_bytes'] == 600
+    assert create(200).status_code == 429
+    assert create(800).status_code == 507
+    
+    # Cancelling a chunked upload removes its chunks and refuses later ones
+    app.config['CLIENT_QUOTA'] = None
+    identifier = str(uuid.uuid4())
+    chunks = [b'b' * 100, b'c' * 100]
+    assert post_chunk(client, identifier, chunks, 1).status_code == 201
+    assert client.delete(f'/api/files/upload/{identifier}/chunks').status_code == 204
+    assert not os.path.exists(app.config['UPLOAD_FOLDER'] / 'temp' / identifier)
+    assert post_chunk(client, identifier, chunks, 2).status_code == 410
+    assert client.get(f'/api/files/upload/{identifier}/status').get_json()['status'] == 'cancelled'
+    
+    # A compressed body, of unknown length, is reserved as it is decoded
+    import gzip
+    app.config['CLIENT_QUOTA'] = 1500
+    
+    def put_gzip(name, content):
+        return client.put(f'/api/files/upload/raw?filename={name}', data=gzip.compress(content),
+                          content_type='application/octet-stream', headers={'Content-Encoding': 'gzip'})
+    
+    assert put_gzip('packed.txt', b'y' * 9000).status_code == 507
+    assert os.listdir(app.config['UPLOAD_FOLDER'] / 'incoming') == []
+    assert put_gzip('packed.txt', b'y' * 500).status_code == 201
+    usage = client.get('/api/files/storage').get_json()
+    assert usage['client_stored_bytes'] == 800
+    assert usage['client_reserved_bytes'] == 600
+    app.config['CLIENT_QUOTA'] = None
+    
+    # Reservations lapse when an upload sees no activity
+    app.config['RESERVATION_TTL'] = 0
+    assert create(100).status_code == 201
+    time.sleep(0.01)
+    assert client.get('/api/files/storage').get_json()['reservations'] == 1
+    
+    # Nothing is read when the disk cannot hold the upload
+    app.config['DISK_FREE_RESERVE'] = shutil.disk_usage(app.config['UPLOAD_FOLDER']).total
+    response = client.put('/api/files/upload/raw?filename=big.txt', data=b'x' * 100,
+                          content_type='application/octet-stream')
+    assert response.status_code == 507
+    assert os.listdir(app.config['UPLOAD_FOLDER'] / 'incoming') == []
+
+
+def test_upload_janitor(client, app):
+    """Test that idle upload sessions expire and their data is deleted."""
+    import shutil
+    import sqlite3
+    temp_root = app.config['UPLOAD_FOLDER'] / 'temp'
+    chunks = [b'a' * 100, b'b' * 100, b'c' * 50]
+    stale, live = str(uuid.uuid4()), str(uuid.uuid4())
+    for identifier in (stale, live):
+        assert post_chunk(client, identifier, chunks, 1).status_code == 201
+        assert post_chunk(client, identifier, chunks, 2).status_code == 201
+    
+    # A leftover directory no session owns
+    orphan = temp_root / 'orphan'
+    os.makedirs(orphan)
+    (orphan / 'chunk.1').write_bytes(b'x' * 10)
+    os.utime(orphan, (0, 0))
+    
+    with sqlite3.connect(str(app.config['CATALOG_PATH'])) as conn:
+        conn.execute('UPDATE uploads SET updated_at = 0 WHERE identifier = ?', (stale,))
+    
+    janitor = app.extensions['janitor']
+    janitor.batch_size = 1
+    report = janitor.sweep()
+    assert report['expired_sessions'] == 1
+    assert report['removed_dirs'] == 2
+    assert report['reclaimed_bytes'] >= 10
+    assert not os.path.exists(temp_root / stale)
+    assert not os.path.exists(orphan)
+    assert os.path.isdir(temp_root / live)
+    
+    # The expired upload is forgotten, with its reservation; the live one is untouched
+    assert client.get(f'/api/files/upload/{stale}/status').status_code == 404
+    usage = client.get('/api/files/storage').get_json()
+    assert [r['identifier'] for r in usage['client_reservations']] == [live]
+    assert client.get(f'/api/files/upload/{live}/chunks').get_json()['received'] == '1-2'
+    
+    # Its identifier can start again from scratch
+    assert post_chunk(client, stale, chunks, 1).status_code == 201
+    assert janitor.sweep()['expired_sessions'] == 0
+    
+    # An assembly whose worker died is failed after ASSEMBLY_TIMEOUT, and the next chunk retries it
+    app.config['ASYNC_ASSEMBLY'] = False
+    with sqlite3.connect(str(app.config['CATALOG_PATH'])) as conn:
+        conn.execute("UPDATE uploads SET state = 'assembling', updated_at = 0 WHERE identifier = ?", (live,))
+    assert post_chunk(client, live, chunks, 3).status_code == 200
+    report = janitor.sweep()
+    assert report['stalled_assemblies'] == 1
+    assert report['expired_sessions'] == 0
+    status = client.get(f'/api/files/upload/{live}/status').get_json()
+    assert status['status'] == 'failed'
+    assert status['error'] == 'Assembly did not finish'
+    assert post_chunk(client, live, chunks, 3).status_code == 201
+    assert client.get(f'/api/files/upload/{live}/status').get_json()['status'] == 'complete'
+    
+    # A stalled upload whose staged data is gone must be sent again in full
+    assert post_chunk(client, stale, chunks, 2).status_code == 201
+    with sqlite3.connect(str(app.config['CATALOG_PATH'])) as conn:
+        conn.execute("UPDATE uploads SET state = 'assembling', updated_at = 0 WHERE identifier = ?", (stale,))
+    shutil.rmtree(temp_root / stale)
+    assert janitor.sweep()['stalled_assemblies'] == 1
+    assert client.get(f'/api/files/upload/{stale}/chunks').get_json()['received'] == ''
+    assert post_chunk(client, stale, chunks, 3).status_code == 201
+    assert post_chunk(client, stale, chunks, 1).status_code == 201
+    response = post_chunk(client, stale, chunks, 2)
+    assert response.status_code == 201
+    assert client.get(f"/api/files/files/{response.get_json()['id']}").data == b''.join(chunks)
+
+
+@pytest.mark.parametrize('mode', ['offset', 'chunks'])
+def test_exactly_once_assembly(app, mode):
+    """Test that concurrent and repeated chunks assemble the upload exactly once."""
+    from concurrent.futures import ThreadPoolExecutor
+    app.config['CHUNKED_UPLOAD_MODE'] = mode
+    app.config['ASYNC_ASSEMBLY'] = False
+    identifier = str(uuid.uuid4())
+    chunks = [bytes([65 + i]) * 64 for i in range(8)]
+    
+    # Chunk 1 first, as the clients do, then every other chunk twice at once
+    assert post_chunk(app.test_client(), identifier, chunks, 1).status_code == 201
+    
+    def send(number):
+        return post_chunk(app.test_client(), identifier, chunks, number)
+    
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        responses = list(pool.map(send, [n for n in range(2, 9) for _ in range(2)]))
+    # Duplicates that arrive after the upload completed are refused
+    assert all(r.status_code in (200, 201, 202, 409) for r in responses)
+    stored = [r.get_json() for r in responses if r.status_code == 201 and 'id' in r.get_json()]
+    assert len(stored) == 1
+    
+    client = app.test_client()
+    status = client.get(f'/api/files/upload/{identifier}/status').get_json()
+    assert status['status'] == 'complete'
+    assert status['file_id'] == stored[0]['id']
+    assert len(client.get('/api/files/files').get_json()) == 1
+    assert client.get(f"/api/files/files/{stored[0]['id']}").data == b''.join(chunks)
+    
+    # A chunk sent again after completion is refused and changes nothing
+    assert send(8).status_code == 409
+    assert len(client.get('/api/files/files').get_json()) == 1
+
+
+@pytest.mark.parametrize('mode', ['offset', 'chunks'])
+def test_failed_assembly_retry(client, app, monkeypatch, mode):
+    """Test that an upload whose assembly failed is received again in full, never stored with holes."""
+    import api.files
+    app.config['CHUNKED_UPLOAD_MODE'] = mode
+    app.config['ASYNC_ASSEMBLY'] = False
+    identifier = str(uuid.uuid4())
+    chunks = [b'AAAA', b'BBBB', b'CCCC']
+    register_file = api.files.register_file
+    
+    def fail_once(*args, **kwargs):
+        monkeypatch.setattr(api.files, 'register_file', register_file)
+        raise RuntimeError("Catalog unavailable")
+    
+    monkeypatch.setattr(api.files, 'register_file', fail_once)
+    for number in (1, 2):
+        assert post_chunk(client, identifier, chunks, number).status_code == 201
+    assert post_chunk(client, identifier, chunks, 3).status_code == 500
+    status = client.get(f'/api/files/upload/{identifier}/status').get_json()
+    assert status['status'] == 'failed'
+    assert 'Catalog unavailable' in status['error']
+    assert os.listdir(app.config['UPLOAD_FOLDER'] / 'incoming') == []
+    
+    # The staged data went with the failed attempt, so nothing counts as received
+    assert client.get(f'/api/files/upload/{identifier}/chunks').get_json()['received'] == ''
+    assert post_chunk(client, identifier, chunks, 1).status_code == 201
+    assert post_chunk(client, identifier, chunks, 2).status_code == 201
+    response = post_chunk(client, identifier, chunks, 3)
+    assert response.status_code == 201
+    assert client.get(f"/api/files/files/{response.get_json()['id']}").data == b'AAAABBBBCCCC'
+
+
+def test_legacy_file_migration(client, app):
+    """Test that flat files from before the object store move into it while staying downloadable."""
+    from services.migration import migrate_legacy_files
+    folder = app.config['UPLOAD_FOLDER']
+    catalog = app.extensions['catalog']
+    for name, content in (('old-a', b'legacy one'), ('old-b', b'legacy two'), ('old-c', b'legacy one')):
+        (folder / name).write_bytes(content)
+    catalog.import_folder(folder, app.extensions['content_type'].from_file)
+    
+    def migrate(**kwargs):
+        return migrate_legacy_files(catalog, app.extensions['blobs'], folder, 1024, batch_size=1, **kwargs)
+    
+    # Incrementally: migrated and unmigrated files are both served
+    assert migrate(limit=1)['migrated'] == 1
+    assert not os.path.exists(folder / 'old-a')
+    assert client.get('/api/files/files/old-a').data == b'legacy one'
+    assert client.get('/api/files/files/old-b').data == b'legacy two'
+    
+    report = migrate()
+    assert report == {'migrated': 2, 'deduplicated': 1, 'missing': 0, 'bytes': 20}
+    assert not any(os.path.exists(folder / name) for name in ('old-a', 'old-b', 'old-c'))
+    checksum = hashlib.sha256(b'legacy one').hexdigest()
+    assert catalog.get('old-c')['checksum'] == checksum
+    assert os.path.isfile(folder / 'objects' / checksum[:2] / checksum[2:4] / checksum)
+    assert migrate()['migrated'] == 0
+    
+    # Shared content outlives the first of its files to be deleted
+    assert client.delete('/api/files/files/old-a').status_code == 204
+    assert client.get('/api/files/files/old-c').data == b'legacy one'
+    assert client.delete('/api/files/files/old-c').status_code == 204
+    assert not os.path.exists(folder / 'objects' / checksum[:2] / checksum[2:4] / checksum)
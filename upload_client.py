@@ -0,0 +1,314 @@
+"""Parallel chunked upload client for the streaming file server.
+
+Chunks are sent by a pool of worker threads over one requests.Session, so
+every worker reuses a keep-alive connection instead of opening a new one
+per chunk. Each chunk is retried with exponential backoff on its own, and
+the chunk size is picked from the file size and the number of workers, and
+from the throughput measured on earlier uploads of the same client.
+"""
+import os
+import gzip
+import json
+import math
+import time
+import uuid
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+
+DEFAULT_URL = "http://localhost:8080/api/files"
+
+# Bounds for automatic chunk sizing
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+# Once throughput is measured, chunks are sized to take about this long each
+TARGET_CHUNK_SECONDS = 2.0
+
+# Responses worth retrying: rate limiting, server errors and corrupted chunks
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Upload states after which the server does nothing more
+FINAL_STATES = {'complete', 'failed', 'rejected', 'cancelled'}
+
+
+class UploadError(Exception):
+    """Raised when a chunk cannot be uploaded within its retries."""
+
+
+def choose_chunk_size(file_size, workers, throughput=None):
+    """Pick a chunk size that keeps every worker busy without tiny requests.
+
+    Aims for at least eight chunks per worker, so a slow connection near
+    the end does not leave the others idle. Once the throughput of a
+    single chunk request is known (bytes per second), chunks are sized to
+    take about TARGET_CHUNK_SECONDS instead, as long as every worker still
+    gets one. Rounded to a power of two between MIN_CHUNK_SIZE and
+    MAX_CHUNK_SIZE.
+    """
+    target = max(file_size // (workers * 8), 1)
+    if throughput:
+        target = max(min(int(throughput * TARGET_CHUNK_SECONDS), file_size // workers), 1)
+    size = 1 << (target - 1).bit_length()
+    return min(max(size, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+
+
+def parse_ranges(ranges):
+    """Expand a range list such as '1-5,7' into a set of chunk numbers."""
+    numbers = set()
+    for part in filter(None, ranges.split(',')):
+        start, _, end = part.partition('-')
+        numbers.update(range(int(start), int(end or start) + 1))
+    return numbers
+
+
+class UploadState:
+    """The identifier of an unfinished upload, persisted next to the file.
+
+    Identifiers are random rather than derived from the file name and
+    size, so two files that share both never collide on the server. A
+    rerun reuses the identifier to resume, as long as the file has not
+    changed since.
+    """
+
+    def __init__(self, path, identifier, size, mtime):
+        self.path = path
+        self.identifier = identifier
+        self.size = size
+        self.mtime = mtime
+
+    @classmethod
+    def for_file(cls, file_path):
+        """Load the state of an earlier attempt at the same file version, or start a new upload."""
+        stat = os.stat(file_path)
+        path = f"{file_path}.upload"
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if (data['size'], data['mtime']) == (stat.st_size, stat.st_mtime_ns):
+                return cls(path, data['identifier'], stat.st_size, stat.st_mtime_ns)
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        state = cls(path, uuid.uuid4().hex, stat.st_size, stat.st_mtime_ns)
+        state.save()
+        return state
+
+    def save(self):
+        """Persist the state; the file is replaced atomically. Without it, the upload just cannot resume."""
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'identifier': self.identifier, 'size': self.size, 'mtime': self.mtime}, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def remove(self):
+        for path in (self.path, f"{self.path}.tmp"):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class ChunkedUploadClient:
+    """Uploads files through /upload/chunked with several chunks in flight."""
+
+    def __init__(self, base_url=DEFAULT_URL, workers=4, chunk_size=None,
+                 max_retries=5, backoff=0.5, poll_interval=1.0, wait_timeout=60 * 60, session=None,
+                 compress=False):
+        self.base_url = base_url.rstrip('/')
+        self.workers = workers
+        self.chunk_size = chunk_size
+        # Bytes per second of one chunk request, averaged over the chunks sent so far
+        self.throughput = None
+        self._throughput_lock = threading.Lock()
+        # Send each chunk request gzip-compressed (Content-Encoding: gzip)
+        self.compress = compress
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.poll_interval = poll_interval
+        # Longest wait for the server to finish a fully sent upload
+        self.wait_timeout = wait_timeout
+        self.session = session or requests.Session()
+        # One pooled keep-alive connection per worker
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def upload(self, file_path):
+        """Upload a file and return its final upload status (with file_id once complete)."""
+        file_size = os.path.getsize(file_path)
+        file_name = os.path.basename(file_path)
+        state = UploadState.for_file(file_path)
+        identifier = state.identifier
+
+        # A resumed upload keeps the layout the server already has. The flow.js layout
+        # is fixed once an upload starts, so throughput measured now sizes the next one.
+        chunk_size, received, status, reuse = self._resume_state(identifier)
+        if chunk_size is None:
+            chunk_size = self.chunk_size or choose_chunk_size(file_size, self.workers, self.throughput)
+        total_chunks = max(math.ceil(file_size / chunk_size), 1)
+
+        layout = {
+            'flowTotalChunks': total_chunks,
+            'flowChunkSize': chunk_size,
+            'flowTotalSize': file_size,
+            'flowIdentifier': identifier,
+            'flowFilename': file_name
+        }
+
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            if reuse is None:
+                # A new upload: an empty offer registers it and tells whether the server reuses chunks
+                reuse = self._offer_hashes(fd, identifier, layout, [])[1]
+            missing = [n for n in range(1, total_chunks + 1) if n not in received]
+            if reuse and missing and status in (None, 'pending'):
+                # Offer the hashes of the missing chunks so the server can fill in those it already stores
+                received |= self._offer_hashes(fd, identifier, layout, missing)[0]
+                missing = [n for n in missing if n not in received]
+            if not missing and status == 'failed':
+                # Every chunk is stored but the assembly failed or stalled: sending one again retries it
+                missing = [total_chunks]
+            print(f"Uploading {file_name} ({file_size} bytes): {len(missing)} of {total_chunks} chunks "
+                  f"of {chunk_size} bytes with {self.workers} workers")
+
+            lock = threading.Lock()
+            with tqdm(total=file_size, unit='B', unit_scale=True, desc="Total Upload") as pbar:
+                pbar.update(sum(self._chunk_length(n, layout) for n in received))
+
+                def on_sent(length):
+                    with lock:
+                        pbar.update(length)
+
+                # Chunk 1 goes first: the server judges the file type from it
+                if missing and missing[0] == 1:
+                    self._send_chunk(fd, missing.pop(0), layout, on_sent)
+
+                with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                    futures = [pool.submit(self._send_chunk, fd, n, layout, on_sent) for n in missing]
+                    for future in as_completed(futures):
+                        future.result()
+        finally:
+            os.close(fd)
+
+        status = self._wait_for_file(identifier)
+        if status.get('status') in ('complete', 'rejected', 'cancelled'):
+            # The identifier is used up: another attempt starts a new upload
+            state.remove()
+        return status
+
+    def _resume_state(self, identifier):
+        """Chunk size, received chunks, state and chunk reuse of an upload the server already knows."""
+        response = self.session.get(f"{self.base_url}/upload/{identifier}/chunks")
+        if response.status_code != 200:
+            return None, set(), None, None
+        info = response.json()
+        return info['chunk_size'], parse_ranges(info['received']), info['status'], info.get('chunk_reuse')
+
+    def _offer_hashes(self, fd, identifier, layout, numbers):
+        """Offer the SHA-256 of the given chunks; returns the received chunks and whether the server reuses chunks."""
+        offer = {
+            'filename': layout['flowFilename'],
+            'total_chunks': layout['flowTotalChunks'],
+            'chunk_size': layout['flowChunkSize'],
+            'total_size': layout['flowTotalSize'],
+            'hashes': {str(n): hashlib.sha256(self._read_chunk(fd, n, layout)).hexdigest() for n in numbers}
+        }
+        response = self.session.post(f"{self.base_url}/upload/{identifier}/chunks", json=offer)
+        if response.status_code != 200:
+            return set(), False
+        info = response.json()
+        return parse_ranges(info['received']), bool(info.get('chunk_reuse'))
+
+    @staticmethod
+    def _chunk_length(chunk_number, layout):
+        if chunk_number < layout['flowTotalChunks']:
+            return layout['flowChunkSize']
+        return layout['flowTotalSize'] - (layout['flowTotalChunks'] - 1) * layout['flowChunkSize']
+
+    def _read_chunk(self, fd, chunk_number, layout):
+        """Read a chunk with pread, so workers can share one file descriptor."""
+        return os.pread(fd, self._chunk_length(chunk_number, layout),
+                        (chunk_number - 1) * layout['flowChunkSize'])
+
+    def _send_chunk(self, fd, chunk_number, layout, on_sent):
+        """Upload one chunk, retrying with exponential backoff and jitter."""
+        data = self._read_chunk(fd, chunk_number, layout)
+        params = dict(layout, flowChunkNumber=chunk_number,
+                      flowChunkChecksum=hashlib.sha256(data).hexdigest())
+        url = f"{self.base_url}/upload/chunked"
+        # flowIdentifier in the query lets the server refuse a rejected upload without reading the body
+        request = self.session.prepare_request(requests.Request(
+            'POST', url, params={'flowIdentifier': layout['flowIdentifier']},
+            data=params, files={'file': ('blob', data)}))
+        if self.compress:
+            # The server decodes the body before parsing it; the checksum covers the raw chunk
+            request.body = gzip.compress(request.body, compresslevel=6)
+            request.headers['Content-Encoding'] = 'gzip'
+            request.headers['Content-Length'] = str(len(request.body))
+        settings = self.session.merge_environment_settings(url, {}, None, None, None)
+
+        for attempt in range(self.max_retries + 1):
+            delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+            started = time.monotonic()
+            try:
+                response = self.session.send(request, **settings)
+            except requests.ConnectionError as e:
+                error = str(e)
+            else:
+                if response.status_code in (200, 201, 202):
+                    if response.status_code == 201:
+                        # Stored by this request; duplicates and 202s do not reflect the transfer
+                        self._measure(len(data), time.monotonic() - started)
+                    on_sent(len(data))
+                    return response
+                error = f"{response.status_code} {response.text.strip()}"
+                if response.status_code == 409 and self._is_stored(layout['flowIdentifier']):
+                    # An earlier attempt completed the upload but its response was lost
+                    on_sent(len(data))
+                    return response
+                retryable = (response.status_code in RETRY_STATUSES or
+                             (response.status_code == 400 and 'checksum mismatch' in response.text))
+                if not retryable:
+                    break
+                if response.headers.get('Retry-After', '').isdigit():
+                    delay = int(response.headers['Retry-After'])
+            if attempt < self.max_retries:
+                time.sleep(delay)
+
+        raise UploadError(f"Chunk {chunk_number} failed: {error}")
+
+    def _is_stored(self, identifier):
+        """Whether the server has already stored the upload."""
+        response = self.session.get(f"{self.base_url}/upload/{identifier}/status")
+        return response.status_code == 200 and response.json().get('status') == 'complete'
+
+    def _measure(self, length, elapsed):
+        """Fold the throughput of a stored chunk into the running average."""
+        if elapsed <= 0:
+            return
+        with self._throughput_lock:
+            rate = length / elapsed
+            self.throughput = rate if self.throughput is None else 0.7 * self.throughput + 0.3 * rate
+
+    def _wait_for_file(self, identifier):
+        """Poll the upload status until the server is done with it, for at most wait_timeout seconds."""
+        status_url = f"{self.base_url}/upload/{identifier}/status"
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            response = self.session.get(status_url)
+            if response.status_code == 404:
+                raise UploadError(f"Upload {identifier} is unknown to the server; it may have expired")
+            if response.status_code == 200:
+                status = response.json()
+                if status.get('status') in FINAL_STATES:
+                    return status
+                state = status.get('status')
+            else:
+                state = f"unavailable ({response.status_code})"
+            if time.monotonic() >= deadline:
+                raise UploadError(f"Upload {identifier} still {state} after {self.wait_timeout}s")
+            time.sleep(self.poll_interval)